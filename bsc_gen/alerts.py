@@ -0,0 +1,146 @@
+"""
+Threshold alerts: entries whose attainment fell below their alert_threshold.
+
+Attainment is actual / target, mirrored for the measures of lower-is-better
+threshold policies (see thresholds.py), so an entry that beats a
+lower-is-better target is not reported and one that misses it is.
+
+Each run only looks at rows whose ``updated_at`` is past the high-water mark
+stored per perspective table in AlertScanState, which is a range scan on the
+``updated_at`` index however large the tables get. The window starts
+BSC_ALERT_SCAN_OVERLAP seconds before the mark so that rows committed late by
+long transactions aren't missed; an entry is only reported again once it has
+been changed after its ``last_alert_sent``.
+
+Alerts are grouped into one email per owner per organization. The owner text
+is matched against the organization's users (username, email or full name);
+owners without an account are reported to the organization's admins.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import PERSPECTIVE_MODELS, AlertScanState, Organization, UserProfile
+from .thresholds import attainment_expression, lower_filter_all
+
+
+ALERT_FIELDS = ('pk', 'organization_id', 'owner', 'objective', 'measure', 'target', 'actual', 'alert_threshold', 'batch_id', 'batch_name')
+UPDATE_CHUNK = 1000
+
+
+def breached_entries(model, since, until, lower=None):
+    """
+    Entries changed in (since, until] that are below their threshold and not yet alerted for that change.
+    ``lower`` matches the lower-is-better entries (see thresholds.lower_filter_all).
+    """
+    queryset = model.objects.filter(updated_at__lte=until).exclude(organization=None)
+    if since is not None:
+        queryset = queryset.filter(updated_at__gt=since)
+    return (
+        queryset
+        .filter(target_value__isnull=False, actual_value__isnull=False)
+        .exclude(target_value=0)
+        .filter(Q(last_alert_sent__isnull=True) | Q(last_alert_sent__lt=F('updated_at')))
+        .annotate(ratio=attainment_expression(lower))
+        .filter(ratio__lt=Cast('alert_threshold', FloatField()))
+        .values_list(*ALERT_FIELDS, 'ratio')
+    )
+
+
+def owner_directory(organization_ids):
+    """organization id -> ({lower-cased username/email/full name: email}, [admin emails])"""
+    directory = defaultdict(lambda: ({}, []))
+    profiles = UserProfile.objects.filter(organization_id__in=organization_ids).select_related('user')
+    for profile in profiles:
+        user = profile.user
+        if not user.email:
+            continue
+        names, admins = directory[profile.organization_id]
+        for name in (user.username, user.email, user.get_full_name()):
+            if name:
+                names[name.strip().lower()] = user.email
+        if profile.role == 'admin':
+            admins.append(user.email)
+    return directory
+
+
+def build_messages(alerts):
+    """One (subject, body, from, recipients) tuple per owner and organization"""
+    grouped = defaultdict(list)
+    for alert in alerts:
+        grouped[(alert['organization_id'], alert['owner'] or '')].append(alert)
+
+    organizations = dict(Organization.objects.filter(pk__in={key[0] for key in grouped}).values_list('pk', 'name'))
+    directory = owner_directory(organizations)
+    messages = []
+    for (organization_id, owner), owner_alerts in sorted(grouped.items()):
+        names, admins = directory[organization_id]
+        owner_email = names.get(owner.strip().lower())
+        recipients = [owner_email] if owner_email else admins
+        if not recipients:
+            continue
+        lines = [
+            f"- [{a['perspective']}] {a['objective']} / {a['measure']}: actual {a['actual']} vs target {a['target']} "
+            f"({a['ratio']:.0%}, alert below {float(a['alert_threshold']):.0%}) in {a['batch_name'] or 'Batch ' + str(a['batch_id'])}"
+            for a in owner_alerts
+        ]
+        subject = f"[{organizations.get(organization_id, 'BSC')}] {len(owner_alerts)} measure(s) below threshold" + (f" for {owner}" if owner else '')
+        body = (
+            f"Hello{' ' + owner if owner else ''},\n\n"
+            "The following BSC measures fell below their alert threshold:\n\n"
+            + "\n".join(lines)
+            + "\n\nBest regards,\nBSC Generator Team\n"
+        )
+        messages.append((subject, body, settings.DEFAULT_FROM_EMAIL, recipients))
+    return messages
+
+
+def scan(full=False, dry_run=False, now=None):
+    """
+    Run one scan over all perspective tables; returns a summary dict.
+
+    ``full`` ignores the high-water marks. With ``dry_run`` nothing is sent or
+    stored and the alerts are returned in the summary.
+    """
+    now = now or timezone.now()
+    overlap = datetime.timedelta(seconds=getattr(settings, 'BSC_ALERT_SCAN_OVERLAP', 60))
+    states = {state.table: state for state in AlertScanState.objects.filter(table__in=[m.__name__ for m in PERSPECTIVE_MODELS.values()])}
+
+    alerts = []
+    alerted_pks = defaultdict(list)
+    lower = lower_filter_all()
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        state = states.get(model.__name__)
+        since = None if full or state is None or state.high_water is None else state.high_water - overlap
+        for row in breached_entries(model, since, now, lower).iterator(chunk_size=2000):
+            alert = dict(zip(ALERT_FIELDS + ('ratio',), row))
+            alert['perspective'] = perspective
+            alerts.append(alert)
+            alerted_pks[model].append(alert['pk'])
+
+    summary = {'alerts': len(alerts), 'emails': 0, 'scanned_until': now}
+    if dry_run:
+        summary['details'] = alerts
+        summary['emails'] = len(build_messages(alerts)) if alerts else 0
+        return summary
+
+    messages = build_messages(alerts) if alerts else []
+    # Sent before anything is marked: if sending fails the next run retries the same alerts
+    if messages:
+        send_mass_mail(messages, fail_silently=False)
+    summary['emails'] = len(messages)
+
+    with transaction.atomic():
+        for model, pks in alerted_pks.items():
+            for start in range(0, len(pks), UPDATE_CHUNK):
+                # update() leaves updated_at alone, so marking doesn't re-trigger the scan
+                model.objects.filter(pk__in=pks[start:start + UPDATE_CHUNK]).update(last_alert_sent=now)
+        for model in PERSPECTIVE_MODELS.values():
+            AlertScanState.objects.update_or_create(table=model.__name__, defaults={'high_water': now})
+    return summary
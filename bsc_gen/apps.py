@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class BscGenConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'bsc_gen'
+
+    def ready(self):
+        from . import signals  # noqa: F401
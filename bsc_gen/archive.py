@@ -0,0 +1,237 @@
+"""
+Cold storage for old batches.
+
+A batch whose entries haven't changed for BSC_ARCHIVE_AFTER_DAYS days can be
+moved out of the four perspective tables into a zstd-compressed Parquet file,
+one per batch, under BSC_ARCHIVE_DIR/<organization id>/. An ArchivedBatch
+row keeps its name, dates and entry counts. Batches with entries linked to
+action plans are left alone, since those links can't be archived.
+
+Reads that name a batch find archived ones too, straight from the file:
+batch status counts, the PDF report, the Excel export of a batch, and
+bsc_data_api with ``include_archived`` (see rows.py). Statuses are classified
+on read under the organization's current threshold policies. The explorer,
+search, trends and scores only cover the tables. restore_batch() moves a
+batch back, writing rows the way bsc_import does.
+"""
+import datetime
+import os
+import tempfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import dimensions, rollup
+from .importer import TableWriter, resolve_refs
+from .models import PERSPECTIVE_MODELS, ArchivedBatch, StrategyMap
+
+
+# Rebuilt on restore
+SKIPPED_FIELDS = {'organization_id', 'objective_ref_id', 'measure_ref_id', 'owner_ref_id'}
+COMPRESSION = 'zstd'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_dir():
+    return Path(getattr(settings, 'BSC_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+
+def retention_days():
+    return getattr(settings, 'BSC_ARCHIVE_AFTER_DAYS', 365)
+
+
+def archived_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and field.attname not in SKIPPED_FIELDS
+    ]
+
+
+def file_path(stub):
+    return archive_dir() / stub.file_name
+
+
+def planned_batches(organization):
+    """Batch ids with entries linked to action plans"""
+    batch_ids = set()
+    for model in PERSPECTIVE_MODELS.values():
+        entry = model._meta.model_name
+        batch_ids.update(
+            model.action_plans.through.objects.filter(**{f'{entry}__organization': organization})
+            .values_list(f'{entry}__batch_id', flat=True).distinct()
+        )
+    return batch_ids
+
+
+def stale_batches(organization, days=None):
+    """Batch ids of ``organization`` not changed for ``days`` (default BSC_ARCHIVE_AFTER_DAYS) that can be archived"""
+    cutoff = timezone.now() - datetime.timedelta(days=retention_days() if days is None else days)
+    last_change = {}
+    for model in PERSPECTIVE_MODELS.values():
+        for batch_id, updated in (
+            model.objects.filter(organization=organization).exclude(batch_id=None)
+            .values('batch_id').annotate(updated=Max('updated_at')).values_list('batch_id', 'updated').order_by()
+        ):
+            last_change[batch_id] = max(updated, last_change.get(batch_id, updated))
+    planned = planned_batches(organization)
+    return sorted(batch_id for batch_id, updated in last_change.items() if updated < cutoff and batch_id not in planned)
+
+
+def batch_table(organization, batch_id):
+    """The batch's entries as one Arrow table with a ``perspective`` column, and {perspective: entries}"""
+    tables = []
+    counts = {}
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        fields = archived_fields(model)
+        # Locked until the rows are deleted, so that no edit in between is lost
+        rows = list(
+            model.objects.select_for_update().filter(organization=organization, batch_id=batch_id)
+            .order_by('pk').values_list(*[field.attname for field in fields])
+        )
+        counts[perspective] = len(rows)
+        if not rows:
+            continue
+        columns = {'perspective': [perspective] * len(rows)}
+        for field, values in zip(fields, zip(*rows)):
+            if isinstance(field, models.DecimalField):
+                values = [None if value is None else float(value) for value in values]
+            columns[field.attname] = list(values)
+        tables.append(pa.table(columns))
+    if not tables:
+        return None, counts
+    # Perspectives have some columns of their own; the others are null there
+    return pa.concat_tables(tables, promote_options='default'), counts
+
+
+def archive_batch(organization, batch_id):
+    """Move one batch into its archive file; returns the ArchivedBatch, or None when the batch has no entries"""
+    if ArchivedBatch.objects.filter(organization=organization, batch_id=batch_id).exists():
+        raise ArchiveError(f'Batch {batch_id} is already archived')
+    file_name = f'{organization.pk}/batch_{batch_id}.parquet'
+    path = archive_dir() / file_name
+    try:
+        with transaction.atomic():
+            table, counts = batch_table(organization, batch_id)
+            if table is None:
+                return None
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside and renamed, so a file at ``path`` is always complete
+            fd, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            os.close(fd)
+            try:
+                pq.write_table(table, temporary, compression=COMPRESSION)
+                os.replace(temporary, path)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+            stub = ArchivedBatch.objects.create(
+                organization=organization,
+                batch_id=batch_id,
+                batch_name=next((name for name in table.column('batch_name').to_pylist() if name), None),
+                upload_time=pc.min(table.column('upload_time')).as_py(),
+                last_updated=pc.max(table.column('updated_at')).as_py(),
+                entries=table.num_rows,
+                perspectives=counts,
+                file_name=file_name,
+                file_size=path.stat().st_size,
+            )
+            for model in PERSPECTIVE_MODELS.values():
+                model.objects.filter(organization=organization, batch_id=batch_id).delete()
+            rollup.forget_batch(organization, batch_id)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    return stub
+
+
+def read_batch(stub, columns, perspective=None):
+    """{perspective: {column: values}} of an archived batch, perspectives in the usual order"""
+    try:
+        table = pq.read_table(
+            file_path(stub), columns=['perspective', *columns],
+            filters=[('perspective', '=', perspective)] if perspective else None,
+        )
+    except FileNotFoundError:
+        raise ArchiveError(f'Archive file of batch {stub.batch_id} is missing: {stub.file_name}')
+    result = {}
+    for name in PERSPECTIVE_MODELS:
+        part = table.filter(pc.equal(table.column('perspective'), name))
+        if part.num_rows:
+            result[name] = part.select(columns).to_pydict()
+    return result
+
+
+def db_values(field, values):
+    """File values of ``field`` in the form TableWriter inserts"""
+    if isinstance(field, (models.DateTimeField, models.DateField)):
+        # Both adapt datetime.date/datetime to what the backend stores
+        return [field.get_db_prep_save(value, connection) for value in values]
+    return values
+
+
+def restore_batch(organization, batch_id):
+    """Move an archived batch back into the perspective tables; returns the number of entries, None if not archived"""
+    with transaction.atomic():
+        stub = ArchivedBatch.objects.select_for_update().filter(organization=organization, batch_id=batch_id).first()
+        if stub is None:
+            return None
+        path = file_path(stub)
+        if not path.exists():
+            raise ArchiveError(f'Archive file of batch {batch_id} is missing: {stub.file_name}')
+        table = pq.read_table(path)
+        dimension_cache = dimensions.DimensionCache(organization.pk) if dimensions.enabled() else None
+        strategy_maps = None
+        for perspective, model in PERSPECTIVE_MODELS.items():
+            part = table.filter(pc.equal(table.column('perspective'), perspective))
+            if not part.num_rows:
+                continue
+            values = {
+                field.attname: db_values(field, part.column(field.attname).to_pylist())
+                for field in archived_fields(model) if field.attname in part.column_names
+            }
+            values['organization_id'] = organization.pk
+            values['batch_name'] = stub.batch_name
+            if any(values.get('strategy_map_id') or ()):
+                # Maps deleted since archiving are dropped, as SET_NULL would have done
+                if strategy_maps is None:
+                    strategy_maps = set(StrategyMap.objects.filter(organization=organization).values_list('pk', flat=True))
+                values['strategy_map_id'] = [pk if pk in strategy_maps else None for pk in values['strategy_map_id']]
+            if dimension_cache is not None:
+                resolve_refs(values, dimension_cache)
+            TableWriter(model).write(values, part.num_rows)
+        stub.delete()
+        # Also classifies the entries under the current threshold policies
+        rollup.recompute(organization, batch_id)
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
+    return table.num_rows
+
+
+def forget(stubs):
+    """Delete archived batches and, once committed, their files; returns the number of entries"""
+    stubs = list(stubs)
+    paths = [file_path(stub) for stub in stubs]
+    ArchivedBatch.objects.filter(pk__in=[stub.pk for stub in stubs]).delete()
+
+    def remove():
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    transaction.on_commit(remove)
+    return sum(stub.entries for stub in stubs)
+
+
+def forget_batch(organization, batch_id):
+    return forget(ArchivedBatch.objects.filter(organization=organization, batch_id=batch_id))
+
+
+def forget_organization(organization):
+    return forget(ArchivedBatch.objects.filter(organization=organization))
@@ -0,0 +1,140 @@
+"""
+Async versions of the read-only APIs for ASGI deployments (see bsc_gen/asgi.py).
+
+Under ASGI the sync views each hold a thread-pool slot for the whole request;
+these run on the event loop and only hop to Django's DB thread for the
+queries themselves. The per-perspective queries are issued together with
+asyncio.gather. Archived batches are read from their files in a worker thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Max, Min
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .decorators import employee_required, replica_reads
+from .models import PERSPECTIVE_MODELS, ArchivedBatch
+from .rows import iter_archived, row_dict, status_counts
+
+
+async def _perspective_entries(perspective, model, organization):
+    entries = []
+    async for e in model.objects.filter(organization=organization).values(
+        'objective', 'measure', 'target', 'actual', 'owner', 'date', 'status',
+    ).aiterator(chunk_size=2000):
+        entries.append({
+            'perspective': perspective,
+            'objective': e['objective'],
+            'measure': e['measure'],
+            'target': e['target'],
+            'actual': e['actual'],
+            'owner': e['owner'],
+            'date': e['date'].strftime('%Y-%m-%d') if e['date'] else '',
+            'status': e['status'],
+        })
+    return entries
+
+
+@login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
+async def bsc_data_api_async(request):
+    """Same response as bsc_data_api"""
+    results = await asyncio.gather(*(
+        _perspective_entries(perspective, model, request.bsc_org)
+        for perspective, model in PERSPECTIVE_MODELS.items()
+    ))
+    entries = [entry for perspective_entries in results for entry in perspective_entries]
+    if request.GET.get('include_archived') == '1':
+        entries.extend(await sync_to_async(_archived_entries)(request.bsc_org))
+    return JsonResponse({'entries': entries})
+
+
+def _archived_entries(organization):
+    return [row_dict(row) for _, _, _, row in iter_archived(organization)]
+
+
+async def _status_counts(model, organization, batch_id):
+    counts = {'blue': 0, 'good': 0, 'moderate': 0, 'bad': 0, 'unknown': 0}
+    # values() rather than values_list(): ValuesListIterable runs the query eagerly, which aiterator can't wrap
+    async for e in model.objects.filter(
+        organization=organization, batch_id=batch_id,
+    ).values('status').aiterator(chunk_size=2000):
+        counts[e['status']] += 1
+    return counts
+
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
+async def batch_details_api_async(request):
+    """Same response as batch_details_api"""
+    batch_id = request.GET.get('batch_id')
+    if not batch_id:
+        return JsonResponse({'error': 'batch_id is required'}, status=400)
+    if await ArchivedBatch.objects.filter(organization=request.bsc_org, batch_id=batch_id).aexists():
+        return JsonResponse({'perspective_data': await sync_to_async(status_counts)(request.bsc_org, batch_id)})
+
+    results = await asyncio.gather(*(
+        _status_counts(model, request.bsc_org, batch_id)
+        for model in PERSPECTIVE_MODELS.values()
+    ))
+    return JsonResponse({'perspective_data': dict(zip(PERSPECTIVE_MODELS, results))})
+
+
+async def _batch_rows(model, organization):
+    return [
+        row async for row in model.objects.filter(organization=organization).exclude(batch_id=None)
+        .values('batch_id').annotate(entries=Count('id'), uploaded=Min('upload_time'), batch_name=Max('batch_name'))
+        .order_by()
+    ]
+
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
+async def batch_list_api_async(request):
+    """The organization's batches, newest first, with entry counts per perspective"""
+    organization = request.bsc_org
+    per_model, totals = await asyncio.gather(
+        asyncio.gather(*(_batch_rows(model, organization) for model in PERSPECTIVE_MODELS.values())),
+        asyncio.gather(*(model.objects.filter(organization=organization).acount() for model in PERSPECTIVE_MODELS.values())),
+    )
+
+    batches = {}
+    for perspective, rows in zip(PERSPECTIVE_MODELS, per_model):
+        for row in rows:
+            batch = batches.setdefault(row['batch_id'], {
+                'batch_id': row['batch_id'],
+                'batch_name': None,
+                'upload_time': None,
+                'entries': 0,
+                'perspectives': {p: 0 for p in PERSPECTIVE_MODELS},
+                'archived': False,
+            })
+            batch['batch_name'] = batch['batch_name'] or row['batch_name']
+            if row['uploaded'] and (batch['upload_time'] is None or row['uploaded'] < batch['upload_time']):
+                batch['upload_time'] = row['uploaded']
+            batch['entries'] += row['entries']
+            batch['perspectives'][perspective] = row['entries']
+    async for stub in ArchivedBatch.objects.filter(organization=organization):
+        batches[stub.batch_id] = {
+            'batch_id': stub.batch_id,
+            'batch_name': stub.batch_name,
+            'upload_time': stub.upload_time,
+            'entries': stub.entries,
+            'perspectives': {p: stub.perspectives.get(p, 0) for p in PERSPECTIVE_MODELS},
+            'archived': True,
+        }
+
+    result = []
+    for batch_id in sorted(batches, reverse=True):
+        batch = batches[batch_id]
+        batch['batch_name'] = batch['batch_name'] or f'Batch {batch_id}'
+        batch['upload_time'] = batch['upload_time'].isoformat() if batch['upload_time'] else None
+        result.append(batch)
+    return JsonResponse({'batches': result, 'total_entries': sum(totals)})
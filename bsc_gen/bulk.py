@@ -0,0 +1,176 @@
+"""
+Bulk uploads: several CSV/Excel files, or ZIP archives of them, in one request.
+
+Parsing with pandas/openpyxl is CPU-bound, so the files are read in a pool of
+worker processes (BSC_UPLOAD_WORKERS, default one per core) shared by the
+requests of this process. Only the DataFrames come back; the database writes
+stay in the request's process, one bulk-inserted batch after another, so
+workers never touch the database.
+"""
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import PurePosixPath
+
+import django
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from . import dedup
+from .ingest import ALLOWED_EXTENSIONS, UploadError, ingest_dataframe, known_rows, read_dataframe
+from .uploads import upload_limits
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count():
+    return getattr(settings, 'BSC_UPLOAD_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # django.setup() so that the workers can import bsc_gen whatever the start method
+            _pool = ProcessPoolExecutor(max_workers=worker_count(), initializer=django.setup)
+        return _pool
+
+
+def reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def parse_file(name, content):
+    """(DataFrame, None) or (None, error message) for one file; runs in a worker process"""
+    try:
+        return read_dataframe(io.BytesIO(content), name), None
+    except UploadError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f'Error processing file: {e}'
+
+
+def expand_files(uploaded_files):
+    """[(name, bytes)] of the uploaded files, with ZIP archives replaced by the CSV/Excel files they contain"""
+    max_files = getattr(settings, 'BSC_BULK_UPLOAD_MAX_FILES', 50)
+    max_bytes = getattr(settings, 'BSC_BULK_UPLOAD_MAX_BYTES', 200 * 1024 * 1024)
+    files = []
+    total = 0
+
+    def add(name, size, read):
+        nonlocal total
+        total += size
+        if len(files) >= max_files:
+            raise UploadError(f'Too many files, at most {max_files} per upload.')
+        if total > max_bytes:
+            raise UploadError(f'Upload too large, at most {max_bytes // (1024 * 1024)} MB uncompressed.')
+        files.append((name, read()))
+
+    for uploaded in uploaded_files:
+        if not uploaded.name.lower().endswith('.zip'):
+            add(uploaded.name, uploaded.size, uploaded.read)
+            continue
+        try:
+            with zipfile.ZipFile(uploaded) as archive:
+                for info in archive.infolist():
+                    path = PurePosixPath(info.filename)
+                    if info.is_dir() or path.name.startswith('.') or '__MACOSX' in path.parts:
+                        continue
+                    if not path.name.lower().endswith(ALLOWED_EXTENSIONS):
+                        continue
+                    # file_size is the declared uncompressed size, checked before decompressing anything
+                    add(f'{uploaded.name}/{info.filename}', info.file_size, lambda info=info: archive.read(info))
+        except zipfile.BadZipFile:
+            raise UploadError(f'{uploaded.name} is not a valid ZIP archive.')
+    return files
+
+
+def parse_files(files):
+    """[(name, DataFrame or None, error or None)] in upload order, parsed in parallel when there are several"""
+    if len(files) < 2 or worker_count() < 2:
+        return [(name, *parse_file(name, content)) for name, content in files]
+    try:
+        futures = [get_pool().submit(parse_file, name, content) for name, content in files]
+        return [(name, *future.result()) for (name, _), future in zip(files, futures)]
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool for the next upload
+        reset_pool()
+        raise UploadError('The file parser crashed, please try again with fewer or smaller files.')
+
+
+def bulk_ingest(uploaded_files, organization, merge=False):
+    """
+    Parse the files in parallel, then store them one after another.
+
+    Each file becomes its own batch, named after the file, or with ``merge``
+    all files go into one new batch. Files already in the upload ledger are
+    not stored again (``duplicate`` with the existing batch_id; the bytes of
+    a known file aren't even parsed). Returns a status dict per file.
+    """
+    files = expand_files(uploaded_files)
+    if not files:
+        raise UploadError('No CSV or Excel files found in the upload.')
+    results = []
+    pending = []
+    for name, content in files:
+        file_hash = dedup.bytes_digest(content)
+        duplicate = dedup.find_duplicate(organization, file_hash=file_hash)
+        if duplicate is not None:
+            results.append({'file': name, 'success': True, 'rows': duplicate.rows, 'batch_id': duplicate.batch_id, 'duplicate': True})
+            continue
+        result = {'file': name, 'success': True, 'rows': None, 'batch_id': None, 'duplicate': False}
+        results.append(result)
+        pending.append((result, file_hash, (name, content)))
+
+    parsed = []
+    _, max_rows = upload_limits(organization)
+    for (result, file_hash, _), (_, df, error) in zip(pending, parse_files([file for _, _, file in pending])):
+        if error is None and len(df) > max_rows:
+            # Members of ZIP archives can only be counted once unpacked
+            error = f'More than {max_rows} rows.'
+        if error:
+            result.update(success=False, error=error)
+            continue
+        result['rows'] = len(df)
+        parsed.append((result, file_hash, df))
+
+    if merge:
+        with transaction.atomic():
+            dedup.lock(organization)
+            new = []
+            for result, file_hash, df in parsed:
+                if not known_rows(df):
+                    # Not recorded: its ledger row would point at a batch holding none of its rows
+                    result.update(success=False, error='No rows with a known perspective')
+                    continue
+                content_hash = dedup.content_digest(df)
+                duplicate = dedup.find_duplicate(organization, content_hash=content_hash)
+                if duplicate is not None:
+                    result.update(batch_id=duplicate.batch_id, duplicate=True)
+                else:
+                    new.append((result, file_hash, content_hash, df))
+            if new:
+                batch_id = ingest_dataframe(pd.concat([df for *_, df in new], ignore_index=True), organization)
+                for result, file_hash, content_hash, df in new:
+                    dedup.record(organization, batch_id, result['file'], file_hash, content_hash, len(df))
+                    result['batch_id'] = batch_id
+        return results
+    for result, file_hash, df in parsed:
+        try:
+            result['batch_id'], created = dedup.ingest_once(
+                df, organization, result['file'], file_hash, batch_name=PurePosixPath(result['file']).stem,
+            )
+            result['duplicate'] = not created
+        except Exception as e:
+            result.update(success=False, error=f'Error storing file: {e}')
+    return results
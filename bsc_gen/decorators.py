@@ -0,0 +1,78 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from .routers import SAFE_METHODS, is_pinned, reading_from_replica
+
+
+def role_required(*roles, message=None, redirect_to='dashboard', json_error=None, status=403):
+    """
+    Only let users whose ``request.bsc_role`` is one of ``roles`` through.
+
+    Everyone else gets either a JSON error (when ``json_error`` is given) or a
+    redirect to ``redirect_to`` with ``message`` flashed. Relies on
+    OrganizationMiddleware. Works for both sync and async views.
+    """
+    def denied(request):
+        if json_error:
+            return JsonResponse({'error': json_error}, status=status)
+        if message:
+            messages.error(request, message)
+        return redirect(redirect_to)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                if getattr(request, 'bsc_role', None) in roles:
+                    return await view_func(request, *args, **kwargs)
+                return denied(request)
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                if getattr(request, 'bsc_role', None) in roles:
+                    return view_func(request, *args, **kwargs)
+                return denied(request)
+        return _wrapped_view
+    return decorator
+
+
+def admin_required(**kwargs):
+    """Organization admins only"""
+    return role_required('admin', **kwargs)
+
+
+def employee_required(**kwargs):
+    """Any member of an organization - employees and admins"""
+    return role_required('admin', 'employee', **kwargs)
+
+
+def replica_reads(view_func):
+    """
+    Serve the view's reads from a read replica (see routers.py).
+
+    Only GET/HEAD requests from clients that aren't pinned to the primary after
+    a recent write are routed; everything else reads from the primary. Works
+    for both sync and async views.
+    """
+    def use_replica(request):
+        return request.method in SAFE_METHODS and not is_pinned(request)
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if not use_replica(request):
+                return await view_func(request, *args, **kwargs)
+            with reading_from_replica():
+                return await view_func(request, *args, **kwargs)
+    else:
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not use_replica(request):
+                return view_func(request, *args, **kwargs)
+            with reading_from_replica():
+                return view_func(request, *args, **kwargs)
+    return _wrapped_view
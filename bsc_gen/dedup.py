@@ -0,0 +1,133 @@
+"""
+Idempotent uploads through a per-organization ledger of content hashes.
+
+Every stored upload leaves an UploadLedger row with the SHA-256 of the file's
+bytes and of its normalized rows. A re-upload of the same bytes is answered
+from the ledger before the file is parsed; a file with different bytes but
+the same rows (saved again, converted from Excel to CSV, other column order)
+is caught after parsing, before anything is inserted. Either way the existing
+batch is returned.
+
+Rows are normalized as text per column (perspective lower-cased, cells
+stripped, whole floats without ".0", blanks and NaN as ""), in file order.
+Ledger rows are removed with their batch, so a deleted batch can be uploaded
+again, and when the batch's entries change - an edit (update_batch) or a
+merge (ingest.merge_dataframe) - since the hashes then describe rows the
+batch no longer holds. An edited batch is not re-hashed: the file order and
+bytes it would be hashed in are gone.
+"""
+import hashlib
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Q
+
+from .ingest import ingest_dataframe
+from .models import PERSPECTIVE_MODELS, ArchivedBatch, Organization, UploadLedger
+
+
+# The columns an upload is stored from, see ingest.build_entries
+CONTENT_COLUMNS = ('perspective', 'objective', 'measure', 'target', 'actual', 'owner', 'date', 'weight')
+
+
+def file_digest(uploaded):
+    """SHA-256 of an UploadedFile, read chunk by chunk; the file is rewound for the parser"""
+    digest = hashlib.sha256()
+    for chunk in uploaded.chunks():
+        digest.update(chunk)
+    uploaded.seek(0)
+    return digest.hexdigest()
+
+
+def bytes_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def cell_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value).strip()
+
+
+def content_digest(df):
+    """SHA-256 of the normalized rows of ``df``, fed one row at a time"""
+    columns = []
+    for column in CONTENT_COLUMNS:
+        if column not in df:
+            columns.append([''] * len(df))
+            continue
+        values = df[column].map(cell_text)
+        if column == 'perspective':
+            values = values.str.lower()
+        columns.append(values.tolist())
+    digest = hashlib.sha256()
+    for row in zip(*columns):
+        digest.update(('\x1f'.join(row) + '\x1e').encode())
+    return digest.hexdigest()
+
+
+def batch_exists(organization, batch_id):
+    """Whether the batch has entries, in the tables or archived"""
+    return any(
+        model.objects.filter(organization=organization, batch_id=batch_id).exists()
+        for model in [*PERSPECTIVE_MODELS.values(), ArchivedBatch]
+    )
+
+
+def find_duplicate(organization, file_hash=None, content_hash=None):
+    """The newest ledger row matching either hash whose batch still exists, or None"""
+    match = Q()
+    if file_hash:
+        match |= Q(file_hash=file_hash)
+    if content_hash:
+        match |= Q(content_hash=content_hash)
+    if not match:
+        return None
+    for entry in UploadLedger.objects.filter(organization=organization).filter(match).order_by('-pk'):
+        if batch_exists(organization, entry.batch_id):
+            return entry
+    return None
+
+
+def record(organization, batch_id, file_name, file_hash, content_hash='', rows=0):
+    return UploadLedger.objects.create(
+        organization=organization, batch_id=batch_id, file_name=file_name[:255],
+        file_hash=file_hash, content_hash=content_hash, rows=rows,
+    )
+
+
+def lock(organization):
+    """Serialize check-then-insert per organization (a row lock on PostgreSQL; SQLite serializes writers anyway)"""
+    Organization.objects.select_for_update().filter(pk=organization.pk).first()
+
+
+def ingest_once(df, organization, file_name, file_hash, batch_name=None):
+    """
+    Store ``df`` as a new batch unless the ledger already has its rows; returns (batch_id, created).
+
+    A duplicate's file hash is added to the ledger too, so the next upload
+    of those bytes is answered without parsing.
+    """
+    content_hash = content_digest(df)
+    with transaction.atomic():
+        lock(organization)
+        duplicate = find_duplicate(organization, file_hash=file_hash, content_hash=content_hash)
+        if duplicate is not None:
+            if duplicate.file_hash != file_hash:
+                record(organization, duplicate.batch_id, file_name, file_hash, content_hash, len(df))
+            return duplicate.batch_id, False
+        batch_id = ingest_dataframe(df, organization, batch_name=batch_name)
+        record(organization, batch_id, file_name, file_hash, content_hash, len(df))
+    return batch_id, True
+
+
+def forget_batch(organization, batch_id):
+    UploadLedger.objects.filter(organization=organization, batch_id=batch_id).delete()
+
+
+def forget_organization(organization):
+    UploadLedger.objects.filter(organization=organization).delete()
@@ -0,0 +1,118 @@
+"""
+Dictionary encoding of objective, measure and owner.
+
+Uploads repeat the same few strings batch after batch. With
+BSC_NORMALIZED_DIMENSIONS on (off by default) every entry also points at one
+row per distinct string and organization in the Objective, Measure and Owner
+tables, and the pivot, the explorer's owner filter and the strategy map
+scores filter and group on those integer keys instead of 255-char text (see
+key_column, key_filter and key_names). The text columns stay as they are.
+Entries written while the setting was off have no keys: run
+``manage.py bsc_dimensions --backfill`` when turning it on.
+
+Names are resolved through a DimensionCache that lives for one upload or
+edit: the names it hasn't seen are looked up with one query per dimension,
+missing ones are bulk-inserted, and the result is kept in memory.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Measure, Objective, Owner
+
+
+# entry text field -> (dimension model, entry FK field)
+DIMENSIONS = {
+    'objective': (Objective, 'objective_ref'),
+    'measure': (Measure, 'measure_ref'),
+    'owner': (Owner, 'owner_ref'),
+}
+REF_FIELDS = [ref for _, ref in DIMENSIONS.values()]
+
+
+def enabled():
+    return getattr(settings, 'BSC_NORMALIZED_DIMENSIONS', False)
+
+
+def clean_name(value):
+    if value is None:
+        return None
+    name = str(value).strip()[:255]
+    return name or None
+
+
+def key_column(field):
+    """The column ``field`` (objective, measure or owner) is grouped on: its key when enabled, else the text"""
+    return f'{DIMENSIONS[field][1]}_id' if enabled() else field
+
+
+def key_filter(organization_id, field, value):
+    """Q of the entries whose ``field`` is ``value``, through the dimension key when enabled"""
+    if not enabled():
+        return Q(**{field: value})
+    model, ref = DIMENSIONS[field]
+    name = clean_name(value)
+    if name is None:
+        return Q(pk__in=[])
+    return Q(**{f'{ref}__in': model.objects.filter(organization_id=organization_id, name=name).values('pk')})
+
+
+def key_names(field, values):
+    """{value: name} for values of key_column(field): the names of the keys, or the text itself"""
+    if not enabled():
+        return {value: value for value in values}
+    model, _ = DIMENSIONS[field]
+    keys = [value for value in set(values) if value is not None]
+    names = {None: None}
+    for start in range(0, len(keys), 500):
+        names.update(model.objects.filter(pk__in=keys[start:start + 500]).values_list('pk', 'name'))
+    return names
+
+
+class DimensionCache:
+    """name -> id of one organization's dimension rows, filled in bulk"""
+
+    def __init__(self, organization_id):
+        self.organization_id = organization_id
+        self.ids = {model: {} for model, _ in DIMENSIONS.values()}
+
+    def resolve(self, model, names):
+        """Ids of ``names`` (unseen ones are fetched, then created, in bulk)"""
+        known = self.ids[model]
+        missing = {name for name in names if name is not None and name not in known}
+        if missing:
+            known.update(self.lookup(model, missing))
+            new = missing - known.keys()
+            if new:
+                model.objects.bulk_create(
+                    [model(organization_id=self.organization_id, name=name) for name in new],
+                    batch_size=1000, ignore_conflicts=True,
+                )
+                # ignore_conflicts doesn't give back primary keys on every backend
+                known.update(self.lookup(model, new))
+        return known
+
+    def lookup(self, model, names):
+        names = list(names)
+        found = {}
+        for start in range(0, len(names), 500):
+            found.update(model.objects.filter(
+                organization_id=self.organization_id, name__in=names[start:start + 500],
+            ).values_list('name', 'pk'))
+        return found
+
+    def assign(self, entries):
+        """Set the *_ref_id attributes of unsaved or changed ``entries`` from their text fields"""
+        for field, (model, ref) in DIMENSIONS.items():
+            names = [clean_name(getattr(entry, field)) for entry in entries]
+            ids = self.resolve(model, names)
+            for entry, name in zip(entries, names):
+                setattr(entry, f'{ref}_id', ids.get(name) if name is not None else None)
+
+
+def assign_refs(entries, organization_id, cache=None):
+    """Fill the dimension keys of ``entries`` when normalized dimensions are enabled; returns the cache used"""
+    if not enabled() or organization_id is None or not entries:
+        return cache
+    cache = cache or DimensionCache(organization_id)
+    cache.assign(entries)
+    return cache
@@ -0,0 +1,237 @@
+"""
+In-process pub/sub for per-organization change events, streamed to dashboards over SSE.
+
+Views publish an event after every write (batch added, updated, renamed,
+deleted); every open ``/events/`` stream of the same organization receives it.
+There is no external broker, so events only reach streams served by the same
+process - run the ASGI server with a single worker, or accept that other
+workers' dashboards only catch up on their next event or reload.
+
+Publishing also bumps the organization's data version, which caches of
+derived data (trends, pivots, ...) use as part of their key, and records the
+change in a short log so those caches can catch up on just the batches that
+changed (see ``changes_since``). Both live in the database
+(Organization.data_version and DataChange) and are written in the
+transaction of the change itself, so every worker process and management
+command (bsc_import, bsc_archive) sees the same version, and a rolled-back
+change leaves it alone.
+"""
+import asyncio
+import itertools
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import PERSPECTIVE_MODELS, DataChange, Organization, ScoreRollup
+
+
+SUBSCRIBER_QUEUE_SIZE = 100
+# Changes kept per organization in DataChange
+CHANGE_LOG_SIZE = 200
+# Changes that can touch every batch, after which caches rebuild from scratch
+RESET_EVENTS = {'data_cleared', 'thresholds_changed'}
+
+
+class Subscription:
+    """One open event stream. Thread-safe ``put``, blocking ``get`` for WSGI streams"""
+
+    def __init__(self, organization_id):
+        self.organization_id = organization_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Subscription consumed from an event loop (ASGI streams)"""
+
+    def __init__(self, organization_id):
+        super().__init__(organization_id)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def subscribe(self, organization_id, use_asyncio=False):
+        subscription = (AsyncSubscription if use_asyncio else Subscription)(organization_id)
+        with self.lock:
+            self.subscribers[organization_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers[subscription.organization_id].discard(subscription)
+            if not self.subscribers[subscription.organization_id]:
+                del self.subscribers[subscription.organization_id]
+
+    def publish(self, organization_id, event):
+        event = dict(event, id=next(self.ids))
+        with self.lock:
+            subscribers = list(self.subscribers.get(organization_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+broker = EventBroker()
+
+
+def data_version(organization_id):
+    """Changes whenever the organization's BSC data changes"""
+    return Organization.objects.filter(pk=organization_id).values_list('data_version', flat=True).first() or 0
+
+
+def bump_data_version(organization_id, change=None):
+    """Move to a new data version, logging ``change`` (an event type/batch_id dict) against it"""
+    with transaction.atomic():
+        if not Organization.objects.filter(pk=organization_id).update(data_version=F('data_version') + 1):
+            return None
+        version = data_version(organization_id)
+        if change is not None:
+            DataChange.objects.create(
+                organization_id=organization_id, version=version, type=change['type'], batch_id=change['batch_id'],
+            )
+            DataChange.objects.filter(organization_id=organization_id, version__lte=version - CHANGE_LOG_SIZE).delete()
+    return version
+
+
+def changes_since(organization_id, version):
+    """
+    The changes made after data version ``version``, oldest first.
+
+    Returns None when the log doesn't cover the whole range (only the last
+    CHANGE_LOG_SIZE changes are kept), in which case callers should rebuild
+    from scratch.
+    """
+    current = data_version(organization_id)
+    if version == current:
+        return []
+    if version > current:
+        return None
+    changes = [
+        {'type': change_type, 'batch_id': batch_id}
+        for change_type, batch_id in DataChange.objects.filter(
+            organization_id=organization_id, version__gt=version, version__lte=current,
+        ).order_by('version').values_list('type', 'batch_id')
+    ]
+    if len(changes) != current - version:
+        return None
+    return changes
+
+
+def batch_summary(organization, batch_id):
+    """Entry and status counts of a batch, as sent along with change events"""
+    counts = {'blue': 0, 'good': 0, 'moderate': 0, 'bad': 0, 'unknown': 0}
+    perspectives = {}
+    batch_name = None
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        rows = model.objects.filter(organization=organization, batch_id=batch_id).values_list('status', 'batch_name')
+        perspectives[perspective] = 0
+        for status, name in rows:
+            counts[status] += 1
+            perspectives[perspective] += 1
+            batch_name = batch_name or name
+    return {
+        'batch_name': batch_name or f'Batch {batch_id}',
+        'entries': sum(perspectives.values()),
+        'perspectives': perspectives,
+        'status_counts': counts,
+    }
+
+
+def organization_summary(organization):
+    """Entry and batch counts of the organization, from ScoreRollup rather than the perspective tables"""
+    totals = ScoreRollup.objects.filter(organization=organization, entries__gt=0).aggregate(
+        entries=Sum('entries'), batches=Count('batch_id', distinct=True),
+    )
+    return {'entries': totals['entries'] or 0, 'batches': totals['batches']}
+
+
+def publish_change(organization, event_type, batch_id=None, **extra):
+    """
+    Bump the data version and tell the organization's open dashboards about a change.
+
+    The version is bumped in the surrounding transaction; the event is sent
+    once it commits so that listeners never see data that could still be
+    rolled back.
+    """
+    if organization is None:
+        return
+    bump_data_version(organization.pk, {'type': event_type, 'batch_id': batch_id})
+
+    def send():
+        event = {'type': event_type, 'batch_id': batch_id, **extra}
+        if batch_id is not None and event_type not in ('batch_deleted', 'batch_archived'):
+            event['batch'] = batch_summary(organization, batch_id)
+        event['organization'] = organization_summary(organization)
+        broker.publish(organization.pk, event)
+
+    transaction.on_commit(send)
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def stream_events(organization_id, keepalive=15):
+    """Blocking SSE generator for WSGI servers - holds a worker thread while open"""
+    subscription = broker.subscribe(organization_id)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            event = subscription.get(keepalive)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield 'event: resync\ndata: {}\n\n'
+            yield format_sse(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def astream_events(organization_id, keepalive=15):
+    """SSE generator for ASGI servers - an open stream costs no thread"""
+    subscription = broker.subscribe(organization_id, use_asyncio=True)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            event = await subscription.get(keepalive)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield 'event: resync\ndata: {}\n\n'
+            yield format_sse(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
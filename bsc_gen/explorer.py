@@ -0,0 +1,219 @@
+"""
+Filtered, sorted and keyset-paginated listing of the entries of all four perspectives.
+
+A page costs the same whatever the size of the organization:
+
+* Rows: each perspective table is read along its (organization, sort column,
+  id) index from just after the cursor, one page + 1 rows at most, and the
+  four runs are merged by the database with UNION ALL (in Python on SQLite,
+  which can't limit the parts of a UNION). The cursor is the sort key of the last row
+  shown - (value, id, perspective) - so there is no OFFSET to skip over.
+* Totals and status counts are sums over the ScoreRollup rows of the selected
+  batches and perspectives. Only the owner filter counts entries, along the
+  (organization, owner, id) index - or the owner key's, with normalized
+  dimensions on (see dimensions.py).
+
+Rows with no value in the sort column (owner, actual) come last in both
+directions. Entries without a batch_id are left out, as on the dashboard.
+"""
+import base64
+import binascii
+import json
+
+from django.db import connections
+from django.db.models import Count, Q, Sum, Value
+
+from .dimensions import key_filter
+from .models import PERSPECTIVE_MODELS, STATUSES, ScoreRollup, status_filter
+
+
+# sort name -> (column, nullable)
+SORTS = {
+    'batch': ('batch_id', False),
+    'objective': ('objective', False),
+    'owner': ('owner', True),
+    'actual': ('actual_value', True),
+    'updated': ('updated_at', False),
+}
+DEFAULT_SORT = '-batch'
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+PERSPECTIVES = list(PERSPECTIVE_MODELS)
+COLUMNS = ('id', 'objective', 'measure', 'target', 'actual', 'owner', 'date', 'batch_id', 'batch_name', 'updated_at', 'status')
+
+
+class ExplorerError(ValueError):
+    pass
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk, index = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise ExplorerError('Invalid cursor')
+    if not isinstance(pk, int) or not isinstance(index, int):
+        raise ExplorerError('Invalid cursor')
+    return value, pk, index
+
+
+def parse_sort(sort):
+    sort = sort or DEFAULT_SORT
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in SORTS:
+        raise ExplorerError(f'Unknown sort {name!r}, use one of {", ".join(SORTS)}')
+    return name, descending
+
+
+def pk_after(cursor, index, descending):
+    """Lookup for the ids that sort after the cursor among rows with the cursor's value"""
+    _, pk, cursor_index = cursor
+    # equal (value, id) pairs in different tables are ordered by perspective
+    equal_follows = index < cursor_index if descending else index > cursor_index
+    return {f"pk__{'lt' if descending else 'gt'}{'e' if equal_follows else ''}": pk}
+
+
+def after_cursor(entries, column, cursor, index, descending):
+    """Rows of ``entries`` (perspective ``index``) that sort after ``cursor``"""
+    if cursor is None:
+        return entries
+    value = cursor[0]
+    if value is None:
+        return entries.filter(**pk_after(cursor, index, descending))
+    return entries.filter(
+        Q(**{f"{column}__{'lt' if descending else 'gt'}": value})
+        | Q(**{column: value}, **pk_after(cursor, index, descending))
+    )
+
+
+def merged_page(querysets, order, sort_key, descending, limit):
+    """The first ``limit`` rows of the perspectives' querysets in ``order`` (ending with the perspective)"""
+    parts = [queryset.order_by(*order[:-1])[:limit] for queryset in querysets]
+    if len(parts) == 1:
+        return list(parts[0])
+    if connections[parts[0].db].features.supports_slicing_ordering_in_compound:
+        # each part is read along its own index, the database merges at most 4 * limit rows
+        return list(parts[0].union(*parts[1:], all=True).order_by(*order)[:limit])
+    # SQLite can't limit the parts of a UNION; its BINARY collation orders text the way Python does
+    rows = [row for part in parts for row in part]
+    rows.sort(key=sort_key, reverse=descending)
+    return rows[:limit]
+
+
+def read_page(tables, column, nullable, cursor, descending, limit):
+    """
+    Up to ``limit`` rows after ``cursor``: rows with a value in ``column`` first, then
+    (for nullable columns) the ones without. ``tables`` is [(perspective index, entries)].
+    """
+    direction = '-' if descending else ''
+    rows = []
+    if cursor is None or cursor[0] is not None:
+        rows = merged_page([
+            after_cursor(entries.filter(**{f'{column}__isnull': False}), column, cursor, index, descending)
+            .annotate(perspective_index=Value(index)).values_list(column, *COLUMNS, 'perspective_index')
+            for index, entries in tables
+        ], [f'{direction}{column}', f'{direction}id', f'{direction}perspective_index'],
+            lambda row: (row[0], row[1], row[-1]), descending, limit)
+    if nullable and len(rows) < limit:
+        null_cursor = cursor if cursor is not None and cursor[0] is None else None
+        rows.extend(merged_page([
+            after_cursor(entries.filter(**{f'{column}__isnull': True}), column, null_cursor, index, descending)
+            .annotate(perspective_index=Value(index)).values_list(column, *COLUMNS, 'perspective_index')
+            for index, entries in tables
+        ], [f'{direction}id', f'{direction}perspective_index'],
+            lambda row: (row[1], row[-1]), descending, limit - len(rows)))
+    return rows
+
+
+def filtered_entries(model, organization, batch_id=None, owner=None, status=None):
+    entries = model.objects.filter(organization=organization, batch_id__isnull=False)
+    if batch_id:
+        entries = entries.filter(batch_id=batch_id)
+    if owner:
+        entries = entries.filter(key_filter(organization.pk, 'owner', owner))
+    if status:
+        entries = entries.filter(status_filter(status))
+    return entries
+
+
+def status_counts(organization, perspectives, batch_id=None, owner=None):
+    """{status: entries} over the selected perspectives, from ScoreRollup unless filtering by owner"""
+    if owner:
+        counts = dict.fromkeys(STATUSES, 0)
+        for perspective in perspectives:
+            totals = filtered_entries(PERSPECTIVE_MODELS[perspective], organization, batch_id, owner).aggregate(
+                **{status: Count('id', filter=status_filter(status)) for status in STATUSES}
+            )
+            for status in STATUSES:
+                counts[status] += totals[status]
+        return counts
+    rollups = ScoreRollup.objects.filter(organization=organization, perspective__in=perspectives)
+    if batch_id:
+        rollups = rollups.filter(batch_id=batch_id)
+    totals = rollups.aggregate(**{status: Sum(f'{status}_entries') for status in STATUSES})
+    return {status: totals[status] or 0 for status in STATUSES}
+
+
+def row_dict(row):
+    _, pk, objective, measure, target, actual, owner, date, batch_id, batch_name, updated_at, status, index = row
+    return {
+        'perspective': PERSPECTIVES[index],
+        'id': pk,
+        'objective': objective,
+        'measure': measure,
+        'target': target,
+        'actual': actual,
+        'owner': owner,
+        'date': date,
+        'status': status,
+        'batch_id': batch_id,
+        'batch_name': batch_name or f'Batch {batch_id}',
+        'updated_at': updated_at,
+    }
+
+
+def explore(organization, perspective=None, batch_id=None, owner=None, status=None, sort=None, cursor=None, per_page=PER_PAGE):
+    """One page of entries plus totals; pass the returned ``next_cursor`` back for the following page"""
+    if perspective and perspective not in PERSPECTIVE_MODELS:
+        raise ExplorerError(f'Unknown perspective {perspective!r}')
+    if status and status not in STATUSES:
+        raise ExplorerError(f'Unknown status {status!r}')
+    sort_name, descending = parse_sort(sort)
+    column, nullable = SORTS[sort_name]
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    key = decode_cursor(cursor) if cursor else None
+    perspectives = [perspective] if perspective else PERSPECTIVES
+
+    tables = [
+        (PERSPECTIVES.index(name), filtered_entries(PERSPECTIVE_MODELS[name], organization, batch_id, owner, status))
+        for name in perspectives
+    ]
+    rows = read_page(tables, column, nullable, key, descending, per_page + 1)
+
+    page = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = page[-1]
+        next_cursor = encode_cursor([last[0], last[1], last[-1]])
+
+    counts = status_counts(organization, perspectives, batch_id, owner)
+    return {
+        'entries': [row_dict(row) for row in page],
+        'next_cursor': next_cursor,
+        'total': counts[status] if status else sum(counts.values()),
+        'status_counts': counts,
+        'sort': f"{'-' if descending else ''}{sort_name}",
+        'per_page': per_page,
+    }
+
+
+def organization_batches(organization):
+    """[(batch_id, entries)] newest first, from ScoreRollup"""
+    return list(
+        ScoreRollup.objects.filter(organization=organization).values('batch_id')
+        .annotate(entries=Sum('entries')).order_by('-batch_id').values_list('batch_id', 'entries')
+    )
@@ -0,0 +1,146 @@
+"""
+Excel export of a batch, a date range or a whole organization.
+
+Built with openpyxl's write-only workbook: rows are appended to per-sheet
+temporary files as they are read, so memory stays flat whatever the number
+of entries. Entries come from values_list() iterators, one perspective table
+at a time, into one sheet per perspective, with the status cell colored the
+way the dashboard shows it. A Summary sheet, first in the workbook but
+written last, has the status counts per perspective, gathered on the way.
+An archived batch is exported from its archive file.
+"""
+import datetime
+import tempfile
+
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+from . import archive, thresholds
+from .models import PERSPECTIVE_MODELS, STATUSES, ArchivedBatch
+
+
+CHUNK_SIZE = 5000
+COLUMNS = ('batch_id', 'batch_name', 'objective', 'measure', 'owner', 'target', 'actual', 'target_value', 'actual_value', 'weight', 'date', 'status')
+HEADER = ['Batch', 'Batch Name', 'Objective', 'Measure', 'Owner', 'Target', 'Actual', 'Weight', 'Date', 'Status']
+WIDTHS = [8, 24, 36, 36, 20, 12, 12, 8, 12, 10]
+# Same colors as the PDF report's charts
+STATUS_COLORS = {'blue': '2563EB', 'good': '22C55E', 'moderate': 'FACC15', 'bad': 'EF4444', 'unknown': 'A3A3A3'}
+STATUS_FILLS = {status: PatternFill('solid', start_color=color, end_color=color) for status, color in STATUS_COLORS.items()}
+BOLD = Font(bold=True)
+
+
+def sheet_title(perspective):
+    # Excel forbids []:*?/\ in sheet names
+    return perspective.replace('&', 'and')
+
+
+def entries(model, organization, batch_id=None, date_from=None, date_to=None):
+    queryset = model.objects.filter(organization=organization)
+    if batch_id:
+        queryset = queryset.filter(batch_id=batch_id)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset.order_by('batch_id', 'pk').values_list(*COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def archived_entries(stub, organization, date_from=None, date_to=None):
+    """{perspective: entries()-like rows} of an archived batch, classified under the current policies"""
+    policies = thresholds.Policies(organization)
+    columns = [column for column in COLUMNS if column not in ('batch_id', 'status')]
+    result = {}
+    for perspective, values in archive.read_batch(stub, columns).items():
+        result[perspective] = [
+            (stub.batch_id, stub.batch_name, *row[1:], policies.classify(row[7], row[6], row[2]))
+            for row in zip(*(values[column] for column in columns))
+            if not (date_from and (row[9] is None or row[9] < date_from)) and not (date_to and (row[9] is None or row[9] > date_to))
+        ]
+    return result
+
+
+def styled(sheet, value, **style):
+    cell = WriteOnlyCell(sheet, value=value)
+    for name, style_value in style.items():
+        setattr(cell, name, style_value)
+    return cell
+
+
+def write_workbook(out, organization, batch_id=None, date_from=None, date_to=None):
+    """Write the export to the file object ``out``; returns the number of entries written"""
+    workbook = Workbook(write_only=True)
+    summary = workbook.create_sheet('Summary')
+    counts = {}
+    stub = ArchivedBatch.objects.filter(organization=organization, batch_id=batch_id).first() if batch_id else None
+    archived = archived_entries(stub, organization, date_from, date_to) if stub else None
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        sheet = workbook.create_sheet(sheet_title(perspective))
+        for index, width in enumerate(WIDTHS):
+            sheet.column_dimensions[chr(ord('A') + index)].width = width
+        sheet.freeze_panes = 'A2'
+        sheet.append([styled(sheet, title, font=BOLD) for title in HEADER])
+        perspective_counts = counts[perspective] = dict.fromkeys(STATUSES, 0)
+        for (entry_batch_id, batch_name, objective, measure, owner, target, actual,
+             target_value, actual_value, weight, date, status) in (
+            archived.get(perspective, []) if archived is not None else entries(model, organization, batch_id, date_from, date_to)
+        ):
+            perspective_counts[status] += 1
+            sheet.append([
+                entry_batch_id,
+                batch_name or f'Batch {entry_batch_id}',
+                objective,
+                measure,
+                owner,
+                # Numbers as numbers where they parse, so the sheet can calculate with them
+                target if target_value is None else target_value,
+                actual if actual_value is None else actual_value,
+                float(weight) if weight is not None else None,
+                date,
+                styled(sheet, status, fill=STATUS_FILLS[status]),
+            ])
+
+    scope = f'Batch {batch_id}' if batch_id else 'All batches'
+    if date_from or date_to:
+        scope += f", dates {date_from or '...'} to {date_to or '...'}"
+    summary.column_dimensions['A'].width = 22
+    summary.append([styled(summary, organization.name, font=Font(bold=True, size=14))])
+    summary.append([scope])
+    summary.append([f"Exported {timezone.localtime():%Y-%m-%d %H:%M}"])
+    summary.append([])
+    summary.append([styled(summary, title, font=BOLD) for title in ['Perspective', 'Entries', *[s.title() for s in STATUSES]]])
+    totals = dict.fromkeys(STATUSES, 0)
+    for perspective, perspective_counts in counts.items():
+        summary.append([perspective, sum(perspective_counts.values()), *perspective_counts.values()])
+        for status, count in perspective_counts.items():
+            totals[status] += count
+    summary.append([styled(summary, value, font=BOLD) for value in ['Total', sum(totals.values()), *totals.values()]])
+    summary.append([])
+    summary.append(['Status'] + [styled(summary, status, fill=fill) for status, fill in STATUS_FILLS.items()])
+
+    workbook.save(out)
+    return sum(totals.values())
+
+
+def export_file(organization, batch_id=None, date_from=None, date_to=None):
+    """The export in a rewound temporary file (removed when closed), and its entry count"""
+    out = tempfile.TemporaryFile()
+    try:
+        written = write_workbook(out, organization, batch_id, date_from, date_to)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out, written
+
+
+def export_filename(organization, batch_id=None, date_from=None, date_to=None):
+    parts = ['bsc', get_valid_filename(organization.name)]
+    if batch_id:
+        parts.append(f'batch_{batch_id}')
+    if date_from or date_to:
+        parts.append(f"{date_from or ''}_{date_to or ''}")
+    parts.append(datetime.date.today().isoformat())
+    return '-'.join(parts) + '.xlsx'
@@ -0,0 +1,365 @@
+"""
+Offline bulk loading for ``manage.py bsc_import``.
+
+Files are read in chunks (CSV with pandas, XLSX with openpyxl in read-only
+mode, Parquet with pyarrow), every chunk is converted column by column with
+pandas - the same rules as ingest.build_entries, vectorized - and written
+straight into the perspective tables: COPY FROM STDIN on PostgreSQL, one
+executemany per chunk elsewhere. No model instances are created.
+
+Values are stored as the text found in the file; empty cells become empty
+strings (or NULL for owner and date).
+
+Per-row work that can wait is done at the end: on SQLite the full-text
+index triggers are suspended during the load and the loaded batches are
+indexed with one INSERT ... SELECT per table, and the score rollups are
+recomputed per batch. Loads of at least BSC_IMPORT_DEFER_INDEXES_ROWS rows
+(and at least as many as already stored) also rebuild the secondary indexes
+once instead of updating them row by row (see SuspendedIndexes).
+"""
+import io
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import dimensions, rollup
+from .ingest import DATE_FORMATS, DEFAULT_WEIGHT, MODEL_BY_PERSPECTIVE, REQUIRED_COLUMNS, UploadError
+from .models import PERSPECTIVE_MODELS, parse_number
+from .search import fts_available, fts_index_rows
+
+
+FILE_TYPES = ('.csv', '.xlsx', '.parquet')
+CHUNK_ROWS = 20000
+PERSPECTIVE_BY_MODEL = {model: name for name, model in PERSPECTIVE_MODELS.items()}
+
+
+def find_files(paths):
+    """The importable files at ``paths`` (files, or directories searched recursively), in name order"""
+    found = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            found.extend(sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() in FILE_TYPES))
+        elif path.is_file() and path.suffix.lower() in FILE_TYPES:
+            found.append(path)
+        else:
+            raise UploadError(f'{path} is not a CSV, XLSX or Parquet file or a directory')
+    return found
+
+
+def estimate_rows(path):
+    """Data rows in ``path``: counted lines for CSV, from the file metadata for Parquet and XLSX"""
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        lines = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                lines += block.count(b'\n')
+        return max(lines - 1, 0)
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return max((workbook.active.max_row or 1) - 1, 0)
+    finally:
+        workbook.close()
+
+
+def should_defer_indexes(rows):
+    """Whether loading ``rows`` rows is worth dropping and rebuilding the secondary indexes"""
+    if rows < getattr(settings, 'BSC_IMPORT_DEFER_INDEXES_ROWS', 100000):
+        return False
+    stored = sum(model.objects.count() for model in PERSPECTIVE_MODELS.values())
+    return rows >= stored
+
+
+def cell_text(value):
+    if hasattr(value, 'strftime'):  # date, datetime, Timestamp
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def xlsx_chunks(path, chunk_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(column) for column in header]
+        chunk = []
+        for row in rows:
+            chunk.append([None if value is None else cell_text(value) for value in row])
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def parquet_chunks(path, chunk_rows):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        df = batch.to_pandas()
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = df[column].dt.strftime('%Y-%m-%d')
+            else:
+                df[column] = df[column].map(lambda value: None if value is None or value != value else cell_text(value))
+        yield df
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """DataFrames of at most ``chunk_rows`` rows with lower-cased column names and text (or None) cells"""
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        chunks = pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[''])
+    elif suffix == '.xlsx':
+        chunks = xlsx_chunks(path, chunk_rows)
+    else:
+        chunks = parquet_chunks(path, chunk_rows)
+    for df in chunks:
+        df.columns = [str(column).strip().lower() for column in df.columns]
+        if not REQUIRED_COLUMNS.issubset(df.columns):
+            raise UploadError(f"{path.name}: missing required columns. Required: {', '.join(sorted(REQUIRED_COLUMNS))}")
+        yield df.astype(object).where(df.notna(), None)
+
+
+def numbers(series):
+    # parse_number once per distinct text: pd.to_numeric disagrees with float() on e.g. '1_000'
+    parsed = {text: parse_number(text) for text in series.dropna().unique()}
+    values = series.map(parsed)
+    return values.astype(object).where(values.notna(), None)
+
+
+def dates(series):
+    text = series.str.strip()
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        # Later formats only get the values the earlier ones couldn't parse
+        missing = parsed.isna() & text.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors='coerce')
+    text = parsed.dt.strftime('%Y-%m-%d')
+    return text.where(parsed.notna(), None)
+
+
+def weights(series):
+    return pd.to_numeric(series, errors='coerce').fillna(DEFAULT_WEIGHT).clip(0.1, 5.0).round(2)
+
+
+class TableWriter:
+    """Column order, constant defaults and the insert method of one perspective table"""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        self.defaults = {
+            field.attname: field.get_db_prep_save(field.get_default(), connection)
+            for field in self.fields
+        }
+
+    def write(self, values, rows):
+        """
+        Insert ``rows`` rows; ``values`` maps attname -> list of values or a
+        single value for all rows. Columns missing from ``values`` get their
+        field default; those defaulting to NULL are left out of the insert.
+        """
+        fields = [
+            field for field in self.fields
+            if field.attname in values or self.defaults[field.attname] is not None
+        ]
+        columns = [values.get(field.attname, self.defaults[field.attname]) for field in fields]
+        columns = [column if isinstance(column, list) else [column] * rows for column in columns]
+        records = zip(*columns)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        column_list = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        if connection.vendor == 'postgresql':
+            copy_records(f'COPY {table} ({column_list}) FROM STDIN', records)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            with connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})', records)
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_records(sql, records):
+    data = ''.join('\t'.join(map(copy_value, record)) + '\n' for record in records)
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(data)
+        else:  # psycopg2
+            raw.copy_expert(sql, io.StringIO(data))
+
+
+def resolve_refs(values, dimension_cache):
+    """Add the dimension key columns of the text columns in ``values`` (as TableWriter.write takes them)"""
+    for field, (dimension, ref) in dimensions.DIMENSIONS.items():
+        if values.get(field) is None:
+            values[f'{ref}_id'] = None
+            continue
+        # Clean and resolve each distinct value once, then map the column
+        names = {value: dimensions.clean_name(value) for value in set(values[field])}
+        ids = dimension_cache.resolve(dimension, names.values())
+        key_of = {value: ids.get(name) if name is not None else None for value, name in names.items()}
+        values[f'{ref}_id'] = [key_of[value] for value in values[field]]
+
+
+class Loader:
+    """Loads chunks into the perspective tables of one organization"""
+
+    def __init__(self, organization):
+        self.organization = organization
+        self.writers = {model: TableWriter(model) for model in PERSPECTIVE_MODELS.values()}
+        self.dimension_cache = dimensions.DimensionCache(organization.pk) if dimensions.enabled() else None
+        self.now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    def load_chunk(self, df, batch_id, batch_name):
+        """Write one chunk as rows of ``batch_id``; returns (rows written, rows skipped)"""
+        model_of = df['perspective'].astype(str).str.strip().str.lower().map(MODEL_BY_PERSPECTIVE)
+        # Converted once for the whole chunk, then split by perspective
+        columns = {field: df[field].fillna('') for field in ('objective', 'measure', 'target', 'actual')}
+        columns['target_value'] = numbers(df['target'])
+        columns['actual_value'] = numbers(df['actual'])
+        if 'owner' in df:
+            columns['owner'] = df['owner']
+        if 'date' in df:
+            columns['date'] = dates(df['date'])
+        if 'weight' in df:
+            columns['weight'] = weights(df['weight'])
+        written = 0
+        for model, writer in self.writers.items():
+            selected = model_of == model
+            rows = int(selected.sum())
+            if not rows:
+                continue
+            values = {field: column[selected].tolist() for field, column in columns.items()}
+            values.setdefault('weight', DEFAULT_WEIGHT)
+            values.update({
+                'batch_id': batch_id,
+                'batch_name': batch_name,
+                'upload_time': self.now,
+                'updated_at': self.now,
+                'organization_id': self.organization.pk,
+            })
+            if self.dimension_cache is not None:
+                resolve_refs(values, self.dimension_cache)
+            writer.write(values, rows)
+            written += rows
+        return written, len(df) - written
+
+    def finish(self, batch_ids):
+        """Work deferred from the row inserts: one search index pass over all ``batch_ids``, then their rollups"""
+        batch_ids = sorted(set(batch_ids))
+        if connection.vendor == 'sqlite' and fts_available():
+            placeholders = ', '.join(['%s'] * len(batch_ids))
+            with connection.cursor() as cursor:
+                for perspective in PERSPECTIVE_MODELS:
+                    fts_index_rows(
+                        cursor, perspective, f'organization_id = %s AND batch_id IN ({placeholders})',
+                        [self.organization.pk, *batch_ids],
+                    )
+        for batch_id in batch_ids:
+            rollup.recompute(self.organization, batch_id)
+
+
+class SuspendedSearchTriggers:
+    """Drops the SQLite FTS insert triggers of the perspective tables for the enclosed block and restores them. Use inside atomic()"""
+
+    def __enter__(self):
+        self.triggers = []
+        if connection.vendor != 'sqlite':
+            return self
+        names = [f'{model._meta.db_table}_search_ai' for model in PERSPECTIVE_MODELS.values()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join(['%s'] * len(names))})",
+                names,
+            )
+            self.triggers = cursor.fetchall()
+            for name, _ in self.triggers:
+                cursor.execute(f'DROP TRIGGER {name}')
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None or connection.needs_rollback:
+            return False  # the rollback of the enclosing atomic() restores them
+        with connection.cursor() as cursor:
+            for _, sql in self.triggers:
+                cursor.execute(sql)
+        return False
+
+
+class SuspendedIndexes:
+    """
+    Drops the secondary indexes of the perspective tables for the enclosed
+    block and rebuilds them afterwards - one sort per index instead of a
+    b-tree insert per row and index. Primary keys and unique constraints stay.
+    Use inside atomic(): DDL is transactional on SQLite and PostgreSQL.
+    """
+
+    def __enter__(self):
+        tables = [model._meta.db_table for model in PERSPECTIVE_MODELS.values()]
+        placeholders = ', '.join(['%s'] * len(tables))
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                    f"AND tbl_name IN ({placeholders})",
+                    tables,
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() '
+                    f'AND tablename IN ({placeholders}) AND indexname NOT IN '
+                    f'(SELECT conname FROM pg_constraint WHERE contype IN (%s, %s))',
+                    [*tables, 'p', 'u'],
+                )
+            else:
+                self.indexes = []
+                return self
+            self.indexes = cursor.fetchall()
+            for name, _ in self.indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None or connection.needs_rollback:
+            return False  # the rollback of the enclosing atomic() restores them
+        with connection.cursor() as cursor:
+            for _, sql in self.indexes:
+                cursor.execute(sql)
+        return False
+
+
+def analyze():
+    """Refresh the planner statistics of the perspective tables"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Sample instead of scanning every row of every index
+            cursor.execute('PRAGMA analysis_limit = 1000')
+        for model in PERSPECTIVE_MODELS.values():
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
@@ -0,0 +1,213 @@
+"""
+Turning uploaded CSV/Excel data into rows of the four perspective tables.
+
+Shared by the dashboard upload and the management commands so that seeded and
+imported data goes through exactly the same parsing as a web upload.
+"""
+import datetime
+from collections import defaultdict
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollup
+from .dimensions import assign_refs
+from .models import PERSPECTIVE_MODELS, ArchivedBatch, UploadLedger, parse_number
+
+
+REQUIRED_COLUMNS = {'perspective', 'objective', 'measure', 'target', 'actual'}
+DEFAULT_WEIGHT = 1.0
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%m/%d/%Y")
+ALLOWED_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# Lower-cased perspective column value -> model
+MODEL_BY_PERSPECTIVE = {name.lower(): model for name, model in PERSPECTIVE_MODELS.items()}
+
+
+class UploadError(Exception):
+    """Raised for uploads that can't be processed, the message is shown to the user"""
+
+
+def read_dataframe(data_file, file_name):
+    # Uploads spooled to disk (uploads.py) are read by path, CSVs memory-mapped, instead of through the file object
+    if hasattr(data_file, 'temporary_file_path'):
+        data_file = data_file.temporary_file_path()
+    if file_name.endswith('.csv'):
+        df = pd.read_csv(data_file, memory_map=isinstance(data_file, str))
+    else:
+        df = pd.read_excel(data_file)
+    df.columns = [str(col).lower() for col in df.columns]
+    if not REQUIRED_COLUMNS.issubset(df.columns):
+        raise UploadError(f"Missing required columns. Required: {', '.join(REQUIRED_COLUMNS)}")
+    return df
+
+
+def parse_date(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)) or not str(value).strip():
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def next_batch_id():
+    """One more than the highest numeric batch_id in any perspective table or archive, zero padded to 3 digits"""
+    highest = 0
+    for model in [*PERSPECTIVE_MODELS.values(), ArchivedBatch]:
+        for batch_id in model.objects.exclude(batch_id=None).values_list('batch_id', flat=True).distinct():
+            if batch_id.isdigit():
+                highest = max(highest, int(batch_id))
+    return str(highest + 1).zfill(3)
+
+
+def parse_weight(value):
+    """The optional weight column, clamped to the 0.1-5.0 range the model documents"""
+    weight = parse_number(value)
+    if weight is None:
+        return DEFAULT_WEIGHT
+    return round(min(max(weight, 0.1), 5.0), 2)
+
+
+def build_entries(df, organization, batch_id, batch_name=None):
+    """Unsaved model instances for every row of ``df``, grouped by model. Rows with an unknown perspective are skipped"""
+    entries = {model: [] for model in PERSPECTIVE_MODELS.values()}
+    for row in df.to_dict('records'):
+        model = MODEL_BY_PERSPECTIVE.get(str(row.get('perspective', '')).strip().lower())
+        if model is None:
+            continue
+        entry = model(
+            objective=row.get('objective', ''),
+            measure=row.get('measure', ''),
+            target=row.get('target', ''),
+            actual=row.get('actual', ''),
+            owner=row.get('owner', ''),
+            date=parse_date(row.get('date', None)),
+            weight=parse_weight(row.get('weight')),
+            batch_id=batch_id,
+            batch_name=batch_name,
+            organization=organization,
+        )
+        # bulk_create doesn't call save()
+        entry.parse_values()
+        entries[model].append(entry)
+    return entries
+
+
+def known_rows(df):
+    """How many rows of ``df`` have a perspective build_entries stores"""
+    if 'perspective' not in df:
+        return 0
+    return int(df['perspective'].astype(str).str.strip().str.lower().isin(MODEL_BY_PERSPECTIVE.keys()).sum())
+
+
+def ingest_dataframe(df, organization, batch_name=None):
+    """Store ``df`` as a new batch of ``organization`` and return its batch_id. Raises UploadError if no row can be stored"""
+    with transaction.atomic():
+        batch_id = next_batch_id()
+        entries = build_entries(df, organization, batch_id, batch_name)
+        if not any(entries.values()):
+            # Nothing would claim the batch id, so the next upload would get it too
+            raise UploadError('No rows with a known perspective')
+        # One dimension lookup cache for the whole upload
+        assign_refs([entry for objs in entries.values() for entry in objs], organization.pk)
+        for model, objs in entries.items():
+            model.objects.bulk_create(objs, batch_size=1000)
+        rollup.recompute(organization, batch_id)
+    return batch_id
+
+
+# Identity of an entry within a batch for merge uploads
+MERGE_KEY = ('objective', 'measure', 'owner')
+# Compared to decide whether a matched entry changed
+MERGE_FIELDS = ('target', 'actual', 'date', 'weight')
+PERSPECTIVE_BY_MODEL = {model: name for name, model in PERSPECTIVE_MODELS.items()}
+
+
+def stored(model, field, value):
+    """``value`` as it reads back from the database, so incoming and stored values compare equal"""
+    return model._meta.get_field(field).to_python(value)
+
+
+def merge_key(entry):
+    return tuple(stored(type(entry), field, getattr(entry, field)) for field in MERGE_KEY)
+
+
+def merge_dataframe(df, organization, batch_id, delete_missing=False):
+    """
+    Merge ``df`` into the existing batch ``batch_id``, matching entries on (perspective, objective, measure, owner).
+
+    New rows are bulk-inserted, matched rows whose target, actual, date or
+    weight differ are bulk-updated, and existing rows missing from ``df`` are
+    deleted when ``delete_missing`` is set (kept otherwise). Duplicate keys are
+    matched in file and id order. Returns counts per outcome.
+    """
+    summary = {'batch_id': batch_id, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'missing': 0}
+    with transaction.atomic():
+        existing = {
+            model: list(model.objects.filter(organization=organization, batch_id=batch_id).order_by('pk').only(
+                'pk', 'batch_name', *MERGE_KEY, *MERGE_FIELDS,
+            ))
+            for model in PERSPECTIVE_MODELS.values()
+        }
+        if not any(existing.values()):
+            raise UploadError(f'Batch {batch_id} not found')
+        batch_name = next(entry.batch_name for entries in existing.values() for entry in entries)
+        incoming = build_entries(df, organization, batch_id, batch_name)
+
+        now = timezone.now()
+        new_entries = []
+        changed_perspectives = set()
+        for model, entries in incoming.items():
+            by_key = defaultdict(list)
+            for entry in existing[model]:
+                by_key[merge_key(entry)].append(entry)
+            changed = []
+            for entry in entries:
+                matches = by_key.get(merge_key(entry))
+                if not matches:
+                    new_entries.append(entry)
+                    continue
+                current = matches.pop(0)
+                if all(stored(model, field, getattr(entry, field)) == getattr(current, field) for field in MERGE_FIELDS):
+                    summary['unchanged'] += 1
+                    continue
+                for field in MERGE_FIELDS:
+                    setattr(current, field, getattr(entry, field))
+                # bulk_update doesn't call save()
+                current.parse_values()
+                current.updated_at = now
+                changed.append(current)
+            if changed:
+                model.objects.bulk_update(
+                    changed, [*MERGE_FIELDS, 'target_value', 'actual_value', 'updated_at'], batch_size=1000,
+                )
+                summary['updated'] += len(changed)
+                changed_perspectives.add(PERSPECTIVE_BY_MODEL[model])
+
+            leftover = [entry.pk for matches in by_key.values() for entry in matches]
+            if leftover and delete_missing:
+                for start in range(0, len(leftover), 500):
+                    model.objects.filter(pk__in=leftover[start:start + 500]).delete()
+                summary['deleted'] += len(leftover)
+                changed_perspectives.add(PERSPECTIVE_BY_MODEL[model])
+            elif leftover:
+                summary['missing'] += len(leftover)
+
+        if new_entries:
+            assign_refs(new_entries, organization.pk)
+            for model in PERSPECTIVE_MODELS.values():
+                objs = [entry for entry in new_entries if type(entry) is model]
+                if objs:
+                    model.objects.bulk_create(objs, batch_size=1000)
+                    changed_perspectives.add(PERSPECTIVE_BY_MODEL[model])
+            summary['inserted'] = len(new_entries)
+
+        if changed_perspectives:
+            rollup.recompute(organization, batch_id, changed_perspectives)
+            # The batch no longer holds the rows its upload ledger hashes describe (see dedup.py)
+            UploadLedger.objects.filter(organization=organization, batch_id=batch_id).delete()
+    return summary
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bsc_gen.alerts import scan
+
+
+class Command(BaseCommand):
+    help = (
+        'Email owners about BSC entries whose actual/target ratio fell below their alert threshold. '
+        'Only entries changed since the previous run are scanned. Run it from cron, or with --loop as a worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep scanning every --interval seconds')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between scans with --loop (default: BSC_ALERT_INTERVAL)')
+        parser.add_argument('--full', action='store_true', help='Ignore the high-water marks and scan every row')
+        parser.add_argument('--dry-run', action='store_true', help='List the alerts without sending or recording them')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or getattr(settings, 'BSC_ALERT_INTERVAL', 300)
+        while True:
+            self.run_once(options)
+            if not options['loop']:
+                return
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
+
+    def run_once(self, options):
+        started = time.perf_counter()
+        summary = scan(full=options['full'], dry_run=options['dry_run'])
+        for alert in summary.get('details', ()):
+            self.stdout.write(
+                f"  {alert['perspective']}: {alert['objective']} / {alert['measure']} "
+                f"({alert['owner'] or 'no owner'}) {alert['ratio']:.0%} < {float(alert['alert_threshold']):.0%}"
+            )
+        action = 'would send' if options['dry_run'] else 'sent'
+        self.stdout.write(
+            f"{summary['scanned_until']:%Y-%m-%d %H:%M:%S} {summary['alerts']} alert(s), "
+            f"{action} {summary['emails']} email(s) in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bsc_gen import archive
+from bsc_gen.events import publish_change
+from bsc_gen.models import ArchivedBatch, Organization
+
+
+class Command(BaseCommand):
+    help = (
+        'Move batches unchanged for BSC_ARCHIVE_AFTER_DAYS days (or --days) to compressed Parquet files '
+        'under BSC_ARCHIVE_DIR, or --restore archived batches'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', action='append', help='Organization name, repeatable (default: all)')
+        parser.add_argument('--days', type=int, help='Retention window in days (default: BSC_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--dry-run', action='store_true', help='List the batches that would be archived')
+        parser.add_argument('--restore', nargs='+', metavar='BATCH_ID', help='Restore these archived batches instead (needs one --org)')
+        parser.add_argument('--list', action='store_true', help='List archived batches')
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by('name')
+        if options['org']:
+            organizations = organizations.filter(name__in=options['org'])
+            missing = set(options['org']) - set(organizations.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"Unknown organization(s): {', '.join(sorted(missing))}")
+
+        if options['list']:
+            for stub in ArchivedBatch.objects.filter(organization__in=organizations).select_related('organization').order_by('organization__name', 'batch_id'):
+                self.stdout.write(
+                    f'{stub.organization.name}: batch {stub.batch_id} ({stub.batch_name or "unnamed"}), '
+                    f'{stub.entries} entries, {stub.file_size / 1024:.0f} KB, archived {stub.archived_at:%Y-%m-%d}'
+                )
+            return
+
+        if options['restore']:
+            if len(options['org'] or []) != 1:
+                raise CommandError('--restore needs exactly one --org')
+            organization = organizations.get()
+            for batch_id in options['restore']:
+                try:
+                    restored = archive.restore_batch(organization, batch_id)
+                except archive.ArchiveError as e:
+                    raise CommandError(str(e))
+                if restored is None:
+                    self.stderr.write(f'Batch {batch_id} is not archived')
+                    continue
+                publish_change(organization, 'batch_added', batch_id)
+                self.stdout.write(f'{organization.name}: restored batch {batch_id}, {restored} entries')
+            return
+
+        archived = entries = size = 0
+        started = time.perf_counter()
+        for organization in organizations:
+            for batch_id in archive.stale_batches(organization, options['days']):
+                if options['dry_run']:
+                    self.stdout.write(f'{organization.name}: would archive batch {batch_id}')
+                    continue
+                stub = archive.archive_batch(organization, batch_id)
+                if stub is None:
+                    continue
+                publish_change(organization, 'batch_archived', batch_id)
+                archived += 1
+                entries += stub.entries
+                size += stub.file_size
+                self.stdout.write(f'{organization.name}: archived batch {batch_id}, {stub.entries} entries in {stub.file_size / 1024:.0f} KB')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {archived} batches, {entries} entries, {size / 1024:.0f} KB in {time.perf_counter() - started:.1f}s'
+            ))
@@ -0,0 +1,217 @@
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bsc_gen.models import PERSPECTIVE_MODELS, Organization
+from bsc_gen.synthetic import generate_batch_frame, seed_organization
+
+
+TARGETS = (
+    'dashboard', 'bsc_data_api', 'batch_details_api', 'batch_plans_api', 'action_plans_api',
+    'generate_batch_pdf', 'update_batch', 'upload', 'import',
+)
+# Rows per second `manage.py bsc_import` should reach
+IMPORT_TARGET_ROWS_PER_SECOND = 100000
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the upload path, dashboard, APIs, batch update, PDF report and bsc_import against '
+        'synthetic organizations of several sizes and write the results as JSON; the import target '
+        'loads a CSV of <size> rows and reports rows/s against IMPORT_TARGET_ROWS_PER_SECOND. Creates '
+        'and deletes its own data, but run it against a scratch database (e.g. BSC_SQLITE_PATH=bench.sqlite3).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000',
+                            help='Comma separated total entries per organization')
+        parser.add_argument('--batches', type=int, default=5, help='Batches the entries are spread over')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per target')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', action='append', choices=TARGETS, help='Only run these targets')
+        parser.add_argument('--output', default=None,
+                            help='JSON output path (default: bench/<commit>-<timestamp>.json)')
+        parser.add_argument('--compare', default=None, help='Earlier results file to compare medians against')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark organizations afterwards')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+        targets = options['only'] or TARGETS
+
+        results = []
+        with override_settings(ALLOWED_HOSTS=['*'], BSC_PERF_ENABLED=False, BSC_PROFILER_ENABLED=False):
+            for size in sizes:
+                results.extend(self.bench_size(size, targets, options))
+
+        commit = git_commit()
+        report = {
+            'meta': {
+                'commit': commit,
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'batches': options['batches'],
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        output = Path(options['output'] or Path('bench') / f"{commit or 'nocommit'}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = {(r['size'], r['target']): r for r in json.load(f)['results']}
+        self.print_table(results, baseline)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def bench_size(self, size, targets, options):
+        name = f'Bench {size}'
+        Organization.objects.filter(name=name).delete()
+        User.objects.filter(username=f"{name.lower().replace(' ', '_')}_admin").delete()
+        per_batch = max(1, size // options['batches'])
+        self.stdout.write(f'Seeding {name}: {options["batches"]} x {per_batch} entries...')
+        organization, admin, batch_ids = seed_organization(
+            name, options['batches'], per_batch, seed=options['seed'], admin_password='bench-password1',
+        )
+        client = Client()
+        client.force_login(admin)
+        batch_id = batch_ids[-1]
+
+        # A fresh file per run (warm-up included), or the ledger would answer every repeat as a duplicate
+        upload_csvs = iter([
+            generate_batch_frame(random.Random(options['seed'] + run), per_batch).to_csv(index=False).encode()
+            for run in range(options['repeat'] + 1)
+        ])
+        update_data = {}
+        for model in PERSPECTIVE_MODELS.values():
+            for pk, objective, actual in model.objects.filter(batch_id=batch_id).values_list('pk', 'objective', 'actual'):
+                update_data[f'{model.__name__}_{pk}_objective'] = objective
+                update_data[f'{model.__name__}_{pk}_actual'] = actual
+
+        requests = {
+            'dashboard': lambda: client.get(reverse('dashboard')),
+            'bsc_data_api': lambda: client.get(reverse('bsc_data_api')),
+            'batch_details_api': lambda: client.get(reverse('batch_details_api'), {'batch_id': batch_id}),
+            'batch_plans_api': lambda: client.get(reverse('batch_plans_api', args=[batch_id])),
+            'action_plans_api': lambda: client.get(reverse('action_plans_api')),
+            'generate_batch_pdf': lambda: client.get(reverse('batch_report_pdf', args=[batch_id])),
+            'update_batch': lambda: client.post(reverse('update_batch', args=[batch_id]), update_data),
+            'upload': lambda: client.post(reverse('dashboard'), {
+                'data_file': SimpleUploadedFile('bench.csv', next(upload_csvs), content_type='text/csv'),
+            }),
+        }
+
+        import_csv = None
+        if 'import' in targets:
+            with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+                f.write(generate_batch_frame(random.Random(options['seed']), size).to_csv(index=False).encode())
+            import_csv = f.name
+            requests['import'] = lambda: call_command('bsc_import', import_csv, org=name, stdout=io.StringIO())
+
+        results = []
+        try:
+            for target in TARGETS:
+                if target in targets:
+                    self.stdout.write(f'  {target}')
+                    results.append(self.time_target(size, target, requests[target], options['repeat']))
+        finally:
+            if import_csv:
+                Path(import_csv).unlink()
+
+        if not options['keep']:
+            organization.delete()
+            admin.delete()
+        return results
+
+    def time_target(self, size, target, make_request, repeat):
+        result = {'size': size, 'target': target}
+        try:
+            make_request()  # warm up caches and imports
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = make_request()
+                    timings.append(time.perf_counter() - started)
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}'
+            return result
+        if target == 'import':
+            result.update({
+                'rows_per_second': size / statistics.median(timings),
+                'target_rows_per_second': IMPORT_TARGET_ROWS_PER_SECOND,
+            })
+        else:
+            result.update({
+                'status': response.status_code,
+                'response_bytes': len(response.content) if not response.streaming else None,
+            })
+        result.update({
+            'queries': len(queries),
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.fmean(timings),
+            'p95': percentile(timings, 95),
+            'timings': timings,
+        })
+        return result
+
+    def print_table(self, results, baseline):
+        self.stdout.write(f"{'size':>8} {'target':<20} {'median ms':>10} {'p95 ms':>10} {'queries':>8} {'vs base':>8}")
+        for r in results:
+            if 'error' in r:
+                self.stdout.write(f"{r['size']:>8} {r['target']:<20} {r['error']}")
+                continue
+            base = baseline.get((r['size'], r['target']))
+            change = f"{r['median'] / base['median']:.2f}x" if base and base.get('median') else ''
+            self.stdout.write(
+                f"{r['size']:>8} {r['target']:<20} {r['median'] * 1000:>10.1f} {r['p95'] * 1000:>10.1f} "
+                f"{r['queries']:>8} {change:>8}"
+            )
+        for r in results:
+            if 'rows_per_second' in r:
+                self.stdout.write(
+                    f"{r['size']:>8} rows imported at {r['rows_per_second']:,.0f} rows/s, "
+                    f"{r['rows_per_second'] / r['target_rows_per_second']:.0%} of the "
+                    f"{r['target_rows_per_second']:,} rows/s target"
+                )
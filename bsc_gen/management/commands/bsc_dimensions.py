@@ -0,0 +1,128 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Length, Trim
+
+from bsc_gen.dimensions import DIMENSIONS, DimensionCache, clean_name
+from bsc_gen.models import PERSPECTIVE_MODELS, Organization
+
+
+KEY_BYTES = 8  # bigint foreign key
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the storage and scan speed of objective/measure/owner as text against the '
+        'normalized integer keys, or backfill missing keys with --backfill.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', action='append', help='Organization name, repeatable (default: all)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per scan')
+        parser.add_argument('--backfill', action='store_true', help='Fill missing dimension keys instead of reporting')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by('name')
+        if options['org']:
+            organizations = organizations.filter(name__in=options['org'])
+            if not organizations:
+                raise CommandError('No such organization')
+        if options['backfill']:
+            for organization in organizations:
+                self.stdout.write(f'{organization.name}: {self.backfill(organization)} keys filled')
+            return
+
+        report = {'storage': self.storage(organizations), 'scans': self.scans(organizations, options['repeat'])}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        storage = report['storage']
+        self.stdout.write(f"{storage['entries']} entries")
+        self.stdout.write(f"  as text:  {storage['text_bytes'] / 1e6:>10.2f} MB")
+        self.stdout.write(
+            f"  as keys:  {storage['key_bytes'] / 1e6:>10.2f} MB + {storage['dictionary_bytes'] / 1e6:.2f} MB in "
+            f"{storage['dictionary_rows']} dictionary rows"
+        )
+        self.stdout.write(f"{'scan':<28} {'text ms':>10} {'keys ms':>10} {'speedup':>8}")
+        for name, scan in report['scans'].items():
+            self.stdout.write(
+                f"{name:<28} {scan['text'] * 1000:>10.1f} {scan['keys'] * 1000:>10.1f} {scan['text'] / scan['keys']:>7.2f}x"
+            )
+
+    def storage(self, organizations):
+        """Payload bytes of the text columns against those of the keys plus the dictionary tables"""
+        entries = text_bytes = 0
+        for model in PERSPECTIVE_MODELS.values():
+            totals = model.objects.filter(organization__in=organizations).aggregate(
+                entries=Count('id'),
+                text=Sum(Length('objective') + Length('measure') + Coalesce(Length('owner'), 0)),
+            )
+            entries += totals['entries']
+            text_bytes += totals['text'] or 0
+        dictionary_rows = dictionary_bytes = 0
+        for dimension, _ in DIMENSIONS.values():
+            totals = dimension.objects.filter(organization__in=organizations).aggregate(rows=Count('id'), text=Sum(Length('name')))
+            dictionary_rows += totals['rows']
+            dictionary_bytes += (totals['text'] or 0) + totals['rows'] * 2 * KEY_BYTES
+        return {
+            'entries': entries,
+            'text_bytes': text_bytes,
+            'key_bytes': entries * len(DIMENSIONS) * KEY_BYTES,
+            'dictionary_rows': dictionary_rows,
+            'dictionary_bytes': dictionary_bytes,
+        }
+
+    def scans(self, organizations, repeat):
+        text_fields = list(DIMENSIONS)
+        key_fields = [f'{ref}_id' for _, ref in DIMENSIONS.values()]
+
+        def read(fields):
+            for model in PERSPECTIVE_MODELS.values():
+                for _ in model.objects.filter(organization__in=organizations).values_list(*fields).iterator(chunk_size=5000):
+                    pass
+
+        def group(fields):
+            for model in PERSPECTIVE_MODELS.values():
+                list(model.objects.filter(organization__in=organizations).values(*fields).annotate(n=Count('id')).order_by())
+
+        def distinct_objectives(field):
+            for model in PERSPECTIVE_MODELS.values():
+                list(model.objects.filter(organization__in=organizations).values_list(field, flat=True).distinct())
+
+        return {
+            'read all rows': {'text': timed(lambda: read(text_fields), repeat), 'keys': timed(lambda: read(key_fields), repeat)},
+            'group by all three': {'text': timed(lambda: group(text_fields), repeat), 'keys': timed(lambda: group(key_fields), repeat)},
+            'distinct objectives': {
+                'text': timed(lambda: distinct_objectives('objective'), repeat),
+                'keys': timed(lambda: distinct_objectives('objective_ref_id'), repeat),
+            },
+        }
+
+    def backfill(self, organization):
+        """Create the dictionary rows the organization's entries need, then fill missing keys with one UPDATE per column"""
+        cache = DimensionCache(organization.pk)
+        filled = 0
+        for field, (dimension, ref) in DIMENSIONS.items():
+            names = set()
+            for model in PERSPECTIVE_MODELS.values():
+                names.update(clean_name(value) for value in model.objects.filter(organization=organization).values_list(field, flat=True).distinct())
+            names.discard(None)
+            cache.resolve(dimension, names)
+            for model in PERSPECTIVE_MODELS.values():
+                filled += model.objects.filter(organization=organization, **{ref: None}).exclude(**{f'{field}__isnull': True}).update(**{ref: Subquery(
+                    dimension.objects.filter(organization=organization, name=Trim(OuterRef(field))).values('pk')[:1]
+                )})
+        return filled
@@ -0,0 +1,99 @@
+import argparse
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bsc_gen.events import publish_change
+from bsc_gen.importer import (
+    CHUNK_ROWS, Loader, SuspendedIndexes, SuspendedSearchTriggers, analyze, estimate_rows, find_files, read_chunks,
+    should_defer_indexes,
+)
+from bsc_gen.ingest import UploadError, next_batch_id
+from bsc_gen.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-load CSV, XLSX and Parquet files (or directories of them) into an organization, '
+        'one batch per file, with COPY on PostgreSQL and executemany elsewhere. '
+        'Run it while nobody is uploading: batch ids are allocated up front.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files or directories (searched recursively)')
+        parser.add_argument('--org', required=True, help='Organization name')
+        parser.add_argument('--one-batch', action='store_true', help='Load all files into a single batch')
+        parser.add_argument('--batch-name', help='Batch name (default: the file name)')
+        parser.add_argument(
+            '--defer-indexes', action=argparse.BooleanOptionalAction, default=None,
+            help='Drop the secondary indexes of the perspective tables during the load and rebuild them at the end, '
+                 'in one transaction for all files (default: on when loading at least BSC_IMPORT_DEFER_INDEXES_ROWS '
+                 'rows and at least as many as the tables hold)',
+        )
+        parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows read and written at a time')
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(name=options['org']).first()
+        if organization is None:
+            raise CommandError(f"No organization named {options['org']!r}")
+        try:
+            files = find_files(options['paths'])
+        except UploadError as e:
+            raise CommandError(str(e))
+        if not files:
+            raise CommandError('No CSV, XLSX or Parquet files found')
+
+        first = int(next_batch_id())
+        batch_ids = [str(first).zfill(3)] * len(files) if options['one_batch'] else [
+            str(first + number).zfill(3) for number in range(len(files))
+        ]
+        started = time.perf_counter()
+        defer_indexes = options['defer_indexes']
+        if defer_indexes is None:
+            rows = sum(estimate_rows(path) for path in files)
+            defer_indexes = should_defer_indexes(rows)
+            if defer_indexes:
+                self.stdout.write(f'About {rows} rows: rebuilding the indexes once at the end (--no-defer-indexes to keep them)')
+        loader = Loader(organization)
+        total = skipped = 0
+
+        # One transaction per file, or one for everything when the files share a batch or the indexes are rebuilt
+        # once. Search indexing and rollups happen at the end of that transaction, so rows are never committed
+        # without them.
+        single = options['one_batch'] or defer_indexes
+        try:
+            with transaction.atomic() if single else nullcontext():
+                with SuspendedIndexes() if defer_indexes else nullcontext():
+                    for path, batch_id in zip(files, batch_ids):
+                        batch_name = options['batch_name'] or path.stem
+                        file_rows = 0
+                        with transaction.atomic(), SuspendedSearchTriggers():
+                            for df in read_chunks(path, options['chunk_rows']):
+                                written, dropped = loader.load_chunk(df, batch_id, batch_name)
+                                file_rows += written
+                                total += written
+                                skipped += dropped
+                                elapsed = time.perf_counter() - started
+                                self.stdout.write(
+                                    f'\r{path.name}: {file_rows} rows (total {total}, {total / elapsed:,.0f} rows/s)', ending='',
+                                )
+                            if not single:
+                                loader.finish([batch_id])
+                        self.stdout.write(f'\r{path.name}: {file_rows} rows into batch {batch_id}' + ' ' * 30)
+                    if defer_indexes:
+                        self.stdout.write('Rebuilding indexes...')
+                if single:
+                    loader.finish(batch_ids)
+        except UploadError as e:
+            raise CommandError(str(e))
+
+        analyze()
+        for batch_id in sorted(set(batch_ids)):
+            publish_change(organization, 'batch_added', batch_id)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} rows from {len(files)} file(s) in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)'
+            + (f', {skipped} rows with an unknown perspective skipped' if skipped else '')
+        ))
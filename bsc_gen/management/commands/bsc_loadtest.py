@@ -0,0 +1,134 @@
+import http.cookiejar
+import json
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def login_opener(base_url, username, password):
+    """An opener holding a logged in session cookie for ``base_url``"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    login_url = urllib.parse.urljoin(base_url, '/login/')
+    page = opener.open(login_url).read().decode()
+    match = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page)
+    if not match:
+        raise CommandError(f'No CSRF token found on {login_url}')
+    data = urllib.parse.urlencode({
+        'csrfmiddlewaretoken': match.group(1),
+        'username': username,
+        'password': password,
+    }).encode()
+    request = urllib.request.Request(login_url, data=data, headers={'Referer': login_url})
+    opener.open(request)
+    if not any(cookie.name == 'sessionid' for cookie in jar):
+        raise CommandError(f'Logging in as {username} failed')
+    return opener
+
+
+def run_load(opener, url, total, concurrency, duration):
+    """Fire ``total`` GETs (or as many as fit in ``duration`` seconds) from ``concurrency`` threads"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [total]
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0 or (deadline and time.monotonic() > deadline):
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                with opener.open(url, timeout=60) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError) as e:
+                ok = False
+                with lock:
+                    errors.append(str(e))
+            elapsed = time.perf_counter() - started
+            if ok:
+                with lock:
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))] if latencies else None
+
+    return {
+        'url': url,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': wall,
+        'requests_per_second': len(latencies) / wall if wall else 0,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else None,
+        'p50_ms': pct(50) * 1000 if latencies else None,
+        'p99_ms': pct(99) * 1000 if latencies else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test running servers, e.g. the WSGI deployment against uvicorn serving bsc_gen.asgi, '
+        'and compare requests/sec and p99 latency. Pass one --target per server/endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='LABEL=URL',
+                            help='e.g. wsgi=http://127.0.0.1:8000/api/bsc-data/ '
+                                 'asgi=http://127.0.0.1:8001/api/async/bsc-data/')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per target')
+        parser.add_argument('--duration', type=float, default=None, help='Stop each target after this many seconds')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per target first')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f'--target must look like LABEL=URL, got {target!r}')
+            targets.append((label, url))
+
+        results = []
+        for label, url in targets:
+            opener = login_opener(url, options['username'], options['password'])
+            run_load(opener, url, options['warmup'], min(options['concurrency'], options['warmup']) or 1, None)
+            result = run_load(opener, url, options['requests'], options['concurrency'], options['duration'])
+            result['label'] = label
+            results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'target':<12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'ok':>7} {'errors':>7}")
+        for r in results:
+            p50 = f"{r['p50_ms']:.1f}" if r['p50_ms'] is not None else '-'
+            p99 = f"{r['p99_ms']:.1f}" if r['p99_ms'] is not None else '-'
+            self.stdout.write(
+                f"{r['label']:<12} {r['requests_per_second']:>9.1f} {p50:>9} {p99:>9} {r['requests']:>7} {r['errors']:>7}"
+            )
+            if r['first_error']:
+                self.stdout.write(self.style.WARNING(f"  first error: {r['first_error']}"))
@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bsc_gen.perf import load_snapshots, prune_snapshots, snapshot_max_age
+
+
+class Command(BaseCommand):
+    help = 'Print per-view latency, SQL and response size percentiles collected by PerfMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=getattr(settings, 'BSC_PERF_SNAPSHOT_DIR', None),
+                            help='Snapshot directory (defaults to BSC_PERF_SNAPSHOT_DIR)')
+        parser.add_argument('--metric', action='append',
+                            help='Only report this metric, may be repeated (e.g. latency_seconds)')
+        parser.add_argument('--max-age', type=int, default=snapshot_max_age(),
+                            help='Delete and leave out snapshots not rewritten for this many seconds '
+                                 '(defaults to BSC_PERF_SNAPSHOT_MAX_AGE)')
+        parser.add_argument('--json', action='store_true', help='Output JSON instead of a table')
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError('No snapshot directory configured, set BSC_PERF_SNAPSHOT_DIR or pass --dir')
+        # Also drops the files of worker processes that have exited
+        prune_snapshots(options['dir'], options['max_age'])
+        histograms = load_snapshots(options['dir'])
+        if not histograms:
+            self.stdout.write('No metrics recorded yet. Is BSC_PERF_ENABLED on?')
+            return
+
+        rows = []
+        for (view_name, metric), histogram in sorted(histograms.items()):
+            if options['metric'] and metric not in options['metric']:
+                continue
+            rows.append({
+                'view': view_name,
+                'metric': metric,
+                'count': histogram.count,
+                'mean': histogram.sum / histogram.count if histogram.count else None,
+                'p50': histogram.percentile(50),
+                'p90': histogram.percentile(90),
+                'p99': histogram.percentile(99),
+                'max': histogram.max,
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'view':<28} {'metric':<18} {'count':>7} {'mean':>12} {'p50':>12} {'p90':>12} {'p99':>12} {'max':>12}")
+        for row in rows:
+            values = ''.join(f' {row[k]:>12.4g}' if row[k] is not None else f" {'-':>12}" for k in ('mean', 'p50', 'p90', 'p99', 'max'))
+            self.stdout.write(f"{row['view']:<28} {row['metric']:<18} {row['count']:>7}{values}")
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary database into the SQLite replicas of BSC_REPLICAS, '
+        'standing in for replication when trying out read replicas locally. '
+        'Run with --loop to keep them a few seconds behind, like real replicas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep copying instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between copies with --loop')
+
+    def handle(self, *args, **options):
+        replicas = list(settings.BSC_REPLICA_DATABASES)
+        if not replicas:
+            raise CommandError('No replicas configured, set BSC_REPLICAS')
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be synced here; use the database\'s own replication')
+
+        while True:
+            started = time.perf_counter()
+            connections['default'].ensure_connection()
+            source = connections['default'].connection
+            for alias in replicas:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            self.stdout.write(f'Copied to {len(replicas)} replica(s) in {time.perf_counter() - started:.2f}s')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
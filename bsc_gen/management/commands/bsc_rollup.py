@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bsc_gen import rollup
+from bsc_gen.models import Organization
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored weighted scores (ScoreRollup), e.g. after migrating existing data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', action='append', help='Organization name, repeatable (default: all)')
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by('name')
+        if options['org']:
+            organizations = organizations.filter(name__in=options['org'])
+            missing = set(options['org']) - set(organizations.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"Unknown organization(s): {', '.join(sorted(missing))}")
+
+        started = time.perf_counter()
+        for organization in organizations:
+            rows = rollup.recompute_organization(organization)
+            self.stdout.write(f'{organization.name}: {rows} rollup rows')
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,107 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bsc_gen.models import PERSPECTIVE_MODELS, Organization
+from bsc_gen.rows import build_batches
+from bsc_gen.synthetic import seed_organization
+
+
+BENCH_ORG = 'Rows Bench'
+
+
+def build_from_instances(organization):
+    """The dashboard pipeline before rows.py: model instances wrapped in dicts, then one dict per entry"""
+    items = []
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        for entry in model.objects.filter(organization=organization):
+            items.append({'model': perspective, 'entry': entry, 'perspective': perspective})
+    batch_map = {}
+    for item in items:
+        if item['entry'].batch_id:
+            batch_map.setdefault(item['entry'].batch_id, []).append(item)
+    batches = []
+    for batch_id in sorted(batch_map, reverse=True):
+        entries = []
+        for item in batch_map[batch_id]:
+            entry = item['entry']
+            entries.append({
+                'perspective': item['perspective'], 'objective': entry.objective, 'measure': entry.measure,
+                'target': entry.target, 'actual': entry.actual, 'owner': entry.owner, 'date': entry.date,
+                'status': entry.get_status(), 'model_type': type(entry).__name__, 'pk': entry.pk,
+            })
+        batches.append({'batch_id': batch_id, 'entries': entries})
+    return batches
+
+
+def measure(func, organization, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(organization)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        result = func(organization)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'median_s': statistics.median(timings),
+        'peak_mb': peak / 1e6,
+        'entries': sum(len(batch['entries']) for batch in result),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare latency and peak Python memory of building the dashboard batches from model '
+        'instances against the values_list row pipeline. Seeds a scratch organization of '
+        '--entries rows unless --org names an existing one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000)
+        parser.add_argument('--batches', type=int, default=10)
+        parser.add_argument('--org', help='Benchmark an existing organization instead of seeding one')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded organization afterwards')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        seeded = None
+        if options['org']:
+            organization = Organization.objects.filter(name=options['org']).first()
+            if organization is None:
+                raise CommandError('No such organization')
+        else:
+            Organization.objects.filter(name=BENCH_ORG).delete()
+            self.stderr.write(f"Seeding {options['entries']} entries...")
+            organization, _, _ = seed_organization(
+                BENCH_ORG, options['batches'], max(1, options['entries'] // options['batches']),
+            )
+            seeded = organization
+
+        try:
+            report = {
+                'instances': measure(build_from_instances, organization, options['repeat']),
+                'rows': measure(build_batches, organization, options['repeat']),
+            }
+        finally:
+            if seeded and not options['keep']:
+                seeded.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{report['rows']['entries']} entries")
+        self.stdout.write(f"{'pipeline':<12} {'median ms':>10} {'peak MB':>10}")
+        for name, result in report.items():
+            self.stdout.write(f"{name:<12} {result['median_s'] * 1000:>10.1f} {result['peak_mb']:>10.1f}")
+        self.stdout.write(
+            f"rows: {report['instances']['median_s'] / report['rows']['median_s']:.2f}x faster, "
+            f"{report['instances']['peak_mb'] / report['rows']['peak_mb']:.2f}x less memory"
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from bsc_gen import search
+from bsc_gen.models import PERSPECTIVE_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Check the SQLite full-text search index, or --rebuild its triggers and contents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recreate the triggers and re-index every entry')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or not search.fts_available():
+            raise CommandError('No SQLite FTS index in this database; nothing to do')
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['rebuild']:
+                search.install_sqlite_triggers(cursor)
+                search.rebuild_sqlite_index(cursor)
+            missing = search.missing_sqlite_triggers(cursor)
+            cursor.execute('SELECT count(*) FROM bsc_search')
+            indexed = cursor.fetchone()[0]
+        entries = sum(model.objects.count() for model in PERSPECTIVE_MODELS.values())
+        self.stdout.write(f'{indexed} of {entries} entries indexed')
+        if missing:
+            raise CommandError(f'Missing triggers: {", ".join(missing)}; run with --rebuild')
+        if indexed != entries:
+            raise CommandError('Index out of sync; run with --rebuild')
+        self.stdout.write(self.style.SUCCESS('Search index OK'))
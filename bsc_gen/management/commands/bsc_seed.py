@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bsc_gen.synthetic import seed_organization
+
+
+class Command(BaseCommand):
+    help = 'Generate reproducible synthetic organizations, batches and BSC entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orgs', type=int, default=3, help='Number of organizations')
+        parser.add_argument('--batches', type=int, default=12, help='Batches per organization')
+        parser.add_argument('--entries', type=int, default=200, help='Entries per batch')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--prefix', default='Seed Org', help='Organization name prefix')
+        parser.add_argument('--admin-password', default=None,
+                            help='Also create an admin user "<org>_admin" per organization with this password')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = 0
+        for i in range(1, options['orgs'] + 1):
+            name = f"{options['prefix']} {i}"
+            organization, admin, batch_ids = seed_organization(
+                name, options['batches'], options['entries'],
+                seed=options['seed'], admin_password=options['admin_password'],
+            )
+            total += len(batch_ids) * options['entries']
+            login = f' (login: {admin.username})' if admin else ''
+            self.stdout.write(f'{organization.name}: batches {batch_ids[0]}-{batch_ids[-1]}{login}' if batch_ids else organization.name)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Seeded {total} entries in {elapsed:.1f}s'))
@@ -0,0 +1,333 @@
+import cProfile
+import json
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from .models import UserProfile
+from .perf import QueryRecorder, registry
+from .routers import SAFE_METHODS, pin_to_primary, replica_aliases
+
+
+PROFILE_CACHE_PREFIX = 'bsc_profile:'
+# Stored in the cache for users without a profile so that we don't query for them again
+NO_PROFILE = 'none'
+
+
+def profile_cache_key(user_id):
+    return f'{PROFILE_CACHE_PREFIX}{user_id}'
+
+
+def invalidate_profile_cache(user_id):
+    cache.delete(profile_cache_key(user_id))
+
+
+def get_user_profile(user):
+    """Return the user's profile with its organization loaded, or None"""
+    key = profile_cache_key(user.pk)
+    profile = cache.get(key)
+    if profile is None:
+        profile = (
+            UserProfile.objects
+            .select_related('organization')
+            .filter(user_id=user.pk)
+            .first()
+        ) or NO_PROFILE
+        cache.set(key, profile, getattr(settings, 'BSC_PROFILE_CACHE_TTL', 60))
+    if profile == NO_PROFILE:
+        return None
+    # Reuse the user that AuthenticationMiddleware already loaded
+    profile.user = user
+    return profile
+
+
+async def aget_user_profile(user):
+    """Async version of get_user_profile"""
+    key = profile_cache_key(user.pk)
+    profile = await cache.aget(key)
+    if profile is None:
+        profile = await (
+            UserProfile.objects
+            .select_related('organization')
+            .filter(user_id=user.pk)
+            .afirst()
+        ) or NO_PROFILE
+        await cache.aset(key, profile, getattr(settings, 'BSC_PROFILE_CACHE_TTL', 60))
+    if profile == NO_PROFILE:
+        return None
+    profile.user = user
+    return profile
+
+
+class OrganizationMiddleware:
+    """
+    Resolve the profile, organization and role of the logged in user once per request.
+
+    Sets ``request.bsc_profile``, ``request.bsc_org`` and ``request.bsc_role``
+    (all None for anonymous users and users without a profile). Must come
+    after AuthenticationMiddleware. Works natively under ASGI so async views
+    don't get pushed onto a thread just for this lookup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = None
+        if request.user.is_authenticated:
+            profile = get_user_profile(request.user)
+        self.set_attributes(request, profile)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        profile = None
+        user = await request.auser()
+        if user.is_authenticated:
+            profile = await aget_user_profile(user)
+        self.set_attributes(request, profile)
+        return await self.get_response(request)
+
+    def set_attributes(self, request, profile):
+        request.bsc_profile = profile
+        request.bsc_org = profile.organization if profile else None
+        request.bsc_role = profile.role if profile else None
+
+
+class PerfMiddleware:
+    """
+    Record latency, SQL query count/time and response size per URL name.
+
+    Opt-in through ``BSC_PERF_ENABLED``. A ``BSC_PERF_MEMORY_SAMPLE_RATE`` share
+    of requests is also run under tracemalloc to record peak Python memory;
+    tracemalloc is process-wide, so concurrent requests inflate each other's peak.
+    Works natively under ASGI, so that being first in MIDDLEWARE doesn't turn
+    the whole chain synchronous.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BSC_PERF_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.memory_sample_rate = getattr(settings, 'BSC_PERF_MEMORY_SAMPLE_RATE', 0.0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        trace_memory = self.start_memory_trace()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.record_queries(stack, recorder)
+                response = self.get_response(request)
+            latency = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        self.observe(request, response, recorder, latency, peak_memory)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        trace_memory = self.start_memory_trace()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Queries run on the request's sync thread (sync views, the async ORM), which has connections of its own
+                await sync_to_async(self.record_queries)(stack, recorder)
+                response = await self.get_response(request)
+            latency = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        self.observe(request, response, recorder, latency, peak_memory)
+        return response
+
+    def start_memory_trace(self):
+        trace_memory = random.random() < self.memory_sample_rate and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        return trace_memory
+
+    def record_queries(self, stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def observe(self, request, response, recorder, latency, peak_memory):
+        metrics = {
+            'latency_seconds': latency,
+            'sql_queries': recorder.count,
+            'sql_seconds': recorder.duration,
+        }
+        if not response.streaming:
+            metrics['response_bytes'] = len(response.content)
+        if peak_memory is not None:
+            metrics['peak_memory_bytes'] = peak_memory
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(match.view_name if match else '<unresolved>', metrics)
+
+
+class ProfilerMiddleware:
+    """
+    Run a single request's view under cProfile for staff users.
+
+    Triggered by ``?__profile=1`` or an ``X-BSC-Profile: 1`` header. Writes a
+    ``.prof`` file (open it with snakeviz or pstats) and a JSON summary with
+    the hottest functions and the SQL queries to ``BSC_PROFILER_DIR``. Profiles
+    are limited per user per hour and in how many can run at once; requests
+    over the limit run normally. Keep this last in MIDDLEWARE so that the other
+    middleware's process_view hooks (CSRF and so on) still run.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BSC_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.output_dir = Path(getattr(settings, 'BSC_PROFILER_DIR', settings.BASE_DIR / 'profiles'))
+        self.max_per_hour = getattr(settings, 'BSC_PROFILER_MAX_PER_HOUR', 10)
+        self.slots = threading.BoundedSemaphore(getattr(settings, 'BSC_PROFILER_MAX_CONCURRENT', 1))
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        skipped = getattr(request, 'bsc_profile_skipped', None)
+        if skipped:
+            response['X-BSC-Profile-Skipped'] = skipped
+        return response
+
+    def wants_profile(self, request):
+        return (
+            (request.GET.get('__profile') == '1' or request.headers.get('X-BSC-Profile') == '1')
+            and request.user.is_authenticated
+            and request.user.is_staff
+        )
+
+    def within_hourly_limit(self, user_id):
+        key = f'bsc_profiler:{user_id}:{int(time.time() // 3600)}'
+        cache.add(key, 0, 3600)
+        return cache.incr(key) <= self.max_per_hour
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.wants_profile(request):
+            return None
+        if not self.within_hourly_limit(request.user.pk):
+            request.bsc_profile_skipped = 'rate-limited'
+            return None
+        if not self.slots.acquire(blocking=False):
+            request.bsc_profile_skipped = 'busy'
+            return None
+
+        try:
+            profiler = cProfile.Profile()
+            recorder = QueryRecorder(capture=True)
+            start = time.perf_counter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+            wall_time = time.perf_counter() - start
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        finally:
+            self.slots.release()
+
+        name = self.write_profile(request, profiler, recorder, wall_time)
+        response['X-BSC-Profile'] = name
+        return response
+
+    def write_profile(self, request, profiler, recorder, wall_time):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        view_name = request.resolver_match.view_name if request.resolver_match else 'unknown'
+        name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{view_name.replace(':', '_')}-{request.user.pk}"
+        profiler.dump_stats(self.output_dir / f'{name}.prof')
+
+        stats = pstats.Stats(profiler).stats
+        hottest = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:30]
+        repeated = Counter(query['sql'] for query in recorder.queries)
+        organization = getattr(request, 'bsc_org', None)
+        summary = {
+            'view': view_name,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'user': request.user.username,
+            'organization': organization.name if organization else None,
+            'profiled_at': timezone.now().isoformat(),
+            'wall_seconds': wall_time,
+            'sql': {
+                'count': recorder.count,
+                'seconds': recorder.duration,
+                'slowest': sorted(recorder.queries, key=lambda q: q['seconds'], reverse=True)[:20],
+                # The same statement over and over usually means an N+1 loop
+                'repeated': [{'sql': sql, 'count': count} for sql, count in repeated.most_common(10) if count > 1],
+            },
+            'functions': [
+                {
+                    'function': f'{filename}:{line}({func})',
+                    'calls': calls,
+                    'own_seconds': own_time,
+                    'cumulative_seconds': cumulative_time,
+                }
+                for (filename, line, func), (_, calls, own_time, cumulative_time, _) in hottest
+            ],
+        }
+        with open(self.output_dir / f'{name}.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        return name
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin clients to the primary database for a few seconds after they write.
+
+    Successful non-GET requests get a ``bsc_primary_until`` cookie that makes
+    @replica_reads views read from the primary until it expires, so the next
+    page shows what was just saved. Unused when no replicas are configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(response)
+        return response
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:38
+
+import django.db.models.deletion
+import math
+
+from django.db import migrations, models
+
+
+def to_number(value):
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def fill_numeric_values(apps, schema_editor):
+    for name in ('FinancialBSC', 'CustomerBSC', 'InternalBSC', 'LearningGrowthBSC'):
+        model = apps.get_model('bsc_gen', name)
+        updated = []
+        for entry in model.objects.only('target', 'actual').iterator(chunk_size=2000):
+            entry.target_value = to_number(entry.target)
+            entry.actual_value = to_number(entry.actual)
+            updated.append(entry)
+            if len(updated) >= 2000:
+                model.objects.bulk_update(updated, ['target_value', 'actual_value'])
+                updated = []
+        model.objects.bulk_update(updated, ['target_value', 'actual_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0006_actionplan_performancereview_strategymap_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerbsc',
+            name='actual_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerbsc',
+            name='target_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='actual_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='target_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='actual_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='target_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='actual_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='target_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=10)),
+                ('perspective', models.CharField(max_length=50)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('scored_entries', models.PositiveIntegerField(default=0)),
+                ('weight_total', models.FloatField(default=0)),
+                ('weighted_attainment', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'batch_id', 'perspective'), name='unique_score_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0008_bsc_updated_at_alertscanstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StrategyLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_perspective', models.CharField(max_length=50)),
+                ('source_objective', models.CharField(max_length=255)),
+                ('target_perspective', models.CharField(max_length=50)),
+                ('target_objective', models.CharField(max_length=255)),
+                ('strength', models.FloatField(default=1.0, help_text='Relative weight of this driver')),
+                ('strategy_map', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to='bsc_gen.strategymap')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('strategy_map', 'source_perspective', 'source_objective', 'target_perspective', 'target_objective'), name='unique_strategy_link')],
+            },
+        ),
+    ]
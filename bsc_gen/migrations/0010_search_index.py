@@ -0,0 +1,93 @@
+# Full-text search index, see bsc_gen/search.py
+
+from django.db import migrations
+
+
+# (table, perspective, slot): FTS rowids are entry id * 4 + slot
+TABLES = [
+    ('bsc_gen_financialbsc', 'Financial', 0),
+    ('bsc_gen_customerbsc', 'Customer', 1),
+    ('bsc_gen_internalbsc', 'Internal', 2),
+    ('bsc_gen_learninggrowthbsc', 'Learning & Growth', 3),
+]
+SEARCH_EXPRESSION = "(objective || ' ' || measure || ' ' || coalesce(owner, '') || ' ' || coalesce(batch_name, ''))"
+
+
+def fts_values(row, perspective, slot):
+    return (
+        f"{row}.id * 4 + {slot}, "
+        f"'o' || coalesce({row}.organization_id, '') || ' b' || coalesce({row}.batch_id, ''), "
+        f"{row}.objective, {row}.measure, coalesce({row}.owner, ''), coalesce({row}.batch_name, ''), "
+        f"'{perspective}', {row}.id"
+    )
+
+
+def sqlite_statements():
+    insert = 'INSERT INTO bsc_search(rowid, scope, objective, measure, owner, batch_name, perspective, entry_id)'
+    yield (
+        "CREATE VIRTUAL TABLE bsc_search USING fts5("
+        "scope, objective, measure, owner, batch_name, perspective UNINDEXED, entry_id UNINDEXED, "
+        "prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    for table, perspective, slot in TABLES:
+        yield f"{insert} SELECT {fts_values(table, perspective, slot)} FROM {table}"
+        yield (
+            f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"{insert} VALUES ({fts_values('new', perspective, slot)}); END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_au AFTER UPDATE OF objective, measure, owner, batch_name, batch_id, organization_id "
+            f"ON {table} BEGIN DELETE FROM bsc_search WHERE rowid = old.id * 4 + {slot}; "
+            f"{insert} VALUES ({fts_values('new', perspective, slot)}); END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM bsc_search WHERE rowid = old.id * 4 + {slot}; END"
+        )
+
+
+def postgresql_statements():
+    yield 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+    for table, _, _ in TABLES:
+        yield f'CREATE INDEX {table}_search_trgm ON {table} USING gin ({SEARCH_EXPRESSION} gin_trgm_ops)'
+        yield f'CREATE INDEX {table}_owner_trgm ON {table} USING gin (owner gin_trgm_ops)'
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': sqlite_statements, 'postgresql': postgresql_statements}.get(vendor)
+    if statements is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # search.py falls back to LIKE queries
+                return
+        for statement in statements():
+            cursor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            for table, _, _ in TABLES:
+                for suffix in ('ai', 'au', 'ad'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {table}_search_{suffix}')
+            cursor.execute('DROP TABLE IF EXISTS bsc_search')
+        elif vendor == 'postgresql':
+            for table, _, _ in TABLES:
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_search_trgm')
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_owner_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0009_strategylink'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Trim
+
+
+PERSPECTIVE_MODELS = ('FinancialBSC', 'CustomerBSC', 'InternalBSC', 'LearningGrowthBSC')
+DIMENSIONS = (('objective', 'Objective'), ('measure', 'Measure'), ('owner', 'Owner'))
+
+
+def fill_dimensions(apps, schema_editor):
+    """Create the dictionary rows of existing data, then point every entry at them with one UPDATE per column"""
+    for field, dimension_name in DIMENSIONS:
+        dimension = apps.get_model('bsc_gen', dimension_name)
+        names = set()
+        for name in PERSPECTIVE_MODELS:
+            model = apps.get_model('bsc_gen', name)
+            names.update(
+                (organization_id, value.strip()[:255])
+                for organization_id, value in model.objects.exclude(organization=None).values_list('organization_id', field).distinct()
+                if value and value.strip()
+            )
+        dimension.objects.bulk_create(
+            [dimension(organization_id=organization_id, name=value) for organization_id, value in names],
+            batch_size=1000, ignore_conflicts=True,
+        )
+        for name in PERSPECTIVE_MODELS:
+            model = apps.get_model('bsc_gen', name)
+            model.objects.exclude(organization=None).update(**{f'{field}_ref': Subquery(
+                dimension.objects.filter(organization=OuterRef('organization'), name=Trim(OuterRef(field))).values('pk')[:1]
+            )})
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    """Removing the *_ref fields rebuilds the perspective tables on SQLite, dropping the bsc_search triggers of 0010"""
+    from bsc_gen import search
+
+    search.restore_sqlite_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0010_search_index'),
+    ]
+
+    operations = [
+        # First, so that it runs last when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, reinstall_search_triggers),
+        migrations.CreateModel(
+            name='Measure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='customerbsc',
+            name='measure_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.measure'),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='measure_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.measure'),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='measure_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.measure'),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='measure_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.measure'),
+        ),
+        migrations.CreateModel(
+            name='Objective',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='customerbsc',
+            name='objective_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.objective'),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='objective_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.objective'),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='objective_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.objective'),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='objective_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.objective'),
+        ),
+        migrations.CreateModel(
+            name='Owner',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='customerbsc',
+            name='owner_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.owner'),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='owner_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.owner'),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='owner_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.owner'),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='owner_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bsc_gen.owner'),
+        ),
+        migrations.AddConstraint(
+            model_name='measure',
+            constraint=models.UniqueConstraint(fields=('organization', 'name'), name='unique_measure_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='objective',
+            constraint=models.UniqueConstraint(fields=('organization', 'name'), name='unique_objective_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='owner',
+            constraint=models.UniqueConstraint(fields=('organization', 'name'), name='unique_owner_name'),
+        ),
+        migrations.RunPython(fill_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:52
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+PERSPECTIVES = {
+    'FinancialBSC': 'Financial',
+    'CustomerBSC': 'Customer',
+    'InternalBSC': 'Internal',
+    'LearningGrowthBSC': 'Learning & Growth',
+}
+
+
+def status(actual, target):
+    if actual is None or target is None:
+        return 'unknown'
+    if actual >= 1.2 * target:
+        return 'blue'
+    if actual >= target:
+        return 'good'
+    if actual >= 0.8 * target:
+        return 'moderate'
+    return 'bad'
+
+
+def fill_status_counts(apps, schema_editor):
+    ScoreRollup = apps.get_model('bsc_gen', 'ScoreRollup')
+    counts = Counter()
+    for name, perspective in PERSPECTIVES.items():
+        model = apps.get_model('bsc_gen', name)
+        for organization_id, batch_id, target, actual in model.objects.exclude(batch_id=None).values_list(
+            'organization_id', 'batch_id', 'target_value', 'actual_value',
+        ).iterator(chunk_size=2000):
+            counts[(organization_id, batch_id, perspective, status(actual, target))] += 1
+    rows = list(ScoreRollup.objects.all())
+    for row in rows:
+        for name in ('blue', 'good', 'moderate', 'bad', 'unknown'):
+            setattr(row, f'{name}_entries', counts[(row.organization_id, row.batch_id, row.perspective, name)])
+    ScoreRollup.objects.bulk_update(
+        rows, ['blue_entries', 'good_entries', 'moderate_entries', 'bad_entries', 'unknown_entries'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0011_dimension_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scorerollup',
+            name='bad_entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scorerollup',
+            name='blue_entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scorerollup',
+            name='good_entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scorerollup',
+            name='moderate_entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scorerollup',
+            name='unknown_entries',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='customerbsc',
+            index=models.Index(fields=['organization', 'batch_id', 'id'], name='customerbsc_org_batch'),
+        ),
+        migrations.AddIndex(
+            model_name='customerbsc',
+            index=models.Index(fields=['organization', 'objective', 'id'], name='customerbsc_org_obj'),
+        ),
+        migrations.AddIndex(
+            model_name='customerbsc',
+            index=models.Index(fields=['organization', 'owner', 'id'], name='customerbsc_org_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='customerbsc',
+            index=models.Index(fields=['organization', 'actual_value', 'id'], name='customerbsc_org_actual'),
+        ),
+        migrations.AddIndex(
+            model_name='customerbsc',
+            index=models.Index(fields=['organization', 'updated_at', 'id'], name='customerbsc_org_upd'),
+        ),
+        migrations.AddIndex(
+            model_name='financialbsc',
+            index=models.Index(fields=['organization', 'batch_id', 'id'], name='financialbsc_org_batch'),
+        ),
+        migrations.AddIndex(
+            model_name='financialbsc',
+            index=models.Index(fields=['organization', 'objective', 'id'], name='financialbsc_org_obj'),
+        ),
+        migrations.AddIndex(
+            model_name='financialbsc',
+            index=models.Index(fields=['organization', 'owner', 'id'], name='financialbsc_org_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='financialbsc',
+            index=models.Index(fields=['organization', 'actual_value', 'id'], name='financialbsc_org_actual'),
+        ),
+        migrations.AddIndex(
+            model_name='financialbsc',
+            index=models.Index(fields=['organization', 'updated_at', 'id'], name='financialbsc_org_upd'),
+        ),
+        migrations.AddIndex(
+            model_name='internalbsc',
+            index=models.Index(fields=['organization', 'batch_id', 'id'], name='internalbsc_org_batch'),
+        ),
+        migrations.AddIndex(
+            model_name='internalbsc',
+            index=models.Index(fields=['organization', 'objective', 'id'], name='internalbsc_org_obj'),
+        ),
+        migrations.AddIndex(
+            model_name='internalbsc',
+            index=models.Index(fields=['organization', 'owner', 'id'], name='internalbsc_org_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='internalbsc',
+            index=models.Index(fields=['organization', 'actual_value', 'id'], name='internalbsc_org_actual'),
+        ),
+        migrations.AddIndex(
+            model_name='internalbsc',
+            index=models.Index(fields=['organization', 'updated_at', 'id'], name='internalbsc_org_upd'),
+        ),
+        migrations.AddIndex(
+            model_name='learninggrowthbsc',
+            index=models.Index(fields=['organization', 'batch_id', 'id'], name='learninggrowthbsc_org_batch'),
+        ),
+        migrations.AddIndex(
+            model_name='learninggrowthbsc',
+            index=models.Index(fields=['organization', 'objective', 'id'], name='learninggrowthbsc_org_obj'),
+        ),
+        migrations.AddIndex(
+            model_name='learninggrowthbsc',
+            index=models.Index(fields=['organization', 'owner', 'id'], name='learninggrowthbsc_org_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='learninggrowthbsc',
+            index=models.Index(fields=['organization', 'actual_value', 'id'], name='learninggrowthbsc_org_actual'),
+        ),
+        migrations.AddIndex(
+            model_name='learninggrowthbsc',
+            index=models.Index(fields=['organization', 'updated_at', 'id'], name='learninggrowthbsc_org_upd'),
+        ),
+        migrations.RunPython(fill_status_counts, migrations.RunPython.noop),
+    ]
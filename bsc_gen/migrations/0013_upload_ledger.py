@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0012_explorer_indexes_status_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('batch_id', models.CharField(max_length=10)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'file_hash'], name='uploadledger_org_file'), models.Index(fields=['organization', 'content_hash'], name='uploadledger_org_content')],
+            },
+        ),
+    ]
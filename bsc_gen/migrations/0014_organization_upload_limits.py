@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0013_upload_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='max_upload_mb',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='max_upload_rows',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, F, Q, Value, When
+
+
+def fill_statuses(apps, schema_editor):
+    # The default bands, one UPDATE per table
+    target = F('target_value')
+    status = Case(
+        When(Q(actual_value__isnull=True) | Q(target_value__isnull=True), then=Value('unknown')),
+        When(actual_value__gte=target * 1.2, then=Value('blue')),
+        When(actual_value__gte=target, then=Value('good')),
+        When(actual_value__gte=target * 0.8, then=Value('moderate')),
+        default=Value('bad'),
+    )
+    for name in ('FinancialBSC', 'CustomerBSC', 'InternalBSC', 'LearningGrowthBSC'):
+        apps.get_model('bsc_gen', name).objects.update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0014_organization_upload_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerbsc',
+            name='status',
+            field=models.CharField(default='unknown', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='financialbsc',
+            name='status',
+            field=models.CharField(default='unknown', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='internalbsc',
+            name='status',
+            field=models.CharField(default='unknown', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='learninggrowthbsc',
+            name='status',
+            field=models.CharField(default='unknown', editable=False, max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ThresholdPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('measure', models.CharField(blank=True, max_length=255)),
+                ('direction', models.CharField(choices=[('higher', 'Higher is better'), ('lower', 'Lower is better')], default='higher', max_length=10)),
+                ('blue_at', models.FloatField(default=1.2)),
+                ('good_at', models.FloatField(default=1.0)),
+                ('moderate_at', models.FloatField(default=0.8)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'measure'), name='unique_threshold_policy')],
+            },
+        ),
+        migrations.RunPython(fill_statuses, migrations.RunPython.noop),
+    ]
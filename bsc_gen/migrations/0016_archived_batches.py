@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0015_threshold_policies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=10)),
+                ('batch_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('upload_time', models.DateTimeField(blank=True, null=True)),
+                ('last_updated', models.DateTimeField(blank=True, null=True)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('perspectives', models.JSONField(default=dict)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.PositiveBigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'batch_id'), name='unique_archived_batch')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# AddField in 0015 rebuilt the perspective tables on SQLite, which dropped the
+# bsc_search triggers of 0010; entries written since then were not indexed.
+
+from django.db import migrations
+
+
+def restore_triggers(apps, schema_editor):
+    from bsc_gen import search
+
+    search.restore_sqlite_triggers(schema_editor.connection, rebuild=True)
+
+
+def reinstall_triggers(apps, schema_editor):
+    from bsc_gen import search
+
+    search.restore_sqlite_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0016_archived_batches'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, reinstall_triggers),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bsc_gen', '0017_restore_search_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=1, editable=False),
+        ),
+        migrations.CreateModel(
+            name='DataChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('type', models.CharField(max_length=30)),
+                ('batch_id', models.CharField(blank=True, max_length=10, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bsc_gen.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'version'), name='unique_data_change')],
+            },
+        ),
+    ]
@@ -1,8 +1,25 @@
+import math
+
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 
 class Organization(models.Model):
     name = models.CharField(max_length=255, unique=True)
+    # Upload limits per file; None falls back to BSC_UPLOAD_MAX_BYTES / BSC_UPLOAD_MAX_ROWS
+    max_upload_mb = models.PositiveIntegerField(blank=True, null=True)
+    max_upload_rows = models.PositiveIntegerField(blank=True, null=True)
+    # Bumped with every published change (bsc_gen.events.bump_data_version); caches of derived data key on it
+    data_version = models.PositiveBigIntegerField(default=1, editable=False)
+
+    def save(self, *args, **kwargs):
+        # A stale instance must not write an older data_version back
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'data_version'
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -19,6 +36,100 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} ({self.role}) - {self.organization.name}"
 
+class StrategyMap(models.Model):
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+class ActionPlan(models.Model):
+    STATUS_CHOICES = (
+        ('not_started', 'Not Started'),
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+        ('on_hold', 'On Hold'),
+    )
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assigned_actions')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_actions')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='not_started')
+    due_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
+
+class PerformanceReview(models.Model):
+    STATUS_CHOICES = (
+        ('scheduled', 'Scheduled'),
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    )
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_conducted')
+    scheduled_date = models.DateTimeField()
+    completed_date = models.DateTimeField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    batch_id = models.CharField(max_length=10, blank=True, null=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+class StrategyLink(models.Model):
+    """Cause-and-effect edge of a strategy map: the source objective drives the target objective"""
+    strategy_map = models.ForeignKey(StrategyMap, on_delete=models.CASCADE, related_name='links')
+    source_perspective = models.CharField(max_length=50)
+    source_objective = models.CharField(max_length=255)
+    target_perspective = models.CharField(max_length=50)
+    target_objective = models.CharField(max_length=255)
+    strength = models.FloatField(default=1.0, help_text="Relative weight of this driver")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['strategy_map', 'source_perspective', 'source_objective', 'target_perspective', 'target_objective'],
+                name='unique_strategy_link',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.source_objective} -> {self.target_objective}"
+
+# Dictionary tables for the strings uploads repeat batch after batch, see bsc_gen.dimensions
+class DimensionBase(models.Model):
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'name'], name='unique_%(class)s_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class Objective(DimensionBase):
+    pass
+
+class Measure(DimensionBase):
+    pass
+
+class Owner(DimensionBase):
+    pass
+
 # Base class for common BSC fields
 class BSCBase(models.Model):
     objective = models.CharField(max_length=255)
@@ -30,25 +141,75 @@ class BSCBase(models.Model):
     batch_id = models.CharField(max_length=10, blank=True, null=True)
     batch_name = models.CharField(max_length=255, blank=True, null=True)
     upload_time = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    # High-water mark of the alert scanner; bulk_update and update() callers must set it themselves
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+    # target/actual parsed as numbers, kept in sync by parse_values(); None when not numeric
+    target_value = models.FloatField(blank=True, null=True)
+    actual_value = models.FloatField(blank=True, null=True)
+    weight = models.DecimalField(max_digits=5, decimal_places=2, default=1.0, help_text="Importance weight (0.1 to 5.0)")
+    # Under the organization's ThresholdPolicy bands, stored by rollup.recompute() (see bsc_gen.thresholds)
+    status = models.CharField(max_length=10, default='unknown', editable=False)
+    alert_threshold = models.DecimalField(max_digits=5, decimal_places=2, default=0.8, help_text="Alert when performance drops below this ratio")
+    benchmark_value = models.CharField(max_length=255, blank=True, null=True, help_text="Industry benchmark value")
+    is_smart_goal = models.BooleanField(default=False, help_text="Indicates if this is a SMART goal")
+    last_alert_sent = models.DateTimeField(blank=True, null=True)
+    action_plans = models.ManyToManyField(ActionPlan, blank=True, related_name='%(class)s_objectives')
+    strategy_map = models.ForeignKey(StrategyMap, on_delete=models.SET_NULL, null=True, blank=True)
+    # Integer keys of objective/measure/owner, maintained when BSC_NORMALIZED_DIMENSIONS is on
+    objective_ref = models.ForeignKey(Objective, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    measure_ref = models.ForeignKey(Measure, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    owner_ref = models.ForeignKey(Owner, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
     class Meta:
         abstract = True
+        # (organization, sort column, id) for the keyset-paginated entry explorer
+        indexes = [
+            models.Index(fields=['organization', 'batch_id', 'id'], name='%(class)s_org_batch'),
+            models.Index(fields=['organization', 'objective', 'id'], name='%(class)s_org_obj'),
+            models.Index(fields=['organization', 'owner', 'id'], name='%(class)s_org_owner'),
+            models.Index(fields=['organization', 'actual_value', 'id'], name='%(class)s_org_actual'),
+            models.Index(fields=['organization', 'updated_at', 'id'], name='%(class)s_org_upd'),
+        ]
 
     def get_status(self):
-        try:
-            actual_val = float(self.actual)
-            target_val = float(self.target)
-            if actual_val >= 1.2 * target_val:
-                return 'blue'
-            elif actual_val >= target_val:
-                return 'good'
-            elif actual_val >= 0.8 * target_val:
-                return 'moderate'
-            else:
-                return 'bad'
-        except (ValueError, TypeError):
-            return 'unknown'
+        return self.status
+
+    def parse_values(self):
+        """Refresh target_value/actual_value; bulk_create/bulk_update callers must call this themselves"""
+        self.target_value = parse_number(self.target)
+        self.actual_value = parse_number(self.actual)
+
+    def save(self, *args, **kwargs):
+        self.parse_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'target', 'actual'} & update_fields:
+                update_fields |= {'target_value', 'actual_value'}
+            # The *_ref keys are set by a pre_save receiver (signals.py)
+            update_fields |= {f'{field}_ref' for field in ('objective', 'measure', 'owner') if field in update_fields}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+def parse_number(value):
+    """float(value), or None for blanks, text and NaN/infinity"""
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+STATUSES = ['blue', 'good', 'moderate', 'bad', 'unknown']
+
+
+def status_filter(status):
+    """Q matching the entries with stored status ``status``"""
+    if status not in STATUSES:
+        raise ValueError(f'Unknown status {status!r}')
+    return Q(status=status)
 
 # Financial Perspective
 class FinancialBSC(BSCBase):
@@ -84,4 +245,165 @@ class LearningGrowthBSC(BSCBase):
     innovation_indicator = models.CharField(max_length=255, blank=True, help_text="Innovation indicator")
 
     def __str__(self):
-        return f"Learning & Growth - {self.objective}"
\ No newline at end of file
+        return f"Learning & Growth - {self.objective}"
+
+# Perspective name -> table, in the order perspectives are shown everywhere
+PERSPECTIVE_MODELS = {
+    'Financial': FinancialBSC,
+    'Customer': CustomerBSC,
+    'Internal': InternalBSC,
+    'Learning & Growth': LearningGrowthBSC,
+}
+
+
+class ScoreRollup(models.Model):
+    """
+    Weighted attainment and status counts of one perspective of one batch, maintained by bsc_gen.rollup.
+
+    Batch and organization scores are sums over these rows, so an edit only
+    ever recomputes the row of its own batch and perspective.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    batch_id = models.CharField(max_length=10)
+    perspective = models.CharField(max_length=50)
+    entries = models.PositiveIntegerField(default=0)
+    scored_entries = models.PositiveIntegerField(default=0)
+    weight_total = models.FloatField(default=0)
+    weighted_attainment = models.FloatField(default=0)
+    # entries per stored status
+    blue_entries = models.PositiveIntegerField(default=0)
+    good_entries = models.PositiveIntegerField(default=0)
+    moderate_entries = models.PositiveIntegerField(default=0)
+    bad_entries = models.PositiveIntegerField(default=0)
+    unknown_entries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'batch_id', 'perspective'], name='unique_score_rollup'),
+        ]
+
+    @property
+    def score(self):
+        return self.weighted_attainment / self.weight_total if self.weight_total else None
+
+    def __str__(self):
+        return f"{self.organization_id} {self.batch_id} {self.perspective}"
+
+
+class ThresholdPolicy(models.Model):
+    """
+    Status bands of an organization's measure, or of all its other measures when ``measure`` is blank.
+
+    Higher is better: an actual at or over ``blue_at`` x target is blue, then
+    ``good_at`` and ``moderate_at``, else bad. Lower is better: at or under.
+    After saving or deleting one, call thresholds.reevaluate() - the thresholds API does.
+    """
+    DIRECTION_CHOICES = (
+        ('higher', 'Higher is better'),
+        ('lower', 'Lower is better'),
+    )
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    measure = models.CharField(max_length=255, blank=True)
+    direction = models.CharField(max_length=10, choices=DIRECTION_CHOICES, default='higher')
+    blue_at = models.FloatField(default=1.2)
+    good_at = models.FloatField(default=1.0)
+    moderate_at = models.FloatField(default=0.8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'measure'], name='unique_threshold_policy'),
+        ]
+
+    def clean(self):
+        cut_offs = [self.blue_at, self.good_at, self.moderate_at]
+        if not all(math.isfinite(cut_off) and cut_off >= 0 for cut_off in cut_offs):
+            raise ValidationError('Cut-offs must be non-negative numbers')
+        if cut_offs != sorted(cut_offs, reverse=self.direction == 'higher'):
+            order = 'blue_at >= good_at >= moderate_at' if self.direction == 'higher' else 'blue_at <= good_at <= moderate_at'
+            raise ValidationError(f'Cut-offs must satisfy {order}')
+
+    def __str__(self):
+        return f"{self.organization_id} {self.measure or '(all measures)'} {self.direction}"
+
+
+class DataChange(models.Model):
+    """One entry of an organization's recent change log, see bsc_gen.events.changes_since"""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    version = models.PositiveBigIntegerField()
+    type = models.CharField(max_length=30)
+    batch_id = models.CharField(max_length=10, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'version'], name='unique_data_change'),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} v{self.version} {self.type} {self.batch_id or ''}"
+
+
+class AlertScanState(models.Model):
+    """How far the alert scanner (bsc_gen.alerts) got in one perspective table"""
+    table = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField(blank=True, null=True)
+    last_run = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table} @ {self.high_water}"
+
+
+class ArchivedBatch(models.Model):
+    """
+    What stays in the database of a batch moved to cold storage, see bsc_gen.archive.
+
+    The entries themselves are in ``file_name`` (a Parquet file under
+    BSC_ARCHIVE_DIR) until the batch is restored, which deletes this row.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    batch_id = models.CharField(max_length=10)
+    batch_name = models.CharField(max_length=255, blank=True, null=True)
+    upload_time = models.DateTimeField(blank=True, null=True)
+    # Latest updated_at of its entries when archived
+    last_updated = models.DateTimeField(blank=True, null=True)
+    entries = models.PositiveIntegerField(default=0)
+    # {perspective: entries}
+    perspectives = models.JSONField(default=dict)
+    file_name = models.CharField(max_length=255)
+    file_size = models.PositiveBigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'batch_id'], name='unique_archived_batch'),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.batch_id} ({self.entries} entries)"
+
+
+class UploadLedger(models.Model):
+    """
+    SHA-256 of an uploaded file and of its normalized rows -> the batch it became, see bsc_gen.dedup.
+
+    Re-uploading either the same bytes or the same rows returns that batch
+    instead of creating a copy. Rows are deleted with their batch and when it is edited or merged into.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    file_hash = models.CharField(max_length=64)
+    content_hash = models.CharField(max_length=64, blank=True)
+    batch_id = models.CharField(max_length=10)
+    file_name = models.CharField(max_length=255, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'file_hash'], name='uploadledger_org_file'),
+            models.Index(fields=['organization', 'content_hash'], name='uploadledger_org_content'),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.file_name} -> {self.batch_id}"
@@ -0,0 +1,267 @@
+"""
+In-process request metrics for PerfMiddleware.
+
+Every metric is kept as a fixed-bucket histogram (the same layout Prometheus
+uses) so that histograms from several worker processes can be merged by just
+adding up their bucket counts.
+
+Each process writes its histograms to ``perf-<host>-<pid>.json`` in
+BSC_PERF_SNAPSHOT_DIR. Files of processes that no longer run on this host, and
+files not rewritten for BSC_PERF_SNAPSHOT_MAX_AGE seconds, are deleted on
+every flush and by bsc_perf_report, so restarted workers don't pile up.
+"""
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Bucket upper bounds per metric, +Inf is implied
+BUCKETS = {
+    'latency_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    'sql_queries': (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+    'sql_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'response_bytes': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+    'peak_memory_bytes': (1048576, 4194304, 16777216, 67108864, 268435456, 1073741824),
+}
+
+METRIC_HELP = {
+    'latency_seconds': 'Request latency in seconds',
+    'sql_queries': 'Number of SQL queries per request',
+    'sql_seconds': 'Total SQL time per request in seconds',
+    'response_bytes': 'Response body size in bytes',
+    'peak_memory_bytes': 'Peak traced Python memory per sampled request',
+}
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        for attr, pick in (('min', min), ('max', max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                ours = getattr(self, attr)
+                setattr(self, attr, theirs if ours is None else pick(ours, theirs))
+
+    def percentile(self, q):
+        """Estimate the q-th percentile (0-100) by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else (self.min or 0)
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def to_dict(self):
+        return {
+            'bounds': list(self.bounds),
+            'counts': self.counts,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['bounds'])
+        histogram.counts = list(data['counts'])
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class PerfRegistry:
+    """Histograms keyed by (url name, metric), shared by all threads of the process"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def observe(self, view_name, metrics):
+        with self.lock:
+            for metric, value in metrics.items():
+                key = (view_name, metric)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(BUCKETS[metric])
+                self.histograms[key].observe(value)
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                f'{view_name}|{metric}': histogram.to_dict()
+                for (view_name, metric), histogram in self.histograms.items()
+            }
+
+    def maybe_flush(self):
+        """Write this process's histograms to BSC_PERF_SNAPSHOT_DIR so bsc_perf_report can read them"""
+        snapshot_dir = getattr(settings, 'BSC_PERF_SNAPSHOT_DIR', None)
+        interval = getattr(settings, 'BSC_PERF_FLUSH_INTERVAL', 30)
+        if not snapshot_dir or time.monotonic() - self.last_flush < interval:
+            return
+        self.last_flush = time.monotonic()
+        write_snapshot(snapshot_dir, self.snapshot())
+        prune_snapshots(snapshot_dir)
+
+    def prometheus_text(self):
+        with self.lock:
+            items = sorted(self.histograms.items())
+        lines = []
+        documented = set()
+        for (view_name, metric), histogram in items:
+            name = f'bsc_{metric}'
+            if name not in documented:
+                documented.add(name)
+                lines.append(f'# HELP {name} {METRIC_HELP[metric]}')
+                lines.append(f'# TYPE {name} histogram')
+            label = view_name.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{view="{label}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{view="{label}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = PerfRegistry()
+
+
+def write_snapshot(snapshot_dir, snapshot):
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    path = snapshot_dir / f'perf-{socket.gethostname()}-{os.getpid()}.json'
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'written_at': time.time(), 'histograms': snapshot}, f)
+    os.replace(tmp_path, path)
+
+
+def snapshot_max_age():
+    return getattr(settings, 'BSC_PERF_SNAPSHOT_MAX_AGE', 3600)
+
+
+def snapshot_owner(path):
+    """(host, pid) from a snapshot file name; host is None for the older perf-<pid>.json files"""
+    host, _, pid = path.stem[len('perf-'):].rpartition('-')
+    return host or None, int(pid) if pid.isdigit() else None
+
+
+def pid_running(pid):
+    """Whether process ``pid`` exists on this host (assumed where that can't be checked)"""
+    if os.name != 'posix':
+        return True  # os.kill() would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def prune_snapshots(snapshot_dir, max_age=None):
+    """
+    Delete the snapshot files of processes no longer running on this host and
+    those older than ``max_age`` seconds (BSC_PERF_SNAPSHOT_MAX_AGE); returns
+    how many. Files of other hosts sharing the directory only expire by age.
+    """
+    max_age = snapshot_max_age() if max_age is None else max_age
+    now = time.time()
+    hostname = socket.gethostname()
+    removed = 0
+    for path in Path(snapshot_dir).glob('perf-*'):
+        if path.suffix not in ('.json', '.tmp'):
+            continue
+        host, pid = snapshot_owner(path)
+        try:
+            age = now - path.stat().st_mtime
+        except FileNotFoundError:  # pruned by another process meanwhile
+            continue
+        gone = host in (None, hostname) and pid is not None and pid != os.getpid() and not pid_running(pid)
+        if gone or age > max_age:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def load_snapshots(snapshot_dir):
+    """Merge the snapshot files of every worker process into {(view, metric): Histogram}"""
+    merged = {}
+    for path in sorted(Path(snapshot_dir).glob('perf-*.json')):
+        try:
+            with open(path) as f:
+                histograms = json.load(f)['histograms']
+        except FileNotFoundError:  # pruned by a worker meanwhile
+            continue
+        for key, data in histograms.items():
+            view_name, metric = key.rsplit('|', 1)
+            histogram = Histogram.from_dict(data)
+            if (view_name, metric) in merged:
+                merged[(view_name, metric)].merge(histogram)
+            else:
+                merged[(view_name, metric)] = histogram
+    return merged
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` callback counting queries and the time spent in them.
+
+    With ``capture=True`` the SQL and duration of each query is kept as well.
+    """
+
+    def __init__(self, capture=False):
+        self.capture = capture
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.capture:
+                self.queries.append({
+                    'sql': sql,
+                    'many': many,
+                    'seconds': elapsed,
+                    'alias': context['connection'].alias,
+                })
@@ -0,0 +1,355 @@
+"""
+Pivot tables (cross-tabs) over the entries of an organization.
+
+A pivot names row and column dimensions - perspective, batch, objective,
+measure, owner, status, month, year - and one aggregate. Most aggregates are
+computed by the database: one GROUP BY query per perspective table returns
+additive partials (sums, counts, minimums) per cell, which are merged across
+the tables and folded into the row, column and grand totals, so no total is
+an average of averages. Medians and standard deviations don't fold that way
+(and SQLite has neither); for those the entries' dimensions and the one value
+aggregated are read as one narrow ``values()`` projection and grouped with pandas.
+With normalized dimensions on, objective, measure and owner are grouped and
+filtered on their integer keys and the names are looked up for the result
+(see dimensions.py).
+
+Attainment is the capped, direction-aware attainment of the weighted scores
+(see rollup.py and thresholds.py). Results are kept in a size-bounded
+in-process LRU keyed by the organization, its data version and the
+normalized query. The version is read from the database (see events.py), so
+every write - from this process, another worker, bsc_import or bsc_archive -
+makes the organization's cached pivots stale at once. Entries without a batch and archived batches are left
+out, as in the explorer.
+"""
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import Cast, ExtractYear, TruncMonth
+
+from . import rollup
+from .dimensions import DIMENSIONS as DICTIONARY_FIELDS, key_column, key_filter, key_names
+from .events import data_version
+from .models import PERSPECTIVE_MODELS, STATUSES, status_filter
+from .thresholds import Policies
+
+
+DIMENSIONS = ['perspective', 'batch', 'objective', 'measure', 'owner', 'status', 'month', 'year']
+FILTERS = ['perspective', 'batch_id', 'measure', 'owner']
+MAX_DIMENSIONS = 4
+PERSPECTIVES = list(PERSPECTIVE_MODELS)
+# aggregate -> (value, pandas function), for the aggregates computed with pandas
+PANDAS_AGGREGATES = {
+    'median_attainment': ('attainment', 'median'),
+    'std_attainment': ('attainment', 'std'),
+    'median_actual': ('actual', 'median'),
+}
+
+
+class PivotError(ValueError):
+    pass
+
+
+class LRUCache:
+    """Thread-safe mapping keeping the ``size`` most recently used entries"""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+results = LRUCache(getattr(settings, 'BSC_PIVOT_CACHE_SIZE', 128))
+
+
+def max_cells():
+    return getattr(settings, 'BSC_PIVOT_MAX_CELLS', 10000)
+
+
+def add(a, b):
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+def smallest(a, b):
+    if a is None:
+        return b
+    return a if b is None else min(a, b)
+
+
+def largest(a, b):
+    if a is None:
+        return b
+    return a if b is None else max(a, b)
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def sql_aggregates(policies):
+    """aggregate -> ({partial: (expression, merge)}, finish), finish turning merged partials into the value"""
+    scored = rollup.scored_filter()
+    attainment = rollup.attainment_expression(policies)
+    weight = Cast('weight', FloatField())
+    return {
+        'count': ({}, lambda partials: partials['entries']),
+        'avg_attainment': (
+            {
+                'total': (Sum(attainment, filter=scored, output_field=FloatField()), add),
+                'scored': (Count('id', filter=scored), add),
+            },
+            lambda partials: ratio(partials['total'], partials['scored']),
+        ),
+        'weighted_attainment': (
+            {
+                'total': (Sum(weight * attainment, filter=scored, output_field=FloatField()), add),
+                'weight': (Sum(weight, filter=scored), add),
+            },
+            lambda partials: ratio(partials['total'], partials['weight']),
+        ),
+        'sum_actual': ({'total': (Sum('actual_value'), add)}, lambda partials: partials['total']),
+        'sum_target': ({'total': (Sum('target_value'), add)}, lambda partials: partials['total']),
+        'avg_actual': (
+            {'total': (Sum('actual_value'), add), 'values': (Count('actual_value'), add)},
+            lambda partials: ratio(partials['total'], partials['values']),
+        ),
+        'min_actual': ({'value': (Min('actual_value'), smallest)}, lambda partials: partials['value']),
+        'max_actual': ({'value': (Max('actual_value'), largest)}, lambda partials: partials['value']),
+        'status_counts': (
+            {status: (Count('id', filter=status_filter(status)), add) for status in STATUSES},
+            lambda partials: {status: partials[status] for status in STATUSES},
+        ),
+    }
+
+
+AGGREGATES = [
+    'count', 'avg_attainment', 'weighted_attainment', 'sum_actual', 'sum_target', 'avg_actual',
+    'min_actual', 'max_actual', 'status_counts', *PANDAS_AGGREGATES,
+]
+
+
+def parse_spec(rows=(), columns=(), aggregate='count', filters=None):
+    """The validated, hashable form of a pivot query: (rows, columns, aggregate, filters)"""
+    rows, columns = tuple(rows or ()), tuple(columns or ())
+    dimensions = rows + columns
+    for name in dimensions:
+        if name not in DIMENSIONS:
+            raise PivotError(f'Unknown dimension {name!r}, use {", ".join(DIMENSIONS)}')
+    if len(set(dimensions)) != len(dimensions):
+        raise PivotError('A dimension can only be used once')
+    if len(dimensions) > MAX_DIMENSIONS:
+        raise PivotError(f'At most {MAX_DIMENSIONS} dimensions')
+    if aggregate not in AGGREGATES:
+        raise PivotError(f'Unknown aggregate {aggregate!r}, use {", ".join(AGGREGATES)}')
+    filters = {name: value for name, value in (filters or {}).items() if value not in (None, '')}
+    for name in filters:
+        if name not in FILTERS:
+            raise PivotError(f'Unknown filter {name!r}, use {", ".join(FILTERS)}')
+    if filters.get('perspective', PERSPECTIVES[0]) not in PERSPECTIVE_MODELS:
+        raise PivotError(f'perspective must be one of {", ".join(PERSPECTIVES)}')
+    return rows, columns, aggregate, tuple(sorted(filters.items()))
+
+
+def entries(organization, filters):
+    """(perspective, queryset) of the entries a pivot with ``filters`` covers"""
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        if filters.get('perspective', perspective) != perspective:
+            continue
+        queryset = model.objects.filter(organization=organization).exclude(batch_id=None)
+        if 'batch_id' in filters:
+            queryset = queryset.filter(batch_id=filters['batch_id'])
+        for name in ('measure', 'owner'):
+            if name in filters:
+                queryset = queryset.filter(key_filter(organization.pk, name, filters[name]))
+        yield perspective, queryset
+
+
+def dimension_columns(dimensions):
+    """Expressions of the dimensions read from the tables (all but perspective), by alias"""
+    expressions = {'batch': F('batch_id'), 'month': TruncMonth('date'), 'year': ExtractYear('date')}
+    return {
+        f'dimension_{name}': expressions.get(name) or F(key_column(name) if name in DICTIONARY_FIELDS else name)
+        for name in dimensions if name != 'perspective'
+    }
+
+
+def named(dimensions, keys):
+    """``keys`` (cell keys) with the objective, measure and owner values read from the tables replaced by names"""
+    keys = list(keys)
+    names = {
+        position: key_names(name, {key[position] for key in keys})
+        for position, name in enumerate(dimensions) if name in DICTIONARY_FIELDS
+    }
+    if not names:
+        return keys
+    return [
+        tuple(names[position][value] if position in names else value for position, value in enumerate(key))
+        for key in keys
+    ]
+
+
+def cell_key(dimensions, perspective, row):
+    """The labels of one row's cell: perspective from the table, month as YYYY-MM"""
+    key = []
+    for name in dimensions:
+        value = perspective if name == 'perspective' else row[f'dimension_{name}']
+        if name == 'month' and value is not None:
+            value = value.strftime('%Y-%m')
+        key.append(value)
+    return tuple(key)
+
+
+def merge(partials, current, values):
+    if current is None:
+        return values
+    return {name: merge_values(current[name], values[name]) for name, (_, merge_values) in partials.items()}
+
+
+def fold(cells, partials, part):
+    """Merge the partials of ``cells`` by ``part(key)``"""
+    folded = {}
+    for key, values in cells.items():
+        folded[part(key)] = merge(partials, folded.get(part(key)), values)
+    return folded
+
+
+def sql_pivot(organization, rows, columns, aggregate, filters):
+    """(cells, row totals, column totals, total) from GROUP BY queries, merged over the perspectives"""
+    partials, finish = sql_aggregates(Policies(organization))[aggregate]
+    partials = {'entries': (Count('id'), add), **partials}
+    dimensions = rows + columns
+    cells = {}
+    for perspective, queryset in entries(organization, filters):
+        expressions = dimension_columns(dimensions)
+        aggregates = {name: expression for name, (expression, _) in partials.items()}
+        if expressions:
+            grouped = queryset.values(**expressions).annotate(**aggregates).order_by()
+        else:
+            grouped = [queryset.aggregate(**aggregates)]
+        for row in grouped:
+            if not row['entries']:
+                continue
+            key = cell_key(dimensions, perspective, row)
+            cells[key] = merge(partials, cells.get(key), {name: row[name] for name in partials})
+    cells = dict(zip(named(dimensions, cells), cells.values()))
+
+    split = len(rows)
+    finished = lambda folded: {key: finish(values) for key, values in folded.items()}
+    total = fold(cells, partials, lambda key: ())
+    return (
+        finished(cells),
+        finished(fold(cells, partials, lambda key: key[:split])),
+        finished(fold(cells, partials, lambda key: key[split:])),
+        finish(total[()]) if total else None,
+    )
+
+
+def pandas_groups(keys, values, part, function):
+    """{part(key): value} of ``function`` over the ``values`` of each group of ``keys``"""
+    # Grouped by integer codes, so that None and integer labels come back as they are
+    groups = {}
+    codes = [groups.setdefault(part(key), len(groups)) for key in keys]
+    labels = list(groups)
+    grouped = pd.Series(values, dtype=float).groupby(codes).agg(function)
+    # NaN (the deviation of a single value) is not valid JSON
+    return {labels[code]: None if pd.isna(value) else float(value) for code, value in grouped.items()}
+
+
+def pandas_pivot(organization, rows, columns, aggregate, filters):
+    """(cells, row totals, column totals, total) computed with pandas over values_list rows"""
+    value_name, function = PANDAS_AGGREGATES[aggregate]
+    if value_name == 'attainment':
+        value, present = rollup.attainment_expression(Policies(organization)), rollup.scored_filter()
+    else:
+        value, present = F('actual_value'), Q(actual_value__isnull=False)
+    dimensions = rows + columns
+    keys, values = [], []
+    for perspective, queryset in entries(organization, filters):
+        for row in queryset.filter(present).values(**dimension_columns(dimensions), pivot_value=value):
+            keys.append(cell_key(dimensions, perspective, row))
+            values.append(row['pivot_value'])
+    if not keys:
+        return {}, {}, {}, None
+    keys = named(dimensions, keys)
+
+    split = len(rows)
+    return (
+        pandas_groups(keys, values, lambda key: key, function),
+        pandas_groups(keys, values, lambda key: key[:split], function),
+        pandas_groups(keys, values, lambda key: key[split:], function),
+        pandas_groups(keys, values, lambda key: (), function)[()],
+    )
+
+
+def sort_key(dimensions, key):
+    """Perspectives in their usual order, missing values last"""
+    return tuple(
+        (value is None, PERSPECTIVES.index(value) if name == 'perspective' and value is not None else value)
+        for name, value in zip(dimensions, key)
+    )
+
+
+def compute(organization, rows, columns, aggregate, filters):
+    filters = dict(filters)
+    build = pandas_pivot if aggregate in PANDAS_AGGREGATES else sql_pivot
+    cells, row_totals, column_totals, total = build(organization, rows, columns, aggregate, filters)
+
+    split = len(rows)
+    row_keys = sorted({key[:split] for key in cells}, key=lambda key: sort_key(rows, key))
+    column_keys = sorted({key[split:] for key in cells}, key=lambda key: sort_key(columns, key))
+    if len(row_keys) * len(column_keys) > max_cells():
+        raise PivotError(
+            f'{len(row_keys)} x {len(column_keys)} cells is more than {max_cells()}, use fewer dimensions or filter'
+        )
+    return {
+        'rows': list(rows),
+        'columns': list(columns),
+        'aggregate': aggregate,
+        'filters': filters,
+        'row_keys': [list(key) for key in row_keys],
+        'column_keys': [list(key) for key in column_keys],
+        'cells': [[cells.get(row + column) for column in column_keys] for row in row_keys],
+        'row_totals': [row_totals.get(row) for row in row_keys],
+        'column_totals': [column_totals.get(column) for column in column_keys],
+        'total': total,
+    }
+
+
+def pivot(organization, rows=(), columns=(), aggregate='count', filters=None):
+    """
+    The pivot of the organization's entries, ready for JSON.
+
+    ``cells[i][j]`` is the aggregate of the entries with ``row_keys[i]`` and
+    ``column_keys[j]`` (None when there are none); ``row_totals``,
+    ``column_totals`` and ``total`` aggregate the entries of a whole row,
+    column or pivot. Raises PivotError for an invalid query.
+    """
+    spec = parse_spec(rows, columns, aggregate, filters)
+    key = (organization.pk, data_version(organization.pk), spec)
+    result = results.get(key)
+    if result is None:
+        result = compute(organization, *spec)
+        results.set(key, result)
+    return result
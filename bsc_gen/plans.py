@@ -0,0 +1,144 @@
+"""
+Action plans and performance reviews around batches.
+
+Plans hang off entries through the ``action_plans`` M2M of every perspective
+table, reviews point at a batch_id. Everything here loads them with a fixed
+number of queries whatever the batch size: Prefetch querysets with
+select_related users for plans, and one grouped query per perspective for the
+status counts.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db.models import Prefetch
+
+from .models import PERSPECTIVE_MODELS, ActionPlan, PerformanceReview
+
+
+PLAN_STATUSES = [status for status, _ in ActionPlan.STATUS_CHOICES]
+REVIEW_STATUSES = [status for status, _ in PerformanceReview.STATUS_CHOICES]
+MODEL_BY_NAME = {model.__name__: model for model in PERSPECTIVE_MODELS.values()}
+
+
+def plan_queryset():
+    return ActionPlan.objects.select_related('assigned_to', 'created_by').order_by('due_date', 'pk')
+
+
+def batch_entries_with_plans(organization, batch_id):
+    """perspective -> entries of the batch, each with its plans in ``entry.plans``. Two queries per perspective"""
+    return {
+        perspective: list(
+            model.objects.filter(organization=organization, batch_id=batch_id).order_by('pk')
+            .prefetch_related(Prefetch('action_plans', queryset=plan_queryset(), to_attr='plans'))
+        )
+        for perspective, model in PERSPECTIVE_MODELS.items()
+    }
+
+
+def count_statuses(plans):
+    counts = dict.fromkeys(PLAN_STATUSES, 0)
+    for plan in {plan.pk: plan for plan in plans}.values():
+        counts[plan.status] += 1
+    return counts
+
+
+def plan_status_counts(organization, batch_ids=None):
+    """batch_id -> {status: number of distinct plans linked to the batch's entries}, one query per perspective"""
+    pairs = set()
+    for model in PERSPECTIVE_MODELS.values():
+        entry = model._meta.model_name
+        links = model.action_plans.through.objects.filter(**{f'{entry}__organization': organization})
+        if batch_ids is not None:
+            links = links.filter(**{f'{entry}__batch_id__in': batch_ids})
+        pairs.update(links.values_list(f'{entry}__batch_id', 'actionplan_id', 'actionplan__status').distinct())
+
+    counts = defaultdict(lambda: dict.fromkeys(PLAN_STATUSES, 0))
+    for batch_id, _, status in pairs:
+        counts[batch_id][status] += 1
+    return dict(counts)
+
+
+def organization_plans(organization, status=None):
+    """The organization's plans, each with the entries it is linked to in ``plan.linked_<model name>``"""
+    plans = plan_queryset().filter(organization=organization).prefetch_related(*(
+        Prefetch(
+            f'{model._meta.model_name}_objectives',
+            queryset=model.objects.only('pk', 'objective', 'measure', 'batch_id').order_by('pk'),
+            to_attr=f'linked_{model._meta.model_name}',
+        )
+        for model in PERSPECTIVE_MODELS.values()
+    ))
+    if status:
+        plans = plans.filter(status=status)
+    return list(plans)
+
+
+def organization_reviews(organization, batch_id=None):
+    reviews = PerformanceReview.objects.filter(organization=organization).select_related('reviewer').order_by('-scheduled_date')
+    if batch_id:
+        reviews = reviews.filter(batch_id=batch_id)
+    return list(reviews)
+
+
+def user_dict(user):
+    return {'id': user.pk, 'username': user.username, 'name': user.get_full_name() or user.username}
+
+
+def plan_dict(plan, with_entries=False):
+    """``with_entries`` needs a plan from organization_plans()"""
+    data = {
+        'id': plan.pk,
+        'title': plan.title,
+        'description': plan.description,
+        'status': plan.status,
+        'due_date': plan.due_date.isoformat(),
+        'overdue': plan.status not in ('completed', 'on_hold') and plan.due_date < datetime.date.today(),
+        'assigned_to': user_dict(plan.assigned_to),
+        'created_by': user_dict(plan.created_by),
+    }
+    if with_entries:
+        data['entries'] = [
+            {'perspective': perspective, 'entry': f'{model.__name__}_{entry.pk}', 'objective': entry.objective,
+             'measure': entry.measure, 'batch_id': entry.batch_id}
+            for perspective, model in PERSPECTIVE_MODELS.items()
+            for entry in getattr(plan, f'linked_{model._meta.model_name}')
+        ]
+    return data
+
+
+def review_dict(review):
+    return {
+        'id': review.pk,
+        'title': review.title,
+        'description': review.description,
+        'status': review.status,
+        'batch_id': review.batch_id,
+        'scheduled_date': review.scheduled_date.isoformat(),
+        'completed_date': review.completed_date.isoformat() if review.completed_date else None,
+        'notes': review.notes,
+        'reviewer': user_dict(review.reviewer),
+    }
+
+
+def resolve_entries(organization, keys):
+    """'<Model>_<pk>' keys (as used by update_batch) -> {model: [entries of the organization]}, one query per model used"""
+    pks = defaultdict(set)
+    for key in keys:
+        name, _, pk = key.rpartition('_')
+        if name in MODEL_BY_NAME and pk.isdigit():
+            pks[MODEL_BY_NAME[name]].add(int(pk))
+    return {
+        model: list(model.objects.filter(organization=organization, pk__in=model_pks).only('pk'))
+        for model, model_pks in pks.items()
+    }
+
+
+def link_entries(plan, entries_by_model):
+    """Link ``plan`` to entries with one bulk insert per perspective table"""
+    for model, entries in entries_by_model.items():
+        through = model.action_plans.through
+        entry_field = f'{model._meta.model_name}_id'
+        through.objects.bulk_create(
+            [through(**{entry_field: entry.pk, 'actionplan_id': plan.pk}) for entry in entries],
+            ignore_conflicts=True,
+        )
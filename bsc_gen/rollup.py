@@ -0,0 +1,160 @@
+"""
+Weighted attainment scores per perspective, per batch and per organization.
+
+An entry's attainment is actual_value / target_value (mirrored for
+lower-is-better measures, see thresholds.py), clamped to
+[0, BSC_ROLLUP_ATTAINMENT_CAP] so that one runaway measure can't carry a whole
+perspective. Entries without numeric values or with a zero target are left
+out. A perspective's score is the weighted mean attainment of its entries
+(using each entry's ``weight``).
+
+Only the (batch, perspective) sums are stored, in ScoreRollup, along with
+how many entries have each status. Recomputing a row first brings the stored
+statuses of its entries up to date (see thresholds.py). Batch and
+organization scores are sums of those rows, so a perspective with more
+weight in a batch counts for more. Saving an entry recomputes just its own
+row with one aggregate query (see signals.py); uploads, batch edits and
+deletes call in here directly.
+"""
+from django.conf import settings
+from django.db.models import Count, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Greatest, Least
+
+from . import thresholds
+from .models import PERSPECTIVE_MODELS, STATUSES, ScoreRollup, status_filter
+
+
+PERSPECTIVE_BY_MODEL = {model: name for name, model in PERSPECTIVE_MODELS.items()}
+
+# Fields whose change affects a rollup row
+SCORED_FIELDS = {'target', 'actual', 'target_value', 'actual_value', 'measure', 'weight', 'batch_id', 'organization'}
+
+
+def attainment_cap():
+    return float(getattr(settings, 'BSC_ROLLUP_ATTAINMENT_CAP', 1.5))
+
+
+def scored_filter():
+    """Q matching the entries that have an attainment"""
+    return Q(target_value__isnull=False, actual_value__isnull=False) & ~Q(target_value=0)
+
+
+def attainment_expression(policies):
+    """An entry's capped attainment under the organization's ``policies``, for the entries of scored_filter()"""
+    return Greatest(Least(policies.attainment_expression(), Value(attainment_cap())), Value(0.0))
+
+
+def rollup_aggregates(policies):
+    """Aggregate expressions shared by single-row and whole-organization recomputes"""
+    scored = scored_filter()
+    weight = Cast('weight', FloatField())
+    attainment = attainment_expression(policies)
+    return {
+        'entries': Count('id'),
+        'scored_entries': Count('id', filter=scored),
+        'weight_total': Sum(weight, filter=scored),
+        'weighted_attainment': Sum(weight * attainment, filter=scored, output_field=FloatField()),
+        **{f'{status}_entries': Count('id', filter=status_filter(status)) for status in STATUSES},
+    }
+
+
+def stored_values(totals):
+    """ScoreRollup field values from one result of rollup_aggregates()"""
+    return {
+        'entries': totals['entries'],
+        'scored_entries': totals['scored_entries'],
+        'weight_total': totals['weight_total'] or 0,
+        'weighted_attainment': totals['weighted_attainment'] or 0,
+        **{f'{status}_entries': totals[f'{status}_entries'] for status in STATUSES},
+    }
+
+
+def recompute(organization, batch_id, perspectives=None):
+    """Recompute the rows of one batch, for all perspectives or just the named ones. Takes an organization or its id"""
+    organization_id = getattr(organization, 'pk', organization)
+    policies = thresholds.Policies(organization_id)
+    for perspective in perspectives or PERSPECTIVE_MODELS:
+        model = PERSPECTIVE_MODELS[perspective]
+        entries = model.objects.filter(organization_id=organization_id, batch_id=batch_id)
+        thresholds.refresh(entries, policies)
+        totals = entries.aggregate(**rollup_aggregates(policies))
+        if not totals['entries']:
+            ScoreRollup.objects.filter(organization_id=organization_id, batch_id=batch_id, perspective=perspective).delete()
+            continue
+        ScoreRollup.objects.update_or_create(
+            organization_id=organization_id, batch_id=batch_id, perspective=perspective,
+            defaults=stored_values(totals),
+        )
+
+
+def recompute_organization(organization, refresh_statuses=True):
+    """Rebuild every row of ``organization`` with one grouped query per perspective"""
+    policies = thresholds.Policies(organization)
+    rows = []
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        if refresh_statuses:
+            thresholds.refresh(model.objects.filter(organization=organization), policies)
+        grouped = (
+            model.objects.filter(organization=organization).exclude(batch_id=None)
+            .values('batch_id').annotate(**rollup_aggregates(policies)).order_by()
+        )
+        for totals in grouped:
+            rows.append(ScoreRollup(
+                organization=organization,
+                batch_id=totals['batch_id'],
+                perspective=perspective,
+                **stored_values(totals),
+            ))
+    ScoreRollup.objects.filter(organization=organization).delete()
+    ScoreRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def forget_batch(organization, batch_id):
+    ScoreRollup.objects.filter(organization=organization, batch_id=batch_id).delete()
+
+
+def forget_organization(organization):
+    ScoreRollup.objects.filter(organization=organization).delete()
+
+
+def combine(rows):
+    weight_total = sum(row.weight_total for row in rows)
+    return {
+        'score': sum(row.weighted_attainment for row in rows) / weight_total if weight_total else None,
+        'entries': sum(row.entries for row in rows),
+        'scored_entries': sum(row.scored_entries for row in rows),
+        'statuses': {status: sum(getattr(row, f'{status}_entries') for row in rows) for status in STATUSES},
+    }
+
+
+def scorecard(organization, batch_id=None):
+    """
+    Scores of the organization (or of one batch), overall, per perspective and per batch.
+
+    Batches are listed newest first, each with its own per-perspective scores.
+    """
+    rows = ScoreRollup.objects.filter(organization=organization)
+    if batch_id is not None:
+        rows = rows.filter(batch_id=batch_id)
+    rows = list(rows)
+
+    by_perspective = {perspective: [] for perspective in PERSPECTIVE_MODELS}
+    by_batch = {}
+    for row in rows:
+        by_perspective.setdefault(row.perspective, []).append(row)
+        by_batch.setdefault(row.batch_id, []).append(row)
+
+    batches = []
+    for key in sorted(by_batch, reverse=True):
+        batch_rows = by_batch[key]
+        batches.append({
+            'batch_id': key,
+            **combine(batch_rows),
+            'perspectives': {row.perspective: row.score for row in batch_rows},
+        })
+    return {
+        **combine(rows),
+        'perspectives': {perspective: combine(perspective_rows)['score'] for perspective, perspective_rows in by_perspective.items()},
+        'batches': batches,
+    }
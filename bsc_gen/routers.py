@@ -0,0 +1,80 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads do too, except inside views decorated
+with @replica_reads (the read-only dashboard, API and report views): those
+read from one of ``BSC_REPLICA_DATABASES``, picked once per request so every
+query of a request sees the same replica.
+
+Replicas lag behind the primary. So that users see their own changes, every
+successful write request (POST, PUT, PATCH, DELETE) sets a short-lived cookie
+(ReplicaPinMiddleware) and requests carrying it keep reading from the primary
+for ``BSC_REPLICA_PIN_SECONDS``.
+
+Without replicas configured the router and middleware do nothing.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PIN_COOKIE = 'bsc_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_read_alias = ContextVar('bsc_read_alias', default=None)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'BSC_REPLICA_DATABASES', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'BSC_REPLICA_PIN_SECONDS', 5)
+
+
+def is_pinned(request):
+    """True while the client's last write may not have reached the replicas yet"""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_to_primary(response):
+    seconds = pin_seconds()
+    response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+
+
+@contextmanager
+def reading_from_replica(alias=None):
+    """Send the reads of the enclosed block to ``alias`` (default: a random replica, if any)"""
+    replicas = replica_aliases()
+    if alias is None and replicas:
+        alias = random.choice(replicas)
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # None lets Django fall back to the instance's database or default
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {'default', *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
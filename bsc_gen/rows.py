@@ -0,0 +1,132 @@
+"""
+Compact entry rows for the dashboard, the batch cards, the PDF report and the APIs.
+
+Entries are read with values_list() - only the columns that get rendered,
+no model instances - and each becomes one EntryRow namedtuple, attribute
+compatible with the dicts the templates used to get. One tuple per entry
+instead of a model instance plus two dicts. Archived batches (archive.py)
+give the same rows, read from their file.
+"""
+from collections import namedtuple
+
+from . import archive, thresholds
+from .models import PERSPECTIVE_MODELS, STATUSES, ArchivedBatch
+
+
+EntryRow = namedtuple('EntryRow', [
+    'perspective', 'model_type', 'pk', 'objective', 'measure', 'target', 'actual', 'owner', 'date', 'status',
+])
+
+COLUMNS = ('pk', 'objective', 'measure', 'target', 'actual', 'owner', 'date', 'batch_id', 'batch_name', 'upload_time', 'status')
+ARCHIVED_COLUMNS = ('objective', 'measure', 'target', 'actual', 'owner', 'date', 'upload_time', 'target_value', 'actual_value')
+CHUNK_SIZE = 2000
+
+
+def iter_archived(organization, batch_id=None, perspective=None):
+    """iter_rows() of archived batches, batch by batch; statuses under the current threshold policies"""
+    stubs = ArchivedBatch.objects.filter(organization=organization)
+    if batch_id is not None:
+        stubs = stubs.filter(batch_id=batch_id)
+    policies = None
+    for stub in stubs.order_by('batch_id'):
+        policies = policies or thresholds.Policies(organization)
+        for name, columns in archive.read_batch(stub, ARCHIVED_COLUMNS, perspective).items():
+            model_type = PERSPECTIVE_MODELS[name].__name__
+            for objective, measure, target, actual, owner, date, upload_time, target_value, actual_value in zip(
+                *(columns[column] for column in ARCHIVED_COLUMNS)
+            ):
+                yield stub.batch_id, stub.batch_name, upload_time, EntryRow(
+                    name, model_type, None, objective, measure, target, actual, owner, date,
+                    policies.classify(actual_value, target_value, measure),
+                )
+
+
+def iter_rows(organization, batch_id=None, perspective=None, archived=False):
+    """(batch_id, batch_name, upload_time, EntryRow) for every entry, perspective by perspective, then archived ones if asked"""
+    for name, model in PERSPECTIVE_MODELS.items():
+        if perspective and name != perspective:
+            continue
+        entries = model.objects.filter(organization=organization)
+        if batch_id is not None:
+            entries = entries.filter(batch_id=batch_id)
+        model_type = model.__name__
+        for pk, objective, measure, target, actual, owner, date, entry_batch_id, batch_name, upload_time, status in (
+            entries.values_list(*COLUMNS).iterator(chunk_size=CHUNK_SIZE)
+        ):
+            yield entry_batch_id, batch_name, upload_time, EntryRow(
+                name, model_type, pk, objective, measure, target, actual, owner, date, status,
+            )
+    if archived:
+        yield from iter_archived(organization, batch_id, perspective)
+
+
+def build_batches(organization, batch_id=None):
+    """The organization's batches (or just ``batch_id``) as rendered by dashboard.html, newest first"""
+    if not organization:
+        return []
+    batches = {}
+    for entry_batch_id, batch_name, upload_time, row in iter_rows(organization, batch_id):
+        if not entry_batch_id:
+            continue  # skip entries without a batch_id
+        batch = batches.get(entry_batch_id)
+        if batch is None:
+            batch = batches[entry_batch_id] = {
+                'batch_id': entry_batch_id,
+                'batch_name': batch_name,
+                'upload_time': upload_time,
+                'entries': [],
+            }
+        else:
+            if batch['batch_name'] is None:
+                batch['batch_name'] = batch_name
+            if upload_time and (batch['upload_time'] is None or upload_time < batch['upload_time']):
+                batch['upload_time'] = upload_time
+        batch['entries'].append(row)
+
+    result = []
+    for key in sorted(batches, reverse=True):
+        batch = batches[key]
+        batch['batch_name'] = batch['batch_name'] or f'Batch {key}'
+        result.append(batch)
+    return result
+
+
+def batch_rows(organization, batch_id):
+    """(batch name or None, {perspective: [EntryRow]}) of one batch, archived or not"""
+    grouped = {perspective: [] for perspective in PERSPECTIVE_MODELS}
+    name = None
+    for _, batch_name, _, row in iter_rows(organization, batch_id, archived=True):
+        name = name or batch_name
+        grouped[row.perspective].append(row)
+    return name, grouped
+
+
+def row_dict(row):
+    """The JSON shape of bsc_data_api"""
+    return {
+        'perspective': row.perspective,
+        'objective': row.objective,
+        'measure': row.measure,
+        'target': row.target,
+        'actual': row.actual,
+        'owner': row.owner,
+        'date': row.date.strftime('%Y-%m-%d') if row.date else '',
+        'status': row.status,
+    }
+
+
+def status_counts(organization, batch_id):
+    """{perspective: {status: entries}} of one batch, reading only the stored status"""
+    if ArchivedBatch.objects.filter(organization=organization, batch_id=batch_id).exists():
+        counts = {perspective: dict.fromkeys(STATUSES, 0) for perspective in PERSPECTIVE_MODELS}
+        for _, _, _, row in iter_archived(organization, batch_id):
+            counts[row.perspective][row.status] += 1
+        return counts
+    counts = {}
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        perspective_counts = counts[perspective] = {'blue': 0, 'good': 0, 'moderate': 0, 'bad': 0, 'unknown': 0}
+        for status in model.objects.filter(organization=organization, batch_id=batch_id).values_list(
+            'status', flat=True,
+        ).iterator(chunk_size=CHUNK_SIZE):
+            perspective_counts[status] += 1
+    return counts
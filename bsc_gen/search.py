@@ -0,0 +1,310 @@
+"""
+Ranked full-text search over objective, measure, owner and batch_name of all four perspectives.
+
+One interface, three backends picked by database vendor:
+
+* SQLite: the ``bsc_search`` FTS5 table created by migration 0010, kept in
+  sync by triggers on the perspective tables, so bulk inserts, bulk updates,
+  renames and deletes all maintain it. Organization and batch are tokens of
+  the indexed ``scope`` column, so filtering by them is part of the MATCH.
+  Ranked with bm25. SQLite drops a table's triggers when a migration rebuilds
+  it (as AddField does), so such migrations must reinstall them with
+  install_sqlite_triggers() and rebuild_sqlite_index(); searching raises
+  SearchIndexError while any is missing.
+* PostgreSQL: pg_trgm GIN indexes over the concatenated text (and owner),
+  queried with ILIKE per term and ranked by word_similarity. Indexes need no
+  maintenance.
+* Anything else, or SQLite built without FTS5: unindexed icontains queries.
+
+Every term must match (as a prefix on SQLite, as a substring on PostgreSQL).
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import PERSPECTIVE_MODELS
+
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+SEARCH_EXPRESSION = "(objective || ' ' || measure || ' ' || coalesce(owner, '') || ' ' || coalesce(batch_name, ''))"
+MAX_PER_PAGE = 100
+FTS_INSERT = 'INSERT INTO bsc_search(rowid, scope, objective, measure, owner, batch_name, perspective, entry_id)'
+
+
+class SearchIndexError(RuntimeError):
+    pass
+
+
+def terms(text):
+    return TERM_RE.findall(text or '')
+
+
+class SearchBackend:
+    """Returns (total matches, [(perspective, entry id)] of the requested page, best first)"""
+
+    def matches(self, organization, query, owner=None, perspective=None, batch_id=None, offset=0, limit=25):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    # bm25 weights per column: scope, objective, measure, owner, batch_name
+    WEIGHTS = '0.0, 4.0, 3.0, 2.0, 1.0'
+
+    @staticmethod
+    def phrase(term):
+        return '"' + term.replace('"', '""') + '"*'
+
+    def match_expression(self, organization, query, owner, batch_id):
+        parts = [f'scope : "o{organization.pk}"']
+        if batch_id:
+            parts.append('scope : "b' + batch_id.replace('"', '""') + '"')
+        parts.extend(self.phrase(term) for term in terms(query))
+        parts.extend(f'owner : {self.phrase(term)}' for term in terms(owner))
+        return ' AND '.join(parts)
+
+    def matches(self, organization, query, owner=None, perspective=None, batch_id=None, offset=0, limit=25):
+        where = 'bsc_search MATCH %s'
+        params = [self.match_expression(organization, query, owner, batch_id)]
+        if perspective:
+            where += ' AND perspective = %s'
+            params.append(perspective)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM bsc_search WHERE {where}', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'SELECT perspective, entry_id FROM bsc_search WHERE {where} '
+                f'ORDER BY bm25(bsc_search, {self.WEIGHTS}), rowid LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            return total, cursor.fetchall()
+
+
+class PostgresTrigramBackend(SearchBackend):
+    @staticmethod
+    def like(term):
+        return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    def matches(self, organization, query, owner=None, perspective=None, batch_id=None, offset=0, limit=25):
+        selects, params = [], []
+        for name, model in PERSPECTIVE_MODELS.items():
+            if perspective and name != perspective:
+                continue
+            conditions = ['organization_id = %s']
+            select_params = [' '.join(terms(query)), organization.pk]
+            for term in terms(query):
+                conditions.append(f'{SEARCH_EXPRESSION} ILIKE %s')
+                select_params.append(self.like(term))
+            for term in terms(owner):
+                conditions.append('owner ILIKE %s')
+                select_params.append(self.like(term))
+            if batch_id:
+                conditions.append('batch_id = %s')
+                select_params.append(batch_id)
+            selects.append(
+                f"SELECT word_similarity(%s::text, {SEARCH_EXPRESSION}) AS rank, '{name}'::text AS perspective, id "
+                f'FROM {model._meta.db_table} WHERE {" AND ".join(conditions)}'
+            )
+            params.extend(select_params)
+        if not selects:
+            return 0, []
+        union = ' UNION ALL '.join(selects)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ({union}) matches', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'SELECT perspective, id FROM ({union}) matches ORDER BY rank DESC, perspective, id LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            return total, cursor.fetchall()
+
+
+class FallbackBackend(SearchBackend):
+    """icontains per term, ordered by perspective and id - no index, fine for small databases"""
+
+    def matches(self, organization, query, owner=None, perspective=None, batch_id=None, offset=0, limit=25):
+        found = []
+        for name, model in PERSPECTIVE_MODELS.items():
+            if perspective and name != perspective:
+                continue
+            entries = model.objects.filter(organization=organization)
+            for term in terms(query):
+                entries = entries.filter(
+                    Q(objective__icontains=term) | Q(measure__icontains=term)
+                    | Q(owner__icontains=term) | Q(batch_name__icontains=term)
+                )
+            for term in terms(owner):
+                entries = entries.filter(owner__icontains=term)
+            if batch_id:
+                entries = entries.filter(batch_id=batch_id)
+            found.extend((name, pk) for pk in entries.order_by('pk').values_list('pk', flat=True))
+        return len(found), found[offset:offset + limit]
+
+
+# FTS rowids are entry id * 4 + slot, see migration 0010
+FTS_SLOTS = {name: slot for slot, name in enumerate(PERSPECTIVE_MODELS)}
+
+
+def fts_values(row, perspective):
+    """The bsc_search values of the entry ``row`` (a table name, or new/old in a trigger)"""
+    return (
+        f"{row}.id * 4 + {FTS_SLOTS[perspective]}, "
+        f"'o' || coalesce({row}.organization_id, '') || ' b' || coalesce({row}.batch_id, ''), "
+        f"{row}.objective, {row}.measure, coalesce({row}.owner, ''), coalesce({row}.batch_name, ''), "
+        f"'{perspective}', {row}.id"
+    )
+
+
+def fts_index_rows(cursor, perspective, where, params):
+    """Add the entries of one perspective table matching ``where`` to the SQLite FTS index in one statement"""
+    table = PERSPECTIVE_MODELS[perspective]._meta.db_table
+    cursor.execute(f'{FTS_INSERT} SELECT {fts_values(table, perspective)} FROM {table} WHERE {where}', params)
+
+
+def trigger_names():
+    return [
+        f'{model._meta.db_table}_search_{suffix}'
+        for model in PERSPECTIVE_MODELS.values() for suffix in ('ai', 'au', 'ad')
+    ]
+
+
+def sqlite_trigger_statements():
+    """The triggers keeping bsc_search in sync with the perspective tables, as created by migration 0010"""
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        table = model._meta.db_table
+        slot = FTS_SLOTS[perspective]
+        yield f"CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN {FTS_INSERT} VALUES ({fts_values('new', perspective)}); END"
+        yield (
+            f"CREATE TRIGGER {table}_search_au AFTER UPDATE OF objective, measure, owner, batch_name, batch_id, organization_id "
+            f"ON {table} BEGIN DELETE FROM bsc_search WHERE rowid = old.id * 4 + {slot}; "
+            f"{FTS_INSERT} VALUES ({fts_values('new', perspective)}); END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM bsc_search WHERE rowid = old.id * 4 + {slot}; END"
+        )
+
+
+def install_sqlite_triggers(cursor):
+    """(Re)create the bsc_search triggers"""
+    for name in trigger_names():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    for statement in sqlite_trigger_statements():
+        cursor.execute(statement)
+
+
+def restore_sqlite_triggers(connection, rebuild=False):
+    """
+    Re-create the triggers, and with ``rebuild`` the index, if bsc_search exists.
+
+    For migrations: altering a perspective table on SQLite can rebuild it,
+    which drops its triggers.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bsc_search'")
+        if cursor.fetchone() is None:
+            return
+        install_sqlite_triggers(cursor)
+        if rebuild:
+            rebuild_sqlite_index(cursor)
+
+
+def rebuild_sqlite_index(cursor):
+    """Re-index every entry, for when writes may have happened without the triggers"""
+    cursor.execute('DELETE FROM bsc_search')
+    for perspective in PERSPECTIVE_MODELS:
+        fts_index_rows(cursor, perspective, '1 = 1', [])
+
+
+def missing_sqlite_triggers(cursor):
+    names = trigger_names()
+    cursor.execute(
+        f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join(['%s'] * len(names))})",
+        names,
+    )
+    present = {name for name, in cursor.fetchall()}
+    return [name for name in names if name not in present]
+
+
+def fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bsc_search'")
+        return cursor.fetchone() is not None
+
+
+def check_sqlite_triggers():
+    """Raise SearchIndexError when bsc_search exists but isn't kept in sync"""
+    with connection.cursor() as cursor:
+        missing = missing_sqlite_triggers(cursor)
+    if missing:
+        raise SearchIndexError(
+            f'Search index triggers are missing ({", ".join(missing)}), so new entries are not indexed. '
+            'Run `python manage.py bsc_search_index --rebuild`.'
+        )
+
+
+_backends = {}
+
+
+def get_backend():
+    vendor = connection.vendor
+    if vendor not in _backends:
+        if vendor == 'sqlite' and fts_available():
+            check_sqlite_triggers()
+            _backends[vendor] = SQLiteFTSBackend()
+        elif vendor == 'postgresql':
+            _backends[vendor] = PostgresTrigramBackend()
+        else:
+            _backends[vendor] = FallbackBackend()
+    return _backends[vendor]
+
+
+def search(organization, query, owner=None, perspective=None, batch_id=None, page=1, per_page=25):
+    """One page of matching entries as dicts, best match first, with the total match count"""
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    if not terms(query) and not terms(owner):
+        return {'total': 0, 'page': page, 'per_page': per_page, 'pages': 0, 'results': []}
+
+    total, hits = get_backend().matches(
+        organization, query, owner=owner, perspective=perspective, batch_id=batch_id,
+        offset=(page - 1) * per_page, limit=per_page,
+    )
+
+    # Load the page's entries with one pk lookup per perspective, then restore the ranked order
+    pks = {}
+    for name, pk in hits:
+        pks.setdefault(name, []).append(pk)
+    rows = {}
+    for name, perspective_pks in pks.items():
+        for row in PERSPECTIVE_MODELS[name].objects.filter(pk__in=perspective_pks).values(
+            'pk', 'objective', 'measure', 'owner', 'target', 'actual', 'status', 'batch_id', 'batch_name',
+        ):
+            rows[(name, row['pk'])] = row
+
+    results = []
+    for name, pk in hits:
+        row = rows.get((name, pk))
+        if row is None:
+            continue
+        results.append({
+            'perspective': name,
+            'id': row['pk'],
+            'objective': row['objective'],
+            'measure': row['measure'],
+            'owner': row['owner'],
+            'target': row['target'],
+            'actual': row['actual'],
+            'status': row['status'],
+            'batch_id': row['batch_id'],
+            'batch_name': row['batch_name'] or f"Batch {row['batch_id']}",
+        })
+    return {
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'results': results,
+    }
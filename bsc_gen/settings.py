@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,13 +42,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bsc_gen.middleware.PerfMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'bsc_gen.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bsc_gen.middleware.OrganizationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bsc_gen.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'bsc_gen.urls'
@@ -83,6 +88,28 @@ DATABASES = {
     }
 }
 
+# Point BSC_SQLITE_PATH at a file to run against SQLite instead (local development, benchmarks)
+if os.environ.get('BSC_SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['BSC_SQLITE_PATH'],
+        }
+    }
+
+# Read replicas, comma separated in BSC_REPLICAS: SQLite file paths when running
+# on SQLite, otherwise database names on the primary's PostgreSQL server.
+# Only the views marked @replica_reads read from them (see bsc_gen/routers.py).
+BSC_REPLICA_DATABASES = []
+for number, replica in enumerate(filter(None, os.environ.get('BSC_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': replica.strip(), 'TEST': {'MIRROR': 'default'}}
+    BSC_REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['bsc_gen.routers.ReplicaRouter']
+# How long a client reads from the primary after writing, to cover replication lag
+BSC_REPLICA_PIN_SECONDS = int(os.environ.get('BSC_REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -142,3 +169,67 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For developm
 # EMAIL_HOST_PASSWORD = 'your-app-password'
 
 DEFAULT_FROM_EMAIL = 'noreply@bscgen.com'
+
+# Seconds a user's profile/organization lookup is cached by OrganizationMiddleware
+BSC_PROFILE_CACHE_TTL = 60
+
+# Per-view latency/SQL/response size histograms, see bsc_gen.perf
+BSC_PERF_ENABLED = False
+# Share of requests (0.0 - 1.0) that also record peak Python memory
+BSC_PERF_MEMORY_SAMPLE_RATE = 0.0
+# Each worker process writes its histograms here for `manage.py bsc_perf_report`
+BSC_PERF_SNAPSHOT_DIR = BASE_DIR / 'perf'
+BSC_PERF_FLUSH_INTERVAL = 30
+# Snapshots of exited processes, and any not rewritten for this many seconds, are deleted
+BSC_PERF_SNAPSHOT_MAX_AGE = 3600
+
+# On-demand cProfile runs for staff (?__profile=1 or X-BSC-Profile: 1), see ProfilerMiddleware
+BSC_PROFILER_ENABLED = False
+BSC_PROFILER_DIR = BASE_DIR / 'profiles'
+BSC_PROFILER_MAX_PER_HOUR = 10
+BSC_PROFILER_MAX_CONCURRENT = 1
+
+# Batches averaged in the rolling attainment of /api/trends/
+BSC_TREND_WINDOW = 3
+BSC_TREND_CACHE_TTL = 3600
+
+# /api/pivot/: results cached per process (LRU of this many pivots), and the largest pivot returned
+BSC_PIVOT_CACHE_SIZE = 128
+BSC_PIVOT_MAX_CELLS = 10000
+
+# Per-entry attainment (actual / target) is capped at this in the weighted scores
+BSC_ROLLUP_ATTAINMENT_CAP = 1.5
+
+# Alert scanner (manage.py bsc_alerts): seconds between scans with --loop, and how far
+# before the previous high-water mark each scan starts to catch late commits
+BSC_ALERT_INTERVAL = 300
+BSC_ALERT_SCAN_OVERLAP = 60
+
+# Strategy maps: share of a node's projected score that comes from its drivers
+BSC_STRATEGY_DRIVER_WEIGHT = 0.5
+BSC_STRATEGY_CACHE_TTL = 3600
+
+# Also store objective/measure/owner as integer keys into per-organization dictionary tables, and
+# filter and group on them (pivot, explorer owner filter, strategy maps). Run
+# `manage.py bsc_dimensions --backfill` when turning it on for existing data.
+BSC_NORMALIZED_DIMENSIONS = False
+
+# manage.py bsc_import rebuilds the secondary indexes once instead of updating them per row when
+# a load has at least this many rows and at least as many as are already stored
+BSC_IMPORT_DEFER_INDEXES_ROWS = 100000
+
+# Bulk uploads (several files or ZIP archives): parser processes (None = one per core)
+# and limits on the files and uncompressed bytes of one upload
+BSC_UPLOAD_WORKERS = None
+BSC_BULK_UPLOAD_MAX_FILES = 50
+BSC_BULK_UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+# Upload limits per file, unless the organization sets its own (Organization.max_upload_mb /
+# max_upload_rows). Uploads are spooled to disk and rejected as soon as they pass a limit.
+BSC_UPLOAD_MAX_BYTES = 25 * 1024 * 1024
+BSC_UPLOAD_MAX_ROWS = 200000
+
+# Cold storage: batches unchanged for this many days can be moved to per-batch Parquet files
+# under BSC_ARCHIVE_DIR by `manage.py bsc_archive`, leaving a stub row (see bsc_gen/archive.py)
+BSC_ARCHIVE_DIR = BASE_DIR / 'archive'
+BSC_ARCHIVE_AFTER_DAYS = 365
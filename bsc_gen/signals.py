@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import dimensions, rollup
+from .middleware import invalidate_profile_cache
+from .models import PERSPECTIVE_MODELS, Organization, StrategyLink, StrategyMap, UserProfile
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def clear_cached_profile(sender, instance, **kwargs):
+    invalidate_profile_cache(instance.user_id)
+
+
+# Cached profiles carry their organization, e.g. its upload limits
+@receiver(post_save, sender=Organization)
+def clear_cached_member_profiles(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    for user_id in UserProfile.objects.filter(organization=instance).values_list('user_id', flat=True):
+        invalidate_profile_cache(user_id)
+
+
+# Evaluated strategy maps are cached against the map's updated_at
+@receiver(post_save, sender=StrategyLink)
+@receiver(post_delete, sender=StrategyLink)
+def touch_strategy_map(sender, instance, **kwargs):
+    StrategyMap.objects.filter(pk=instance.strategy_map_id).update(updated_at=timezone.now())
+
+
+# Deliberately no post_delete receiver: it would make every queryset delete of
+# a perspective table fetch and signal each row. The views that delete entries
+# update the rollup themselves.
+def assign_entry_dimensions(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not set(dimensions.DIMENSIONS) & set(update_fields)):
+        return
+    dimensions.assign_refs([instance], instance.organization_id)
+
+
+def recompute_entry_rollup(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.organization_id is None or instance.batch_id is None:
+        return
+    if update_fields is not None and not rollup.SCORED_FIELDS & set(update_fields):
+        return
+    rollup.recompute(instance.organization_id, instance.batch_id, [rollup.PERSPECTIVE_BY_MODEL[sender]])
+
+
+for model in PERSPECTIVE_MODELS.values():
+    pre_save.connect(assign_entry_dimensions, sender=model, dispatch_uid=f'dimensions_{model.__name__}')
+    post_save.connect(recompute_entry_rollup, sender=model, dispatch_uid=f'rollup_{model.__name__}')
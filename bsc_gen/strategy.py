@@ -0,0 +1,239 @@
+"""
+Strategy maps: objectives as a cause-and-effect graph across the perspectives.
+
+Nodes are the (perspective, objective) pairs of one batch. Edges come from
+the map's StrategyLink rows; a map without links (or the organization's
+implicit default map) links every objective to every objective of the next
+perspective up the chain Learning & Growth -> Internal -> Customer ->
+Financial.
+
+Each node's own score is the weighted attainment of its entries (the same
+measure as bsc_gen.rollup). Scores are then propagated in topological order:
+a node's driver score is the strength-weighted mean of its drivers' projected
+scores, and its projected score blends its own score with that by
+BSC_STRATEGY_DRIVER_WEIGHT. A node that is on target itself but whose
+drivers project below target is flagged ``at_risk``.
+
+The evaluation is cached per map and batch together with the data version and
+the map's ``updated_at``. The version is read from the database (see
+events.py), so changes made by other worker processes or management commands
+invalidate the cache as well. When the data version moves on, only the changed
+batches are considered, own scores are re-read with one grouped query per
+perspective, and only the nodes downstream of those whose own score changed
+are re-evaluated.
+"""
+import graphlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from .dimensions import key_column, key_names
+from .events import RESET_EVENTS, changes_since, data_version
+from .models import PERSPECTIVE_MODELS, ScoreRollup
+from .thresholds import Policies, classify
+from .rollup import rollup_aggregates
+
+
+# Bottom to top: each perspective drives the next one
+PERSPECTIVE_CHAIN = ['Learning & Growth', 'Internal', 'Customer', 'Financial']
+CACHE_PREFIX = 'bsc_strategy:'
+
+
+class StrategyMapError(Exception):
+    """The map's links can't be evaluated, e.g. they form a cycle"""
+
+
+def node_id(perspective, objective):
+    return f'{perspective}:{objective}'
+
+
+def score_status(score):
+    """Status of a score, which is already an actual/target ratio, under the default bands"""
+    return classify(score, 1.0)
+
+
+def latest_batch_id(organization):
+    return ScoreRollup.objects.filter(organization=organization).aggregate(latest=Max('batch_id'))['latest']
+
+
+def has_assigned_entries(strategy_map):
+    return strategy_map is not None and any(
+        model.objects.filter(strategy_map=strategy_map).exists() for model in PERSPECTIVE_MODELS.values()
+    )
+
+
+def own_scores(organization, batch_id, scope=None):
+    """node id -> own score/entries of every objective in the batch, or only of the entries assigned to map ``scope``"""
+    scores = {}
+    aggregates = rollup_aggregates(Policies(organization))
+    column = key_column('objective')
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        entries = model.objects.filter(organization=organization, batch_id=batch_id)
+        if scope is not None:
+            entries = entries.filter(strategy_map=scope)
+        rows = list(entries.values(column).annotate(**aggregates).order_by())
+        names = key_names('objective', [row[column] for row in rows])
+        for row in rows:
+            objective = names[row[column]]
+            weight_total = row['weight_total'] or 0
+            scores[node_id(perspective, objective)] = {
+                'perspective': perspective,
+                'objective': objective,
+                'entries': row['entries'],
+                'score': row['weighted_attainment'] / weight_total if weight_total else None,
+            }
+    return scores
+
+
+def build_edges(nodes, strategy_map=None):
+    """[(source id, target id, strength)] between existing nodes"""
+    links = list(strategy_map.links.all()) if strategy_map is not None else []
+    if links:
+        edges = [
+            (node_id(link.source_perspective, link.source_objective), node_id(link.target_perspective, link.target_objective), link.strength)
+            for link in links
+        ]
+        return [(source, target, strength) for source, target, strength in edges if source in nodes and target in nodes]
+
+    by_perspective = defaultdict(list)
+    for key, node in nodes.items():
+        by_perspective[node['perspective']].append(key)
+    edges = []
+    for lower, upper in zip(PERSPECTIVE_CHAIN, PERSPECTIVE_CHAIN[1:]):
+        edges.extend((source, target, 1.0) for source in sorted(by_perspective[lower]) for target in sorted(by_perspective[upper]))
+    return edges
+
+
+def topological_order(nodes, edges):
+    graph = {key: set() for key in nodes}
+    for source, target, _ in edges:
+        graph[target].add(source)
+    try:
+        return list(graphlib.TopologicalSorter(graph).static_order())
+    except graphlib.CycleError as e:
+        raise StrategyMapError(f'Strategy map links form a cycle: {" -> ".join(e.args[1])}')
+
+
+def downstream(keys, edges):
+    """``keys`` and every node reachable from them"""
+    successors = defaultdict(list)
+    for source, target, _ in edges:
+        successors[source].append(target)
+    seen = set(keys)
+    stack = list(keys)
+    while stack:
+        for target in successors[stack.pop()]:
+            if target not in seen:
+                seen.add(target)
+                stack.append(target)
+    return seen
+
+
+def propagate(nodes, edges, order, only=None):
+    """Evaluate ``nodes`` in place along ``order``, or just the ``only`` subset (whose drivers must be evaluated already)"""
+    driver_weight = getattr(settings, 'BSC_STRATEGY_DRIVER_WEIGHT', 0.5)
+    drivers = defaultdict(list)
+    for source, target, strength in edges:
+        drivers[target].append((source, strength))
+
+    evaluated = 0
+    for key in order:
+        if only is not None and key not in only:
+            continue
+        node = nodes[key]
+        weighted = [(nodes[source]['projected_score'], strength) for source, strength in drivers[key]
+                    if nodes[source]['projected_score'] is not None]
+        strength_total = sum(strength for _, strength in weighted)
+        driver_score = sum(score * strength for score, strength in weighted) / strength_total if strength_total else None
+
+        if node['score'] is None:
+            projected = driver_score
+        elif driver_score is None:
+            projected = node['score']
+        else:
+            projected = (1 - driver_weight) * node['score'] + driver_weight * driver_score
+
+        node.update({
+            'status': score_status(node['score']),
+            'driver_score': driver_score,
+            'projected_score': projected,
+            'projected_status': score_status(projected),
+            'at_risk': node['score'] is not None and node['score'] >= 1.0 and driver_score is not None and driver_score < 1.0,
+            'drivers': [source for source, _ in drivers[key]],
+        })
+        evaluated += 1
+    return evaluated
+
+
+def evaluate(organization, batch_id, strategy_map=None, scope=None):
+    nodes = own_scores(organization, batch_id, scope)
+    edges = build_edges(nodes, strategy_map)
+    order = topological_order(nodes, edges)
+    evaluated = propagate(nodes, edges, order)
+    return {'nodes': nodes, 'edges': edges, 'order': order, 'evaluated': evaluated}
+
+
+def refresh(state, organization, batch_id, strategy_map, scope):
+    """Re-read own scores and re-evaluate only what lies downstream of the nodes that changed"""
+    fresh = own_scores(organization, batch_id, scope)
+    nodes = state['nodes']
+    if fresh.keys() != nodes.keys():
+        # Objectives appeared or disappeared, so the edges change too
+        return evaluate(organization, batch_id, strategy_map, scope)
+
+    changed = [key for key, node in fresh.items()
+               if (node['score'], node['entries']) != (nodes[key]['score'], nodes[key]['entries'])]
+    for key in changed:
+        nodes[key].update(score=fresh[key]['score'], entries=fresh[key]['entries'])
+    evaluated = propagate(nodes, state['edges'], state['order'], only=downstream(changed, state['edges'])) if changed else 0
+    return dict(state, evaluated=evaluated)
+
+
+def evaluated_map(organization, strategy_map=None, batch_id=None):
+    """
+    The evaluated graph of ``strategy_map`` (None for the default map) for one batch, newest by default.
+
+    Served from the cache when nothing relevant changed.
+    """
+    batch_id = batch_id or latest_batch_id(organization)
+    if batch_id is None:
+        return {'nodes': {}, 'edges': [], 'order': [], 'evaluated': 0, 'batch_id': None}
+    # A map with entries assigned to it covers just those, otherwise all of the batch
+    scope = strategy_map if has_assigned_entries(strategy_map) else None
+
+    key = f"{CACHE_PREFIX}{organization.pk}:{strategy_map.pk if strategy_map else 'default'}:{batch_id}"
+    stamp = strategy_map.updated_at.isoformat() if strategy_map else None
+    version = data_version(organization.pk)
+    state = cache.get(key)
+
+    if state and state['stamp'] == stamp and state['version'] == version:
+        return dict(state['graph'], evaluated=0, batch_id=batch_id)
+
+    changes = changes_since(organization.pk, state['version']) if state and state['stamp'] == stamp else None
+    if changes is None or any(change['type'] in RESET_EVENTS for change in changes):
+        graph = evaluate(organization, batch_id, strategy_map, scope)
+    elif any(change['batch_id'] == batch_id and change['type'] != 'batch_renamed' for change in changes):
+        graph = refresh(state['graph'], organization, batch_id, strategy_map, scope)
+    else:
+        graph = dict(state['graph'], evaluated=0)
+
+    cache.set(key, {'stamp': stamp, 'version': version, 'graph': graph}, getattr(settings, 'BSC_STRATEGY_CACHE_TTL', 3600))
+    return dict(graph, batch_id=batch_id)
+
+
+def serialize(graph, strategy_map=None):
+    """JSON shape served to the frontend, nodes listed in topological order"""
+    downstream_counts = {key: len(downstream([key], graph['edges'])) - 1 for key in graph['nodes']}
+    return {
+        'map': {'id': strategy_map.pk, 'name': strategy_map.name} if strategy_map else {'id': None, 'name': 'Default'},
+        'batch_id': graph['batch_id'],
+        'perspectives': PERSPECTIVE_CHAIN,
+        'nodes': [
+            {'id': key, **graph['nodes'][key], 'downstream': downstream_counts[key]}
+            for key in graph['order']
+        ],
+        'edges': [{'source': source, 'target': target, 'strength': strength} for source, target, strength in graph['edges']],
+        'evaluated': graph['evaluated'],
+    }
@@ -0,0 +1,118 @@
+"""
+Reproducible synthetic BSC uploads for `manage.py bsc_seed` and `manage.py bsc_bench`.
+
+The data is deliberately messy the way real uploads are: perspectives are
+skewed towards Financial, objectives and owners repeat across batches, dates
+come in every format the upload accepts (plus blanks and junk) and a few
+target/actual cells are not numeric.
+"""
+import datetime
+import random
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .ingest import ingest_dataframe
+from .models import Organization, UserProfile
+
+
+PERSPECTIVE_WEIGHTS = {
+    'Financial': 0.4,
+    'Customer': 0.3,
+    'Internal': 0.2,
+    'Learning & Growth': 0.1,
+}
+
+OBJECTIVES = {
+    'Financial': ['Increase Revenue', 'Reduce Costs', 'Improve Margins', 'Grow Recurring Revenue', 'Optimize Cash Flow'],
+    'Customer': ['Improve Satisfaction', 'Reduce Churn', 'Grow Market Share', 'Faster Support Response'],
+    'Internal': ['Reduce Process Time', 'Improve Quality', 'Automate Reporting', 'Shorten Release Cycle'],
+    'Learning & Growth': ['Employee Training', 'Retain Talent', 'Improve Engagement', 'Foster Innovation'],
+}
+
+MEASURES = {
+    'Financial': [('Total Sales', 100000), ('Operating Cost', 50000), ('Gross Margin %', 40), ('MRR', 25000)],
+    'Customer': [('Customer Survey Score', 90), ('Churn Rate %', 5), ('NPS', 45), ('First Response (hrs)', 4)],
+    'Internal': [('Avg. Processing Time (days)', 2), ('Defect Rate %', 1), ('Automated Reports', 20)],
+    'Learning & Growth': [('Training Hours per Employee', 40), ('Retention Rate %', 90), ('Ideas Submitted', 15)],
+}
+
+FIRST_NAMES = ['John', 'Jane', 'Emily', 'Michael', 'Priya', 'Akash', 'Sanket', 'Tarun', 'Maria', 'Chen', 'Fatima', 'Lucas']
+LAST_NAMES = ['Doe', 'Smith', 'Lee', 'Brown', 'Sharma', 'Debangshi', 'Hegde', 'Arya', 'Garcia', 'Wang', 'Khan', 'Silva']
+
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y')
+
+
+def skewed_choice(rng, items):
+    """Pick from ``items`` with a Zipf-like bias towards the first ones"""
+    weights = [1 / (i + 1) for i in range(len(items))]
+    return rng.choices(items, weights=weights)[0]
+
+
+def messy_date(rng, day):
+    roll = rng.random()
+    if roll < 0.05:
+        return ''
+    if roll < 0.07:
+        return 'TBD'
+    return day.strftime(rng.choice(DATE_FORMATS))
+
+
+def messy_number(rng, value):
+    if rng.random() < 0.02:
+        return rng.choice(['N/A', '', 'pending'])
+    if rng.random() < 0.5:
+        return str(int(round(value)))
+    return f'{value:.1f}'
+
+
+def generate_batch_frame(rng, entries, day=None):
+    """A DataFrame shaped like an uploaded file with ``entries`` rows"""
+    day = day or datetime.date(2024, 1, 1)
+    owners = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    perspectives = list(PERSPECTIVE_WEIGHTS)
+    weights = list(PERSPECTIVE_WEIGHTS.values())
+    rows = []
+    for _ in range(entries):
+        perspective = rng.choices(perspectives, weights=weights)[0]
+        measure, target = skewed_choice(rng, MEASURES[perspective])
+        actual = target * rng.uniform(0.5, 1.4)
+        rows.append({
+            'perspective': perspective,
+            'objective': skewed_choice(rng, OBJECTIVES[perspective]),
+            'measure': measure,
+            'target': messy_number(rng, target),
+            'actual': messy_number(rng, actual),
+            'owner': skewed_choice(rng, owners),
+            'date': messy_date(rng, day),
+        })
+    return pd.DataFrame(rows, columns=['perspective', 'objective', 'measure', 'target', 'actual', 'owner', 'date'])
+
+
+def seed_organization(name, batches, entries, seed=0, admin_password=None):
+    """
+    Create (or top up) an organization with ``batches`` uploads of ``entries`` rows each.
+
+    When ``admin_password`` is given an admin user ``<slug>_admin`` is created as
+    well. Returns ``(organization, admin_user_or_None, [batch_ids])``.
+    """
+    rng = random.Random(f'{seed}:{name}')
+    organization, _ = Organization.objects.get_or_create(name=name)
+    admin = None
+    if admin_password:
+        username = f"{name.lower().replace(' ', '_')}_admin"
+        with transaction.atomic():
+            admin, created = User.objects.get_or_create(username=username)
+            if created:
+                admin.set_password(admin_password)
+                admin.save()
+                UserProfile.objects.create(user=admin, organization=organization, role='admin')
+
+    batch_ids = []
+    start = datetime.date(2020, 1, 1)
+    for i in range(batches):
+        day = start + datetime.timedelta(days=30 * i)
+        df = generate_batch_frame(rng, entries, day)
+        batch_ids.append(ingest_dataframe(df, organization, batch_name=f'{day:%B %Y} upload'))
+    return organization, admin, batch_ids
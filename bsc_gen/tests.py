@@ -0,0 +1,581 @@
+import datetime
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
+
+import pandas as pd
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, dedup, explorer, perf, rollup, search, thresholds
+from .events import organization_summary
+from .bulk import bulk_ingest
+from .ingest import UploadError, ingest_dataframe, merge_dataframe
+from .middleware import PerfMiddleware
+from .models import (
+    PERSPECTIVE_MODELS, ActionPlan, ArchivedBatch, PerformanceReview, ScoreRollup, StrategyMap, ThresholdPolicy,
+    UploadLedger,
+)
+from .pivot import pivot
+from .plans import link_entries
+from .synthetic import generate_batch_frame, seed_organization
+
+
+class PlanQueryCountTests(TestCase):
+    """The action plan and review views run the same number of queries whatever the size of the batch"""
+
+    # Entries per batch; plans and reviews grow with them
+    SIZES = (20, 200)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admins = {}
+        cls.batch_ids = {}
+        for size in cls.SIZES:
+            organization, admin, batch_ids = seed_organization(f'Plans {size}', 2, size, admin_password='test-password1')
+            cls.admins[size] = admin
+            cls.batch_ids[size] = batch_ids[0]
+            for batch_id in batch_ids:
+                entries = {
+                    model: list(model.objects.filter(organization=organization, batch_id=batch_id))
+                    for model in PERSPECTIVE_MODELS.values()
+                }
+                for number in range(size // 2 + 1):
+                    plan = ActionPlan.objects.create(
+                        organization=organization, title=f'Plan {batch_id}-{number}', description='',
+                        assigned_to=admin, created_by=admin, status=ActionPlan.STATUS_CHOICES[number % 4][0],
+                        due_date=datetime.date(2024, 1, 1) + datetime.timedelta(days=number),
+                    )
+                    link_entries(plan, {model: rows[number::3] for model, rows in entries.items()})
+                for number in range(size // 5 + 1):
+                    PerformanceReview.objects.create(
+                        organization=organization, title=f'Review {batch_id}-{number}', reviewer=admin,
+                        scheduled_date=timezone.now() + datetime.timedelta(days=number), batch_id=batch_id,
+                    )
+
+    def assertFlatQueries(self, queries, url_name, with_batch=False):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                self.client.force_login(self.admins[size])
+                url = reverse(url_name, args=[self.batch_ids[size]] if with_batch else [])
+                self.client.get(url)  # fill the per-user caches
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_batch_plans(self):
+        self.assertFlatQueries(11, 'batch_plans', with_batch=True)
+
+    def test_batch_plans_api(self):
+        self.assertFlatQueries(11, 'batch_plans_api', with_batch=True)
+
+    def test_action_plans_api(self):
+        self.assertFlatQueries(11, 'action_plans_api')
+
+    def test_reviews_api(self):
+        self.assertFlatQueries(7, 'reviews_api')
+
+
+JUNK_CSV = 'perspective,objective,measure,target,actual\nNope,x,y,1,2\n'
+
+
+class UploadLedgerTests(TestCase):
+    """Ledger rows stop matching once their batch's entries change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, cls.admin, _ = seed_organization('Ledger', 0, 0, admin_password='test-password1')
+        cls.df = generate_batch_frame(random.Random(0), 20)
+
+    def setUp(self):
+        self.batch_id, created = dedup.ingest_once(self.df, self.organization, 'q1.csv', 'file-hash')
+        self.assertTrue(created)
+
+    def assertForgotten(self):
+        self.assertFalse(UploadLedger.objects.filter(organization=self.organization, batch_id=self.batch_id).exists())
+        _, created = dedup.ingest_once(self.df, self.organization, 'q1.csv', 'file-hash')
+        self.assertTrue(created)
+
+    def test_duplicate(self):
+        self.assertEqual(dedup.ingest_once(self.df, self.organization, 'copy.csv', 'other-hash'), (self.batch_id, False))
+
+    def test_merge(self):
+        changed = self.df.copy()
+        changed.loc[0, 'actual'] = '123456'
+        merge_dataframe(changed, self.organization, self.batch_id)
+        self.assertForgotten()
+
+    def test_unchanged_merge(self):
+        merge_dataframe(self.df, self.organization, self.batch_id)
+        self.assertTrue(UploadLedger.objects.filter(organization=self.organization, batch_id=self.batch_id).exists())
+
+    def test_update_batch(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('update_batch', args=[self.batch_id]), {})
+        self.assertForgotten()
+
+    def test_delete_batch(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('delete_batch', args=[self.batch_id]))
+        self.assertForgotten()
+
+    def test_no_known_perspective(self):
+        junk = pd.read_csv(io.StringIO(JUNK_CSV), dtype=str)
+        with self.assertRaisesMessage(UploadError, 'No rows with a known perspective'):
+            dedup.ingest_once(junk, self.organization, 'junk.csv', 'junk-hash')
+        self.assertFalse(UploadLedger.objects.filter(file_hash='junk-hash').exists())
+        # The next upload gets the next batch id, and the junk file still isn't a duplicate of it
+        _, created = dedup.ingest_once(generate_batch_frame(random.Random(1), 5), self.organization, 'q2.csv', 'q2')
+        self.assertTrue(created)
+        with self.assertRaises(UploadError):
+            dedup.ingest_once(junk, self.organization, 'junk.csv', 'junk-hash')
+
+    def test_bulk_merge_no_known_perspective(self):
+        real = generate_batch_frame(random.Random(2), 5).to_csv(index=False).encode()
+        junk, stored = bulk_ingest([
+            SimpleUploadedFile('junk.csv', JUNK_CSV.encode(), content_type='text/csv'),
+            SimpleUploadedFile('real.csv', real, content_type='text/csv'),
+        ], self.organization, merge=True)
+        self.assertFalse(junk['success'])
+        self.assertTrue(stored['success'])
+        self.assertEqual(
+            list(UploadLedger.objects.filter(organization=self.organization).exclude(batch_id=self.batch_id).values_list('file_name', flat=True)),
+            ['real.csv'],
+        )
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['perspective', 'objective', 'measure', 'owner', 'target', 'actual'])
+
+
+class MergeTests(TestCase):
+    """merge_dataframe matches entries on their key and refreshes the rollups of the perspectives it changed"""
+
+    BASE = [
+        ('Financial', 'Grow', 'Revenue', 'Ann', '100', '90'),
+        ('Financial', 'Grow', 'Revenue', 'Ann', '100', '95'),
+        ('Customer', 'Retain', 'Churn', 'Bob', '10', '10'),
+        ('Internal', 'Speed', 'Cycle time', 'Cy', '5', '5'),
+    ]
+    # The first Revenue row changes, the second doesn't and a third is new; Internal is left out
+    INCOMING = [
+        ('Financial', 'Grow', 'Revenue', 'Ann', '100', '91'),
+        ('Financial', 'Grow', 'Revenue', 'Ann', '100', '95'),
+        ('Financial', 'Grow', 'Revenue', 'Ann', '100', '70'),
+        ('Customer', 'Retain', 'Churn', 'Bob', '10', '10'),
+        ('Learning & Growth', 'Skills', 'Training hours', 'Dee', '20', '25'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, _, _ = seed_organization('Merge', 0, 0)
+        cls.batch_id = ingest_dataframe(frame(cls.BASE), cls.organization)
+
+    def actuals(self, perspective):
+        return list(
+            PERSPECTIVE_MODELS[perspective].objects.filter(organization=self.organization, batch_id=self.batch_id)
+            .order_by('pk').values_list('actual', flat=True)
+        )
+
+    def rollups(self):
+        return {
+            row['perspective']: row for row in
+            ScoreRollup.objects.filter(organization=self.organization, batch_id=self.batch_id).values()
+        }
+
+    def test_counts(self):
+        summary = merge_dataframe(frame(self.INCOMING), self.organization, self.batch_id)
+        self.assertEqual(summary, {
+            'batch_id': self.batch_id, 'inserted': 2, 'updated': 1, 'unchanged': 2, 'deleted': 0, 'missing': 1,
+        })
+        # Duplicate keys pair up in file order against id order
+        self.assertEqual(self.actuals('Financial'), ['91', '95', '70'])
+        self.assertEqual(self.actuals('Internal'), ['5'])
+        self.assertEqual(self.actuals('Learning & Growth'), ['25'])
+
+    def test_delete_missing(self):
+        summary = merge_dataframe(frame(self.INCOMING), self.organization, self.batch_id, delete_missing=True)
+        self.assertEqual((summary['deleted'], summary['missing']), (1, 0))
+        self.assertEqual(self.actuals('Internal'), [])
+
+    def test_unchanged(self):
+        summary = merge_dataframe(frame(self.BASE), self.organization, self.batch_id)
+        self.assertEqual(summary, {
+            'batch_id': self.batch_id, 'inserted': 0, 'updated': 0, 'unchanged': 4, 'deleted': 0, 'missing': 0,
+        })
+
+    def test_rollup_refresh(self):
+        before = self.rollups()
+        merge_dataframe(frame(self.INCOMING), self.organization, self.batch_id, delete_missing=True)
+        merged = self.rollups()
+        # Perspectives the merge didn't touch keep their row as it was
+        self.assertEqual(merged['Customer'], before['Customer'])
+        self.assertEqual(merged['Financial']['entries'], 3)
+        self.assertEqual(merged['Learning & Growth']['entries'], 1)
+
+        rollup.recompute(self.organization, self.batch_id)
+        recomputed = self.rollups()
+        for perspective, row in merged.items():
+            with self.subTest(perspective=perspective):
+                self.assertEqual({**row, 'updated_at': None}, {**recomputed[perspective], 'updated_at': None})
+        self.assertEqual(set(merged), set(recomputed))
+
+
+class ExplorerPaginationTests(TestCase):
+    """
+    Walking the cursors of every sort visits each entry once, in sort order.
+
+    Ties in the sort column, ids repeated across the perspective tables and
+    rows without an owner or actual all straddle page boundaries. On SQLite
+    the perspectives are merged in Python rather than by a UNION.
+    """
+
+    PER_PAGE = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, _, _ = seed_organization('Explorer', 3, 30)
+        stamp = timezone.now()
+        for model in PERSPECTIVE_MODELS.values():
+            for number, entry in enumerate(model.objects.filter(organization=cls.organization).order_by('pk')):
+                changes = {'objective': f'Objective {number % 3}'}
+                if number % 4 == 0:
+                    changes['owner'] = None
+                if number % 5 == 0:
+                    changes.update(actual='n/a', actual_value=None)
+                elif number % 2:
+                    changes.update(actual='50', actual_value=50.0)
+                if number % 6 == 0:
+                    changes['updated_at'] = stamp
+                model.objects.filter(pk=entry.pk).update(**changes)
+
+    def expected(self, sort):
+        name, descending = explorer.parse_sort(sort)
+        column, _ = explorer.SORTS[name]
+        keyed, nulls = [], []
+        for index, model in enumerate(PERSPECTIVE_MODELS.values()):
+            for pk, value in model.objects.filter(organization=self.organization).values_list('pk', column):
+                (nulls if value is None else keyed).append((value, pk, index))
+        keyed.sort(reverse=descending)
+        nulls.sort(reverse=descending)
+        return [(explorer.PERSPECTIVES[index], pk) for _, pk, index in keyed + nulls]
+
+    def test_walk(self):
+        for name in explorer.SORTS:
+            for sort in (name, f'-{name}'):
+                with self.subTest(sort=sort):
+                    seen = []
+                    cursor = None
+                    while True:
+                        page = explorer.explore(self.organization, sort=sort, cursor=cursor, per_page=self.PER_PAGE)
+                        seen.extend((entry['perspective'], entry['id']) for entry in page['entries'])
+                        cursor = page['next_cursor']
+                        if cursor is None:
+                            break
+                    self.assertEqual(len(seen), len(set(seen)))
+                    self.assertEqual(len(seen), page['total'])
+                    self.assertEqual(seen, self.expected(sort))
+
+
+class ImportParityTests(TestCase):
+    """bsc_import stores the same numbers and statuses as an upload through the dashboard"""
+
+    CSV = (
+        'perspective,objective,measure,target,actual\n'
+        'Financial,Revenue,Underscores,1_000,1_200\n'
+        'Financial,Revenue,Padded, 100 , 95 \n'
+        'Customer,Churn,Exponent,1e2,8E1\n'
+        'Customer,Churn,Not a number,100,nan\n'
+        'Internal,Speed,Infinite,100,inf\n'
+        'Internal,Speed,Text,100,n/a\n'
+        'Internal,Speed,Thousands,"1,000",900\n'
+        'Learning & Growth,Skills,Blank,10,\n'
+        'Learning & Growth,Skills,Signed,-10,+5\n'
+    )
+
+    def stored(self, organization):
+        return sorted(
+            (perspective, *row) for perspective, model in PERSPECTIVE_MODELS.items()
+            for row in model.objects.filter(organization=organization).values_list('measure', 'target_value', 'actual_value', 'status')
+        )
+
+    def test_parity(self):
+        web, admin, _ = seed_organization('Web', 0, 0, admin_password='test-password1')
+        self.client.force_login(admin)
+        self.client.post(reverse('dashboard'), {
+            'data_file': SimpleUploadedFile('edges.csv', self.CSV.encode(), content_type='text/csv'),
+        })
+        imported, _, _ = seed_organization('Imported', 0, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, 'edges.csv')
+            path.write_text(self.CSV)
+            call_command('bsc_import', str(path), org='Imported', stdout=io.StringIO())
+
+        expected = self.stored(web)
+        self.assertEqual(len(expected), self.CSV.count('\n') - 1)
+        self.assertIn(('Financial', 'Underscores', 1000.0, 1200.0, 'blue'), expected)
+        self.assertEqual(self.stored(imported), expected)
+
+
+class OrganizationSummaryTests(TestCase):
+    """The counts sent with every change event come from one ScoreRollup query"""
+
+    def test_counts(self):
+        organization, admin, batch_ids = seed_organization('Summary', 3, 25, admin_password='test-password1')
+        self.client.force_login(admin)
+        self.client.post(reverse('delete_batch', args=[batch_ids[0]]))
+        with self.assertNumQueries(1):
+            summary = organization_summary(organization)
+        self.assertEqual(summary, {
+            'entries': sum(model.objects.filter(organization=organization).count() for model in PERSPECTIVE_MODELS.values()),
+            'batches': 2,
+        })
+
+
+class ThresholdTests(TestCase):
+    """Stored statuses and attainment follow the direction of the measure's policy"""
+
+    MEASURE = 'Cycle time'
+    # (target, actual): on and either side of every cut-off, plus the rows without an attainment
+    EDGES = [
+        ('100', '79'), ('100', '80'), ('100', '81'), ('100', '100'), ('100', '119'), ('100', '120'),
+        ('100', '121'), ('100', '150'), ('100', ''), ('0', '5'), ('10', '8'), ('3', '2.4'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, cls.admin, _ = seed_organization('Thresholds', 0, 0, admin_password='test-password1')
+        edges = pd.DataFrame(
+            [{'perspective': 'Internal', 'objective': 'Speed', 'measure': cls.MEASURE, 'target': target, 'actual': actual}
+             for target, actual in cls.EDGES],
+        )
+        cls.batch_id = ingest_dataframe(pd.concat([edges, generate_batch_frame(random.Random(3), 60)]), cls.organization)
+
+    def entries(self, **filters):
+        return [
+            entry for model in PERSPECTIVE_MODELS.values()
+            for entry in model.objects.filter(organization=self.organization, **filters)
+        ]
+
+    def assertStatuses(self):
+        policies = thresholds.Policies(self.organization)
+        for entry in self.entries():
+            with self.subTest(measure=entry.measure, target=entry.target, actual=entry.actual):
+                self.assertEqual(entry.status, policies.classify(entry.actual_value, entry.target_value, entry.measure))
+
+    def test_sql_python_parity(self):
+        for bands in (thresholds.DEFAULT_BANDS, thresholds.LOWER_BANDS):
+            with self.subTest(direction=bands.direction):
+                ThresholdPolicy.objects.update_or_create(
+                    organization=self.organization, measure='', defaults=bands._asdict(),
+                )
+                thresholds.reevaluate(self.organization)
+                self.assertStatuses()
+
+    def test_policy_change(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('thresholds_api'), {'measure': self.MEASURE, 'direction': 'lower'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {entry.actual: entry.status for entry in self.entries(measure=self.MEASURE, target='100')},
+            {'79': 'blue', '80': 'blue', '81': 'good', '100': 'good', '119': 'moderate', '120': 'moderate',
+             '121': 'bad', '150': 'bad', '': 'unknown'},
+        )
+        self.assertStatuses()
+
+        response = self.client.delete(reverse('thresholds_api') + '?measure=' + self.MEASURE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {entry.actual: entry.status for entry in self.entries(measure=self.MEASURE, target='100')},
+            {'79': 'bad', '80': 'moderate', '81': 'moderate', '100': 'good', '119': 'good', '120': 'blue',
+             '121': 'blue', '150': 'blue', '': 'unknown'},
+        )
+        self.assertStatuses()
+
+    def test_pivot_lower_attainment(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('thresholds_api'), {'measure': self.MEASURE, 'direction': 'lower'})
+        result = pivot(self.organization, rows=['measure'], aggregate='avg_attainment')
+        cell = result['cells'][result['row_keys'].index([self.MEASURE])][0]
+
+        cap = rollup.attainment_cap()
+        attainments = [
+            max(0.0, min(2 - entry.actual_value / entry.target_value, cap))
+            for entry in self.entries(measure=self.MEASURE)
+            if entry.actual_value is not None and entry.target_value
+        ]
+        self.assertEqual(len(attainments), len(self.EDGES) - 2)
+        self.assertAlmostEqual(cell, sum(attainments) / len(attainments))
+
+
+class ArchiveTests(TestCase):
+    """Batches come back from their Parquet file as they went in"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, cls.admin, cls.batch_ids = seed_organization('Archive', 3, 40, admin_password='test-password1')
+        cls.kept_map, cls.deleted_map = (
+            StrategyMap.objects.create(organization=cls.organization, name=name) for name in ('Kept', 'Deleted')
+        )
+        for model in PERSPECTIVE_MODELS.values():
+            entries = list(model.objects.filter(organization=cls.organization, batch_id=cls.batch_ids[0]).order_by('pk'))
+            for number, entry in enumerate(entries):
+                entry.strategy_map = (cls.kept_map, cls.deleted_map, None)[number % 3]
+            model.objects.bulk_update(entries, ['strategy_map'])
+        plan = ActionPlan.objects.create(
+            organization=cls.organization, title='Plan', description='', assigned_to=cls.admin, created_by=cls.admin,
+            status='not_started', due_date=datetime.date(2024, 1, 1),
+        )
+        link_entries(plan, {
+            model: model.objects.filter(organization=cls.organization, batch_id=cls.batch_ids[1])[:1]
+            for model in PERSPECTIVE_MODELS.values()
+        })
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(BSC_ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def rows(self, batch_id):
+        return {
+            perspective: list(
+                model.objects.filter(organization=self.organization, batch_id=batch_id).order_by('pk')
+                .values(*[field.attname for field in model._meta.concrete_fields if not field.primary_key])
+            )
+            for perspective, model in PERSPECTIVE_MODELS.items()
+        }
+
+    def test_round_trip(self):
+        batch_id = self.batch_ids[0]
+        before = self.rows(batch_id)
+        stub = archive.archive_batch(self.organization, batch_id)
+        self.assertEqual(stub.entries, sum(len(rows) for rows in before.values()))
+        self.assertTrue(archive.file_path(stub).exists())
+        self.assertFalse(any(self.rows(batch_id).values()))
+
+        deleted_pk = self.deleted_map.pk
+        self.deleted_map.delete()
+        for rows in before.values():
+            for row in rows:
+                if row['strategy_map_id'] == deleted_pk:
+                    row['strategy_map_id'] = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.restore_batch(self.organization, batch_id), stub.entries)
+        self.assertEqual(self.rows(batch_id), before)
+        self.assertTrue(any(row['strategy_map_id'] == self.kept_map.pk for rows in before.values() for row in rows))
+        self.assertFalse(ArchivedBatch.objects.filter(organization=self.organization).exists())
+        self.assertFalse(archive.file_path(stub).exists())
+
+    def test_planned_batches_skipped(self):
+        call_command('bsc_archive', org=['Archive'], days=0, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(ArchivedBatch.objects.filter(organization=self.organization).values_list('batch_id', flat=True)),
+            sorted(batch_id for batch_id in self.batch_ids if batch_id != self.batch_ids[1]),
+        )
+        self.assertTrue(any(self.rows(self.batch_ids[1]).values()))
+
+    def test_delete_archived_batch(self):
+        stub = archive.archive_batch(self.organization, self.batch_ids[2])
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_batch', args=[self.batch_ids[2]]))
+        self.assertFalse(ArchivedBatch.objects.filter(pk=stub.pk).exists())
+        self.assertFalse(archive.file_path(stub).exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The search triggers are SQLite only')
+class SearchTriggerMigrationTests(TransactionTestCase):
+    """Migrating back to the search index keeps its triggers, although later migrations rebuild the tables"""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+
+    def test_back_to_search_index(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('bsc_gen')[0]
+        self.addCleanup(self.migrate, latest)
+        self.migrate(('bsc_gen', '0010_search_index'))
+        with connection.cursor() as cursor:
+            self.assertEqual(search.missing_sqlite_triggers(cursor), [])
+
+
+def count_users():
+    User.objects.count()
+    User.objects.exists()
+    return HttpResponse('ok')
+
+
+@override_settings(BSC_PERF_ENABLED=True)
+class PerfMiddlewareTests(TestCase):
+    """PerfMiddleware records the queries of a request whether the handler runs sync or async"""
+
+    def setUp(self):
+        patcher = mock.patch('bsc_gen.middleware.registry', perf.PerfRegistry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertRecorded(self):
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['<unresolved>|sql_queries']['sum'], 2)
+        self.assertEqual(snapshot['<unresolved>|response_bytes']['sum'], 2)
+
+    def test_sync(self):
+        middleware = PerfMiddleware(lambda request: count_users())
+        self.assertFalse(iscoroutinefunction(middleware))
+        middleware(RequestFactory().get('/'))
+        self.assertRecorded()
+
+    async def test_async(self):
+        async def get_response(request):
+            return await sync_to_async(count_users)()
+
+        middleware = PerfMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(RequestFactory().get('/'))
+        self.assertRecorded()
+
+
+class PerfSnapshotTests(SimpleTestCase):
+    """Snapshot files of exited or long idle processes are pruned, others are kept"""
+
+    def test_prune(self):
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        dead_pid = int(exited.stdout)
+        host = socket.gethostname()
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            perf.write_snapshot(snapshot_dir, perf.registry.snapshot())
+            names = {
+                'exited': f'perf-{host}-{dead_pid}.json',
+                'exited_old_name': f'perf-{dead_pid}.json',
+                'other_host': f'perf-elsewhere-{dead_pid}.json',
+                'other_host_old': f'perf-elsewhere-{os.getpid()}.json',
+            }
+            for name in names.values():
+                Path(snapshot_dir, name).write_text('{"written_at": 0, "histograms": {}}')
+            stale = time.time() - 7200
+            os.utime(Path(snapshot_dir, names['other_host_old']), (stale, stale))
+
+            self.assertEqual(perf.prune_snapshots(snapshot_dir, max_age=3600), 3)
+            self.assertEqual(
+                sorted(path.name for path in Path(snapshot_dir).iterdir()),
+                sorted([f'perf-{host}-{os.getpid()}.json', names['other_host']]),
+            )
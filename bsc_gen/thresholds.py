@@ -0,0 +1,180 @@
+"""
+Status bands: which actual/target ratios count as blue, good, moderate or bad.
+
+Every organization can have a ThresholdPolicy per measure (matched on the
+measure's exact text), plus one with a blank measure that applies to all its
+other measures; without one the
+classic bands hold (1.2x target is blue, 1.0x good, 0.8x moderate). A policy
+is higher-is-better or lower-is-better: for a lower-is-better measure, such
+as a processing time, an actual at or under ``blue_at`` x target is blue.
+
+The same direction applies to attainment, used by the scores, trends,
+pivots and alerts: actual / target for a higher-is-better measure, and
+mirrored around the target (2 - actual / target) for a lower-is-better one,
+so that 20% under target counts as 1.2 - the cut-offs of LOWER_BANDS then
+match those of DEFAULT_BANDS.
+
+Entries store their status. It is set by the one SQL ``CASE`` built here,
+which ``rollup.recompute`` runs over the batch before counting statuses, so
+every upload, edit and import gets it. When a policy changes, ``reevaluate``
+runs the same statement over the organization's entries of that measure and
+rebuilds the status counts, instead of classifying entry by entry.
+"""
+from collections import namedtuple
+
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+from .models import PERSPECTIVE_MODELS, ThresholdPolicy
+
+
+Bands = namedtuple('Bands', ['direction', 'blue_at', 'good_at', 'moderate_at'])
+
+DEFAULT_BANDS = Bands('higher', 1.2, 1.0, 0.8)
+# What a new lower-is-better policy starts from
+LOWER_BANDS = Bands('lower', 0.8, 1.0, 1.2)
+
+
+def classify(actual, target, bands=DEFAULT_BANDS):
+    """Status of an actual value against its target: blue, good, moderate, bad or unknown"""
+    if actual is None or target is None:
+        return 'unknown'
+    if bands.direction == 'lower':
+        reached = lambda cut_off: actual <= cut_off * target
+    else:
+        reached = lambda cut_off: actual >= cut_off * target
+    if reached(bands.blue_at):
+        return 'blue'
+    if reached(bands.good_at):
+        return 'good'
+    if reached(bands.moderate_at):
+        return 'moderate'
+    return 'bad'
+
+
+def attainment(actual, target, bands=DEFAULT_BANDS):
+    """How well an actual value meets its target, 1.0 meaning exactly; None without numbers or with a zero target"""
+    if actual is None or target is None or target == 0:
+        return None
+    ratio = actual / target
+    return 2 - ratio if bands.direction == 'lower' else ratio
+
+
+def policy_bands(policy):
+    return Bands(policy.direction, policy.blue_at, policy.good_at, policy.moderate_at)
+
+
+class Policies:
+    """The bands of one organization, by measure"""
+
+    def __init__(self, organization):
+        self.default = DEFAULT_BANDS
+        self.by_measure = {}
+        for policy in ThresholdPolicy.objects.filter(organization=organization).order_by('measure'):
+            if policy.measure:
+                self.by_measure[policy.measure] = policy_bands(policy)
+            else:
+                self.default = policy_bands(policy)
+
+    def bands(self, measure):
+        return self.by_measure.get(measure, self.default)
+
+    def classify(self, actual, target, measure):
+        return classify(actual, target, self.bands(measure))
+
+    def attainment(self, actual, target, measure):
+        return attainment(actual, target, self.bands(measure))
+
+    def lower_filter(self):
+        """Q matching the organization's entries of lower-is-better measures, None when there are none"""
+        lower = [measure for measure, bands in self.by_measure.items() if bands.direction == 'lower']
+        parts = [Q(measure__in=lower)] if lower else []
+        if self.default.direction == 'lower':
+            parts.append(~Q(measure__in=list(self.by_measure)) if self.by_measure else Q(pk__isnull=False))
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else parts[0] | parts[1]
+
+    def attainment_expression(self):
+        return attainment_expression(self.lower_filter())
+
+
+def policy_dict(policy):
+    return {
+        'measure': policy.measure,
+        'direction': policy.direction,
+        'blue_at': policy.blue_at,
+        'good_at': policy.good_at,
+        'moderate_at': policy.moderate_at,
+        'updated_at': policy.updated_at,
+    }
+
+
+def bands_case(bands):
+    """CASE over actual_value/target_value giving the status ``classify`` gives"""
+    target = F('target_value')
+    lookup = 'actual_value__lte' if bands.direction == 'lower' else 'actual_value__gte'
+    return Case(
+        When(Q(actual_value__isnull=True) | Q(target_value__isnull=True), then=Value('unknown')),
+        When(Q(**{lookup: target * bands.blue_at}), then=Value('blue')),
+        When(Q(**{lookup: target * bands.good_at}), then=Value('good')),
+        When(Q(**{lookup: target * bands.moderate_at}), then=Value('moderate')),
+        default=Value('bad'),
+    )
+
+
+def attainment_expression(lower=None):
+    """SQL form of ``attainment``: mirrored for the entries matching the Q ``lower``. Only for entries with a non-zero target"""
+    ratio = F('actual_value') / F('target_value')
+    if lower is None:
+        return ratio
+    return Case(When(lower, then=Value(2.0) - ratio), default=ratio, output_field=FloatField())
+
+
+def lower_filter_all():
+    """Q matching the lower-is-better entries of every organization, None when there are none"""
+    lower = None
+    for organization_id in ThresholdPolicy.objects.filter(direction='lower').values_list('organization_id', flat=True).distinct():
+        condition = Policies(organization_id).lower_filter()
+        if condition is not None:
+            condition &= Q(organization_id=organization_id)
+            lower = condition if lower is None else lower | condition
+    return lower
+
+
+def status_expression(policies):
+    """The status of an entry as one SQL expression, measure policies first"""
+    if not policies.by_measure:
+        return bands_case(policies.default)
+    return Case(
+        *[When(measure=measure, then=bands_case(bands)) for measure, bands in policies.by_measure.items()],
+        default=bands_case(policies.default),
+    )
+
+
+def refresh(queryset, policies):
+    """Store the status of the entries of ``queryset`` whose status is out of date; returns how many"""
+    expression = status_expression(policies)
+    # Only rows whose status changes are written
+    return queryset.exclude(status=expression).update(status=expression)
+
+
+def reevaluate(organization, measure=None):
+    """
+    Re-classify the organization's entries after a policy change, then rebuild its scores and status counts.
+
+    ``measure`` limits it to the entries of that measure; leave it out when
+    the organization-wide policy changed. Returns the number of entries whose
+    status changed.
+    """
+    from . import rollup
+
+    policies = Policies(organization)
+    changed = 0
+    for model in PERSPECTIVE_MODELS.values():
+        entries = model.objects.filter(organization=organization)
+        if measure:
+            entries = entries.filter(measure=measure)
+        changed += refresh(entries, policies)
+    # A change of direction moves the attainment of the scores even where no status changed
+    rollup.recompute_organization(organization, refresh_statuses=False)
+    return changed
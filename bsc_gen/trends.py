@@ -0,0 +1,159 @@
+"""
+Batch-to-batch trends of the same measure.
+
+Entries are keyed by (perspective, objective, measure, owner); for every key
+we track the actual and target of each batch and derive the change since the
+previous batch, the attainment (actual / target, mirrored for lower-is-better
+measures, see thresholds.py) and its rolling mean.
+
+Only the perspective tables are read: archived batches (see archive.py) are
+left out, and /api/trends/ lists them under ``archived_batches``.
+
+Everything is computed with pandas over ``values_list`` rows. The result is
+cached per organization together with the data version it was built from
+(kept in the database, so writes by other processes are seen too);
+when the version moves on, only the batches named in the change log are
+reloaded from the database, and when the change is just new batches on top of
+the history only their derived rows are computed.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+from .events import RESET_EVENTS, changes_since, data_version
+from .models import PERSPECTIVE_MODELS, ArchivedBatch
+from .thresholds import Policies
+
+
+KEY = ['perspective', 'objective', 'measure', 'owner']
+CACHE_PREFIX = 'bsc_trends:'
+
+
+def rolling_window():
+    return getattr(settings, 'BSC_TREND_WINDOW', 3)
+
+
+def load_values(organization, batch_ids=None):
+    """Mean target/actual per key and batch, as a long DataFrame"""
+    frames = []
+    for perspective, model in PERSPECTIVE_MODELS.items():
+        queryset = model.objects.filter(organization=organization).exclude(batch_id=None)
+        if batch_ids is not None:
+            queryset = queryset.filter(batch_id__in=batch_ids)
+        rows = list(queryset.values_list('batch_id', 'objective', 'measure', 'owner', 'target', 'actual'))
+        if rows:
+            frame = pd.DataFrame(rows, columns=['batch_id', 'objective', 'measure', 'owner', 'target', 'actual'])
+            frame['perspective'] = perspective
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=KEY + ['batch_id', 'batch_order', 'target', 'actual', 'lower'])
+
+    df = pd.concat(frames, ignore_index=True)
+    df['owner'] = df['owner'].fillna('')
+    df['target'] = pd.to_numeric(df['target'], errors='coerce')
+    df['actual'] = pd.to_numeric(df['actual'], errors='coerce')
+    df = df.groupby(KEY + ['batch_id'], as_index=False, sort=False)[['target', 'actual']].mean()
+    df['batch_order'] = pd.to_numeric(df['batch_id'], errors='coerce')
+    policies = Policies(organization)
+    df['lower'] = df['measure'].map({measure: policies.bands(measure).direction == 'lower' for measure in df['measure'].unique()}).astype(bool)
+    return df
+
+
+def derive(df, window):
+    """Add delta, delta_pct, attainment and rolling_attainment columns, per key in batch order"""
+    df = df.sort_values(KEY + ['batch_order', 'batch_id'], kind='stable').reset_index(drop=True)
+    if df.empty:
+        return df.assign(attainment=[], delta=[], delta_pct=[], rolling_attainment=[])
+    grouped = df.groupby(KEY, sort=False)
+    previous = grouped['actual'].shift(1)
+    target = df['target'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(target != 0, df['actual'].to_numpy(dtype=float) / target, np.nan)
+    df['attainment'] = np.where(df['lower'].to_numpy(dtype=bool), 2 - ratio, ratio)
+    df['delta'] = df['actual'] - previous
+    df['delta_pct'] = np.where(previous != 0, df['delta'] / previous, np.nan)
+    df['rolling_attainment'] = (
+        df.groupby(KEY, sort=False)['attainment']
+        .rolling(window, min_periods=1).mean()
+        .reset_index(level=list(range(len(KEY))), drop=True)
+    )
+    return df
+
+
+def append_batches(trend, new_values, window):
+    """Derive rows for batches that all come after the cached history, looking back only ``window`` rows per key"""
+    history = trend.groupby(KEY, sort=False).tail(window)[new_values.columns]
+    derived = derive(pd.concat([history, new_values], ignore_index=True), window)
+    new_keys = set(new_values['batch_id'])
+    derived = derived[derived['batch_id'].isin(new_keys)]
+    return pd.concat([trend, derived], ignore_index=True)
+
+
+def organization_trends(organization):
+    """The organization's trend DataFrame, one row per key and batch"""
+    window = rolling_window()
+    key = f'{CACHE_PREFIX}{organization.pk}'
+    version = data_version(organization.pk)
+    state = cache.get(key)
+    if state and state['version'] == version and state['window'] == window:
+        return state['trend']
+
+    changes = changes_since(organization.pk, state['version']) if state and state['window'] == window else None
+    if changes is None or any(change['type'] in RESET_EVENTS for change in changes):
+        trend = derive(load_values(organization), window)
+    else:
+        trend = state['trend']
+        changed = {change['batch_id'] for change in changes if change['type'] != 'batch_renamed'}
+        if changed:
+            new_values = load_values(organization, changed)
+            cached_orders = trend['batch_order'].dropna()
+            new_orders = pd.to_numeric(pd.Series(sorted(changed)), errors='coerce')
+            only_new = (
+                not trend['batch_id'].isin(changed).any()
+                and new_orders.notna().all()
+                and (cached_orders.empty or new_orders.min() > cached_orders.max())
+            )
+            if only_new:
+                trend = append_batches(trend, new_values, window)
+            else:
+                # Edits or deletes in the middle of the history shift every later delta
+                values = pd.concat([
+                    trend.loc[~trend['batch_id'].isin(changed), new_values.columns],
+                    new_values,
+                ], ignore_index=True)
+                trend = derive(values, window)
+
+    cache.set(key, {'version': version, 'window': window, 'trend': trend}, getattr(settings, 'BSC_TREND_CACHE_TTL', 3600))
+    return trend
+
+
+def archived_batches(organization):
+    """Ids of the organization's archived batches, which trends don't cover"""
+    return list(ArchivedBatch.objects.filter(organization=organization).order_by('batch_id').values_list('batch_id', flat=True))
+
+
+def trend_series(organization, filters=None, last=None):
+    """
+    Trends grouped per key, ready for JSON.
+
+    ``filters`` may restrict any of the key columns to an exact value; ``last``
+    keeps only the newest N batches of every series.
+    """
+    trend = organization_trends(organization)
+    for column, value in (filters or {}).items():
+        if value not in (None, ''):
+            trend = trend[trend[column] == value]
+
+    series = []
+    for key, rows in trend.groupby(KEY, sort=True):
+        if last:
+            rows = rows.tail(last)
+        points = rows[['batch_id', 'target', 'actual', 'attainment', 'delta', 'delta_pct', 'rolling_attainment']]
+        # NaN is not valid JSON
+        points = points.astype(object).where(points.notna(), None)
+        series.append({
+            **dict(zip(KEY, key)),
+            'points': points.to_dict('records'),
+        })
+    return series
@@ -0,0 +1,187 @@
+"""
+Upload handling for the dashboard and bulk uploads: spooled to disk, checked while streaming.
+
+The default handlers keep small uploads in memory and pandas then reads the
+whole buffer again. LimitedUploadHandler always writes to a temporary file
+and stops the upload as soon as it can tell it will be refused:
+
+* the request's Content-Length is over the limit - before any byte is read;
+* a file gets over the organization's byte limit;
+* a CSV has more lines than the row limit (counted on the raw bytes, so
+  quoted multi-line cells count extra), or its header row - the first line
+  received - lacks a required column;
+* an .xlsx/.xls file doesn't start like one. XLSX header and row count come
+  from the sheet's first row and dimension once the file is on disk, without
+  reading the rows.
+
+The message ends up in ``request.upload_error``; the view checks it before
+looking at ``request.FILES``. Parsing then reads the spooled file by path
+(see ingest.read_dataframe).
+"""
+import csv
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .ingest import REQUIRED_COLUMNS
+
+
+MAX_HEADER_BYTES = 64 * 1024
+# Room for the other form fields and multipart boundaries next to the file
+FORM_OVERHEAD = 64 * 1024
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0'
+
+
+def upload_limits(organization):
+    """(max bytes, max rows) per file for ``organization``"""
+    max_bytes = getattr(settings, 'BSC_UPLOAD_MAX_BYTES', 25 * 1024 * 1024)
+    max_rows = getattr(settings, 'BSC_UPLOAD_MAX_ROWS', 200000)
+    if organization is not None:
+        if organization.max_upload_mb:
+            max_bytes = organization.max_upload_mb * 1024 * 1024
+        if organization.max_upload_rows:
+            max_rows = organization.max_upload_rows
+    return max_bytes, max_rows
+
+
+def missing_columns(header):
+    """Required columns missing from a header row, compared the way read_dataframe does"""
+    return REQUIRED_COLUMNS - {str(column).lower() for column in header if column is not None}
+
+
+def missing_message(missing):
+    return f"Missing required columns: {', '.join(sorted(missing))}. Required: {', '.join(sorted(REQUIRED_COLUMNS))}"
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools every file to disk and refuses it mid-stream when it breaks a limit.
+
+    ``max_bytes``/``max_rows`` apply per file (ZIP archives are only held to
+    ``max_request_bytes``, their members are checked when unpacked).
+    """
+
+    def __init__(self, request, max_bytes, max_rows, max_request_bytes):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.max_request_bytes = max_request_bytes
+        self.rejected = None
+
+    def reject(self, message):
+        self.rejected = message
+        self.request.upload_error = message
+        if hasattr(self, 'file'):
+            self.upload_interrupted()
+        # Read and drop the rest of the body so the client gets the error rather than a reset connection
+        raise StopUpload(connection_reset=False)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Exceptions raised here aren't caught by the parser, new_file() raises instead
+        if content_length > self.max_request_bytes:
+            self.rejected = f'Upload too large, at most {self.max_request_bytes // (1024 * 1024)} MB.'
+        return None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        if self.rejected:
+            self.reject(self.rejected)
+        super().new_file(field_name, file_name, *args, **kwargs)
+        name = file_name.lower()
+        self.kind = next((kind for kind in ('csv', 'xlsx', 'xls', 'zip') if name.endswith('.' + kind)), None)
+        self.head = b''
+        self.header_checked = False
+        self.lines = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.kind != 'zip' and start + len(raw_data) > self.max_bytes:
+            self.reject(f'{self.file_name} is too large, at most {self.max_bytes // (1024 * 1024)} MB per file.')
+        if self.kind == 'csv':
+            self.check_csv(raw_data)
+        elif self.kind in ('xlsx', 'xls') and start == 0:
+            magic = XLSX_MAGIC if self.kind == 'xlsx' else XLS_MAGIC
+            if not raw_data.startswith(magic):
+                self.reject(f'{self.file_name} is not a valid Excel file.')
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_csv(self, raw_data):
+        if not self.header_checked:
+            self.head += raw_data
+            end = self.head.find(b'\n')
+            if end == -1:
+                if len(self.head) > MAX_HEADER_BYTES:
+                    self.reject(f'{self.file_name}: the header row is too long.')
+                return
+            self.header_checked = True
+            line = self.head[:end].decode('utf-8-sig', errors='replace')
+            missing = missing_columns(next(csv.reader([line]), []))
+            if missing:
+                self.reject(f'{self.file_name}: {missing_message(missing)}')
+            # Lines after the header in what arrived so far
+            self.lines = self.head.count(b'\n') - 1
+            self.head = b''
+        else:
+            self.lines += raw_data.count(b'\n')
+        if self.lines > self.max_rows:
+            self.reject(f'{self.file_name} has more than {self.max_rows} rows.')
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if self.kind == 'csv' and not self.header_checked:
+            # Header only, no newline; checked the same way
+            missing = missing_columns(next(csv.reader([self.head.decode('utf-8-sig', errors='replace')]), []))
+            if missing:
+                self.reject(f'{self.file_name}: {missing_message(missing)}')
+        elif self.kind == 'xlsx':
+            self.check_xlsx(uploaded.temporary_file_path())
+        return uploaded
+
+    def check_xlsx(self, path):
+        from openpyxl import load_workbook
+
+        try:
+            workbook = load_workbook(path, read_only=True, data_only=True)
+        except Exception:
+            self.reject(f'{self.file_name} is not a valid Excel file.')
+        try:
+            sheet = workbook.active
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            # max_row comes from the sheet's <dimension> record; None when the writer left it out
+            rows = (sheet.max_row or 1) - 1
+        finally:
+            workbook.close()
+        missing = missing_columns(header)
+        if missing:
+            self.reject(f'{self.file_name}: {missing_message(missing)}')
+        if rows > self.max_rows:
+            self.reject(f'{self.file_name} has more than {self.max_rows} rows.')
+
+
+def limited_uploads(max_request_bytes=None):
+    """
+    Install LimitedUploadHandler for the view, with the limits of ``request.bsc_org``.
+
+    Upload handlers must be set before anything reads request.POST, which
+    CsrfViewMiddleware does, so the view is CSRF-exempted and protected
+    again after the handler is in place. ``max_request_bytes`` defaults to
+    the per-file limit plus some room for the form.
+    """
+    def decorator(view_func):
+        protected = csrf_protect(view_func)
+
+        @csrf_exempt
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method == 'POST':
+                max_bytes, max_rows = upload_limits(getattr(request, 'bsc_org', None))
+                request.upload_error = None
+                request.upload_handlers = [LimitedUploadHandler(
+                    request, max_bytes, max_rows, max_request_bytes or max_bytes + FORM_OVERHEAD,
+                )]
+                # Parse the body now so that upload_error is set before the view looks at it
+                request.FILES
+            return protected(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
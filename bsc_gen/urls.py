@@ -18,7 +18,8 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import register, login_view, logout_view, dashboard, bsc_data_api, bsc_detailed_view, delete_bsc_data, delete_batch, update_batch, profile_view, add_viewer, delete_viewer, batch_details_api, rename_batch, generate_batch_pdf, forgot_password, password_reset_confirm
+from .async_views import bsc_data_api_async, batch_details_api_async, batch_list_api_async
+from .views import register, login_view, logout_view, dashboard, bsc_data_api, bsc_detailed_view, delete_bsc_data, delete_batch, update_batch, profile_view, add_viewer, delete_viewer, batch_details_api, rename_batch, generate_batch_pdf, forgot_password, password_reset_confirm, perf_metrics, batch_card, event_stream, trends_api, scores_api, thresholds_api, strategy_map_api, batch_plans, batch_plans_api, action_plans_api, action_plan_status, reviews_api, search_api, entries_api, bulk_upload, export_xlsx, restore_batch, pivot_api
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -31,12 +32,34 @@ urlpatterns = [
     path('delete-viewer/<int:viewer_id>/', delete_viewer, name='delete_viewer'),
     path('api/bsc-data/', bsc_data_api, name='bsc_data_api'),
     path('bsc-detailed/', bsc_detailed_view, name='bsc_detailed'),
+    path('api/entries/', entries_api, name='entries_api'),
     path('delete-bsc-data/', delete_bsc_data, name='delete_bsc_data'),
     path('delete-batch/<str:batch_id>/', delete_batch, name='delete_batch'),
     path('update-batch/<str:batch_id>/', update_batch, name='update_batch'),
     path('rename-batch/<str:batch_id>/', rename_batch, name='rename_batch'),
+    path('restore-batch/<str:batch_id>/', restore_batch, name='restore_batch'),
+    path('bulk-upload/', bulk_upload, name='bulk_upload'),
+    path('batch-card/<str:batch_id>/', batch_card, name='batch_card'),
+    path('events/', event_stream, name='event_stream'),
     path('batch-report/<str:batch_id>/', generate_batch_pdf, name='batch_report_pdf'),
+    path('export/xlsx/', export_xlsx, name='export_xlsx'),
+    path('batch-plans/<str:batch_id>/', batch_plans, name='batch_plans'),
     path('api/batch-details/', batch_details_api, name='batch_details_api'),
+    path('api/search/', search_api, name='search_api'),
+    path('api/trends/', trends_api, name='trends_api'),
+    path('api/scores/', scores_api, name='scores_api'),
+    path('api/pivot/', pivot_api, name='pivot_api'),
+    path('api/thresholds/', thresholds_api, name='thresholds_api'),
+    path('api/batch-plans/<str:batch_id>/', batch_plans_api, name='batch_plans_api'),
+    path('api/action-plans/', action_plans_api, name='action_plans_api'),
+    path('api/action-plans/<int:plan_id>/status/', action_plan_status, name='action_plan_status'),
+    path('api/reviews/', reviews_api, name='reviews_api'),
+    path('api/strategy-map/', strategy_map_api, name='strategy_map_api'),
+    path('api/strategy-map/<int:map_id>/', strategy_map_api, name='strategy_map_detail_api'),
+    path('api/async/bsc-data/', bsc_data_api_async, name='bsc_data_api_async'),
+    path('api/async/batch-details/', batch_details_api_async, name='batch_details_api_async'),
+    path('api/async/batches/', batch_list_api_async, name='batch_list_api_async'),
+    path('metrics/', perf_metrics, name='perf_metrics'),
     path('forgot-password/', forgot_password, name='forgot_password'),
     path('reset-password/<uidb64>/<token>/', password_reset_confirm, name='password_reset_confirm'),
     path('', dashboard, name='home')
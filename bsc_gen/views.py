@@ -1,16 +1,32 @@
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .models import Organization, UserProfile, FinancialBSC, CustomerBSC, InternalBSC, LearningGrowthBSC
-import pandas as pd
+from .models import PERSPECTIVE_MODELS, STATUSES, ActionPlan, ArchivedBatch, Organization, PerformanceReview, StrategyMap, ThresholdPolicy, UserProfile, FinancialBSC, CustomerBSC, InternalBSC, LearningGrowthBSC
+from . import archive, dedup, dimensions, explorer, export, rollup, thresholds
+from .archive import ArchiveError
+from .bulk import bulk_ingest
+from .decorators import admin_required, employee_required, replica_reads
+from .events import astream_events, publish_change, stream_events
+from .explorer import ExplorerError
+from .ingest import ALLOWED_EXTENSIONS, UploadError, merge_dataframe, read_dataframe
+from .perf import registry as perf_registry
+from .pivot import FILTERS as PIVOT_FILTERS, PivotError, pivot
+from .rows import batch_rows, build_batches, iter_rows, row_dict, status_counts
+from .search import search as search_entries
+from . import plans
+from .strategy import StrategyMapError, evaluated_map, serialize as serialize_strategy_map
+from .trends import KEY as TREND_KEY, archived_batches as archived_trend_batches, trend_series
+from .uploads import limited_uploads
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.views.decorators.http import require_POST, require_GET
-from collections import defaultdict
 from django.views.decorators.csrf import csrf_exempt
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.urls import reverse
 import datetime
 from weasyprint import HTML
@@ -23,6 +39,8 @@ import base64
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.mail import send_mail
 from django.conf import settings
 
@@ -30,6 +48,10 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
+def is_ajax(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+
 # Authentication Functions
 def register(request):
     if request.method == 'POST':
@@ -86,224 +108,124 @@ def logout_view(request):
 
 # Core Dashboard Function
 @login_required(login_url='login')
+@replica_reads
+@limited_uploads()
 def dashboard(request):
     user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-        is_employee = profile.role == 'employee'
-        organization = profile.organization
-    except UserProfile.DoesNotExist:
-        is_admin = False
-        is_employee = False
-        organization = None
-
-    # Get data from all BSC perspective tables
-    bsc_entries = []
-    if organization:
-        # Get entries from all perspective tables, filtered by organization
-        financial_entries = FinancialBSC.objects.filter(organization=organization)
-        customer_entries = CustomerBSC.objects.filter(organization=organization)
-        internal_entries = InternalBSC.objects.filter(organization=organization)
-        learning_entries = LearningGrowthBSC.objects.filter(organization=organization)
-        
-        # Combine all entries with their perspective information
-        for entry in financial_entries:
-            bsc_entries.append({
-                'model': 'Financial',
-                'entry': entry,
-                'perspective': 'Financial'
-            })
-        for entry in customer_entries:
-            bsc_entries.append({
-                'model': 'Customer',
-                'entry': entry,
-                'perspective': 'Customer'
-            })
-        for entry in internal_entries:
-            bsc_entries.append({
-                'model': 'Internal',
-                'entry': entry,
-                'perspective': 'Internal'
-            })
-        for entry in learning_entries:
-            bsc_entries.append({
-                'model': 'Learning & Growth',
-                'entry': entry,
-                'perspective': 'Learning & Growth'
-            })
-
-    batch_map = defaultdict(list)
-    batch_times = {}
-    for bsc_item in bsc_entries:
-        entry = bsc_item['entry']
-        if not entry.batch_id:
-            continue  # skip entries without a batch_id
-        batch_map[entry.batch_id].append(bsc_item)
-        if entry.batch_id not in batch_times or (entry.upload_time and entry.upload_time < batch_times[entry.batch_id]):
-            batch_times[entry.batch_id] = entry.upload_time
-
-    bsc_batches = []
-    for batch_id in sorted(batch_map.keys(), reverse=True):
-        entries = []
-        batch_name = None
-        for bsc_item in batch_map[batch_id]:
-            entry = bsc_item['entry']
-            perspective = bsc_item['perspective']
-            
-            # Get batch name from the first entry (they should all have the same batch_name)
-            if batch_name is None:
-                batch_name = entry.batch_name
-            
-            # Use the built-in status calculation method
-            status = entry.get_status()
-            
-            entries.append({
-                'perspective': perspective,
-                'objective': entry.objective,
-                'measure': entry.measure,
-                'target': entry.target,
-                'actual': entry.actual,
-                'owner': entry.owner,
-                'date': entry.date,
-                'status': status,
-                'model_type': type(entry).__name__,
-                'pk': entry.pk,
-            })
-        bsc_batches.append({
-            'batch_id': batch_id,
-            'batch_name': batch_name or f'Batch {batch_id}',
-            'upload_time': batch_times[batch_id],
-            'entries': entries
-        })
+    is_admin = request.bsc_role == 'admin'
+    is_employee = request.bsc_role == 'employee'
+    organization = request.bsc_org
 
-    if is_admin and request.method == 'POST' and 'data_file' in request.FILES:
+    if is_admin and request.method == 'POST' and request.upload_error:
+        # Refused by LimitedUploadHandler while the file was streaming in
+        if is_ajax(request):
+            return JsonResponse({'error': request.upload_error}, status=400)
+        messages.error(request, request.upload_error)
+    elif is_admin and request.method == 'POST' and 'data_file' in request.FILES:
         data_file = request.FILES['data_file']
         file_name = data_file.name
-        if not (file_name.endswith('.csv') or file_name.endswith('.xlsx') or file_name.endswith('.xls')):
-            messages.error(request, 'Invalid file type. Please upload a CSV or Excel file.')
+        error = None
+        if not file_name.endswith(ALLOWED_EXTENSIONS):
+            error = 'Invalid file type. Please upload a CSV or Excel file.'
         else:
             try:
-                if file_name.endswith('.csv'):
-                    df = pd.read_csv(data_file)
+                merge_batch_id = request.POST.get('merge_batch_id')
+                # Same bytes as an earlier upload: answered from the ledger without parsing
+                file_hash = None if merge_batch_id else dedup.file_digest(data_file)
+                duplicate = dedup.find_duplicate(organization, file_hash=file_hash) if file_hash else None
+                df = read_dataframe(data_file, file_name) if duplicate is None else None
+                created = True
+                if merge_batch_id:
+                    # Upsert into an existing batch instead of creating a new one
+                    diff = merge_dataframe(df, organization, merge_batch_id, delete_missing=request.POST.get('delete_missing') == 'on')
+                    new_batch_id = merge_batch_id
+                    publish_change(organization, 'batch_updated', new_batch_id)
+                    message = (
+                        f"Batch {new_batch_id} merged: {diff['inserted']} added, {diff['updated']} updated, "
+                        f"{diff['unchanged']} unchanged, {diff['deleted']} deleted"
+                        + (f", {diff['missing']} not in the file kept." if diff['missing'] else '.')
+                    )
                 else:
-                    df = pd.read_excel(data_file)
-                required_columns = {'perspective', 'objective', 'measure', 'target', 'actual'}
-                df.columns = [col.lower() for col in df.columns]
-                if not required_columns.issubset(df.columns):
-                    messages.error(request, f"Missing required columns. Required: {', '.join(required_columns)}")
-                else:
-                    # Generate new batch_id
-                    all_entries = list(FinancialBSC.objects.all()) + list(CustomerBSC.objects.all()) + list(InternalBSC.objects.all()) + list(LearningGrowthBSC.objects.all())
-                    if all_entries:
-                        max_batch = max(all_entries, key=lambda x: int(x.batch_id) if x.batch_id and x.batch_id.isdigit() else 0)
-                        if max_batch.batch_id and max_batch.batch_id.isdigit():
-                            new_batch_id = str(int(max_batch.batch_id) + 1).zfill(3)
-                        else:
-                            new_batch_id = '001'
+                    diff = None
+                    if duplicate is not None:
+                        new_batch_id, created = duplicate.batch_id, False
+                    else:
+                        new_batch_id, created = dedup.ingest_once(df, organization, file_name, file_hash)
+                    if created:
+                        publish_change(organization, 'batch_added', new_batch_id)
+                        message = f'BSC data uploaded and processed successfully! {df.shape[0]} entries added in batch {new_batch_id}.'
                     else:
-                        new_batch_id = '001'
-                    
-                    for _, row in df.iterrows():
-                        perspective = row.get('perspective', '').strip()
-                        objective = row.get('objective', '')
-                        measure = row.get('measure', '')
-                        target = row.get('target', '')
-                        actual = row.get('actual', '')
-                        owner = row.get('owner', '')
-                        date_str = row.get('date', None)
-                        date_obj = None
-                        if date_str and str(date_str).strip():
-                            for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%m/%d/%Y"):
-                                try:
-                                    date_obj = datetime.datetime.strptime(str(date_str).strip(), fmt).date()
-                                    break
-                                except Exception:
-                                    continue
-                        else:
-                            date_obj = None
-                        
-                        # Create entry in the appropriate table based on perspective
-                        if perspective.lower() == 'financial':
-                            FinancialBSC.objects.create(
-                                objective=objective,
-                                measure=measure,
-                                target=target,
-                                actual=actual,
-                                owner=owner,
-                                date=date_obj,
-                                batch_id=new_batch_id,
-                                organization=organization
-                            )
-                        elif perspective.lower() == 'customer':
-                            CustomerBSC.objects.create(
-                                objective=objective,
-                                measure=measure,
-                                target=target,
-                                actual=actual,
-                                owner=owner,
-                                date=date_obj,
-                                batch_id=new_batch_id,
-                                organization=organization
-                            )
-                        elif perspective.lower() == 'internal':
-                            InternalBSC.objects.create(
-                                objective=objective,
-                                measure=measure,
-                                target=target,
-                                actual=actual,
-                                owner=owner,
-                                date=date_obj,
-                                batch_id=new_batch_id,
-                                organization=organization
-                            )
-                        elif perspective.lower() == 'learning & growth':
-                            LearningGrowthBSC.objects.create(
-                                objective=objective,
-                                measure=measure,
-                                target=target,
-                                actual=actual,
-                                owner=owner,
-                                date=date_obj,
-                                batch_id=new_batch_id,
-                                organization=organization
-                            )
-                    
-                    messages.success(request, f'BSC data uploaded and processed successfully! {df.shape[0]} entries added in batch {new_batch_id}.')
-                    return redirect('dashboard')
+                        message = f'This data was already uploaded as batch {new_batch_id}; nothing was added.'
+                if is_ajax(request):
+                    return JsonResponse({
+                        'success': True, 'message': message, 'batch_id': new_batch_id, 'diff': diff, 'duplicate': not created,
+                    })
+                messages.success(request, message)
+                return redirect('dashboard')
+            except UploadError as e:
+                error = str(e)
             except Exception as e:
-                messages.error(request, f'Error processing file: {str(e)}')
+                error = f'Error processing file: {str(e)}'
+        if is_ajax(request):
+            return JsonResponse({'error': error}, status=400)
+        messages.error(request, error)
 
     return render(request, 'dashboard.html', {
         'user': user,
         'is_admin': is_admin,
         'is_employee': is_employee,
         'organization': organization,
-        'bsc_batches': bsc_batches,
+        'bsc_batches': build_batches(organization),
+        'archived_batches': ArchivedBatch.objects.filter(organization=organization).order_by('-batch_id') if organization else [],
     })
 
 
+def explorer_params(request):
+    """explore() keyword arguments from the query string"""
+    try:
+        per_page = int(request.GET.get('per_page', explorer.PER_PAGE))
+    except ValueError:
+        raise ExplorerError('per_page must be an integer')
+    return {
+        'perspective': request.GET.get('perspective') or None,
+        'batch_id': request.GET.get('batch_id') or None,
+        'owner': request.GET.get('owner') or None,
+        'status': request.GET.get('status') or None,
+        'sort': request.GET.get('sort') or None,
+        'cursor': request.GET.get('cursor') or None,
+        'per_page': per_page,
+    }
+
+
 @login_required
+@employee_required(message='Your role is not assigned. Please contact your administrator.')
+@replica_reads
 def bsc_detailed_view(request):
-    bsc_entries = BSCEntry.objects.all()
-    return render(request, 'bsc_detailed.html', {'bsc_entries': bsc_entries})
+    """All entries of the organization, filtered, sorted and paginated on the server"""
+    try:
+        params = explorer_params(request)
+        page = explorer.explore(request.bsc_org, **params)
+    except ExplorerError as e:
+        messages.error(request, str(e))
+        return redirect('bsc_detailed')
+    return render(request, 'bsc_detailed.html', {
+        'page': page,
+        'params': params,
+        'perspectives': list(PERSPECTIVE_MODELS),
+        'statuses': STATUSES,
+        'sorts': list(explorer.SORTS),
+        'batches': explorer.organization_batches(request.bsc_org),
+    })
 
 
 # Data Management Functions
 @login_required
 @require_POST
+@admin_required(message='You do not have permission to delete BSC data.')
 def delete_bsc_data(request):
     user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-    except UserProfile.DoesNotExist:
-        is_admin = False
-    
-    if not is_admin:
-        messages.error(request, 'You do not have permission to delete BSC data.')
-        return redirect('dashboard')
-    
+    organization = request.bsc_org
+
     # Get the password from the form
     password = request.POST.get('admin_password')
     
@@ -316,114 +238,194 @@ def delete_bsc_data(request):
         messages.error(request, 'Password does not match. Please try again.')
         return redirect('dashboard')
     
-    # If password is correct, delete all BSC data from all perspective tables
-    deleted_financial = FinancialBSC.objects.all().delete()[0]
-    deleted_customer = CustomerBSC.objects.all().delete()[0]
-    deleted_internal = InternalBSC.objects.all().delete()[0]
-    deleted_learning = LearningGrowthBSC.objects.all().delete()[0]
+    # If password is correct, delete all of the organization's BSC data from all perspective tables
+    deleted_financial = FinancialBSC.objects.filter(organization=organization).delete()[0]
+    deleted_customer = CustomerBSC.objects.filter(organization=organization).delete()[0]
+    deleted_internal = InternalBSC.objects.filter(organization=organization).delete()[0]
+    deleted_learning = LearningGrowthBSC.objects.filter(organization=organization).delete()[0]
     
     total_deleted = deleted_financial + deleted_customer + deleted_internal + deleted_learning
+    total_deleted += archive.forget_organization(organization)
+    rollup.forget_organization(organization)
+    dedup.forget_organization(organization)
+    publish_change(organization, 'data_cleared')
     messages.success(request, f'All BSC data has been deleted successfully. {total_deleted} entries removed.')
     return redirect('dashboard')
 
 @login_required
 @require_POST
+@admin_required(message='You do not have permission to delete BSC data.')
 def delete_batch(request, batch_id):
-    user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-    except UserProfile.DoesNotExist:
-        is_admin = False
-    
-    if is_admin:
-        # Delete all entries with the specified batch_id from all perspective tables
-        deleted_financial = FinancialBSC.objects.filter(batch_id=batch_id).delete()[0]
-        deleted_customer = CustomerBSC.objects.filter(batch_id=batch_id).delete()[0]
-        deleted_internal = InternalBSC.objects.filter(batch_id=batch_id).delete()[0]
-        deleted_learning = LearningGrowthBSC.objects.filter(batch_id=batch_id).delete()[0]
-        
-        total_deleted = deleted_financial + deleted_customer + deleted_internal + deleted_learning
-        
-        if total_deleted > 0:
-            messages.success(request, f'Batch {batch_id} has been deleted successfully. {total_deleted} entries removed.')
-        else:
-            messages.error(request, f'Batch {batch_id} not found.')
+    organization = request.bsc_org
+
+    # Delete all entries with the specified batch_id from all perspective tables
+    deleted_financial = FinancialBSC.objects.filter(batch_id=batch_id, organization=organization).delete()[0]
+    deleted_customer = CustomerBSC.objects.filter(batch_id=batch_id, organization=organization).delete()[0]
+    deleted_internal = InternalBSC.objects.filter(batch_id=batch_id, organization=organization).delete()[0]
+    deleted_learning = LearningGrowthBSC.objects.filter(batch_id=batch_id, organization=organization).delete()[0]
+
+    total_deleted = deleted_financial + deleted_customer + deleted_internal + deleted_learning
+    total_deleted += archive.forget_batch(organization, batch_id)
+    # Also when nothing was left to delete, so a later batch reusing the id isn't taken for this upload
+    dedup.forget_batch(organization, batch_id)
+
+    if total_deleted > 0:
+        rollup.forget_batch(organization, batch_id)
+        publish_change(organization, 'batch_deleted', batch_id)
+        message = f'Batch {batch_id} has been deleted successfully. {total_deleted} entries removed.'
+        if is_ajax(request):
+            return JsonResponse({'success': True, 'message': message})
+        messages.success(request, message)
     else:
-        messages.error(request, 'You do not have permission to delete BSC data.')
-    
+        if is_ajax(request):
+            return JsonResponse({'error': f'Batch {batch_id} not found.'}, status=404)
+        messages.error(request, f'Batch {batch_id} not found.')
+
     return redirect('dashboard')
 
 @login_required
 @require_POST
 @csrf_exempt
+@admin_required(message='You do not have permission to update BSC data.')
 def update_batch(request, batch_id):
-    user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-    except Exception:
-        is_admin = False
-    if not is_admin:
-        messages.error(request, 'You do not have permission to update BSC data.')
-        return redirect('dashboard')
+    organization = request.bsc_org
 
     # Collect all entries for this batch from all models
-    models = [FinancialBSC, CustomerBSC, InternalBSC, LearningGrowthBSC]
+    fields = ['objective', 'measure', 'target', 'actual', 'owner', 'date']
+    stored_fields = fields + ['target_value', 'actual_value', 'updated_at']
+    if dimensions.enabled():
+        stored_fields += dimensions.REF_FIELDS
     updated_count = 0
-    for model in models:
-        entries = model.objects.filter(batch_id=batch_id)
-        for entry in entries:
-            prefix = f"{model.__name__}_{entry.pk}_"
-            # For each editable field, update if present in POST
-            for field in ['objective', 'measure', 'target', 'actual', 'owner', 'date']:
-                key = f"{prefix}{field}"
-                if key in request.POST:
-                    value = request.POST[key]
-                    if field == 'date' and value == '':
-                        value = None
-                    setattr(entry, field, value)
-            entry.save()
-            updated_count += 1
-    messages.success(request, f'Batch {batch_id} updated successfully. {updated_count} entries updated.')
+    now = timezone.now()
+    dimension_cache = None
+    with transaction.atomic():
+        for perspective, model in PERSPECTIVE_MODELS.items():
+            entries = list(model.objects.filter(batch_id=batch_id, organization=organization))
+            for entry in entries:
+                prefix = f"{model.__name__}_{entry.pk}_"
+                # For each editable field, update if present in POST
+                for field in fields:
+                    key = f"{prefix}{field}"
+                    if key in request.POST:
+                        value = request.POST[key]
+                        if field == 'date' and value == '':
+                            value = None
+                        setattr(entry, field, value)
+                entry.parse_values()
+                entry.updated_at = now
+            dimension_cache = dimensions.assign_refs(entries, organization.pk, dimension_cache)
+            # One UPDATE per chunk and one rollup recompute per perspective, instead of a save() per entry
+            model.objects.bulk_update(entries, stored_fields, batch_size=500)
+            updated_count += len(entries)
+        rollup.recompute(organization, batch_id)
+        dedup.forget_batch(organization, batch_id)
+    publish_change(organization, 'batch_updated', batch_id)
+    message = f'Batch {batch_id} updated successfully. {updated_count} entries updated.'
+    if is_ajax(request):
+        return JsonResponse({'success': True, 'message': message})
+    messages.success(request, message)
     return redirect('dashboard')
 
 @login_required
 @require_POST
+@admin_required(json_error='Only admins can rename batches')
 def rename_batch(request, batch_id):
     """Rename a batch - only admins can do this"""
-    user = request.user
-    try:
-        profile = user.userprofile
-        if profile.role != 'admin':
-            return JsonResponse({'error': 'Only admins can rename batches'}, status=403)
-    except UserProfile.DoesNotExist:
-        return JsonResponse({'error': 'User profile not found'}, status=403)
-    
     new_name = request.POST.get('batch_name', '').strip()
     if not new_name:
         return JsonResponse({'error': 'Batch name cannot be empty'}, status=400)
     
     # Update all entries with this batch_id across all BSC tables
-    organization = profile.organization
+    organization = request.bsc_org
     FinancialBSC.objects.filter(batch_id=batch_id, organization=organization).update(batch_name=new_name)
     CustomerBSC.objects.filter(batch_id=batch_id, organization=organization).update(batch_name=new_name)
     InternalBSC.objects.filter(batch_id=batch_id, organization=organization).update(batch_name=new_name)
     LearningGrowthBSC.objects.filter(batch_id=batch_id, organization=organization).update(batch_name=new_name)
-    
+    ArchivedBatch.objects.filter(batch_id=batch_id, organization=organization).update(batch_name=new_name)
+    publish_change(organization, 'batch_renamed', batch_id, batch_name=new_name)
+
     return JsonResponse({'success': True, 'new_name': new_name})
 
+
+@login_required
+@require_POST
+@admin_required(json_error='Only admins can upload BSC data')
+@limited_uploads(max_request_bytes=settings.BSC_BULK_UPLOAD_MAX_BYTES)
+def bulk_upload(request):
+    """Several files or ZIP archives at once, each file its own batch or (merge=on) all in one"""
+    organization = request.bsc_org
+    if request.upload_error:
+        return JsonResponse({'error': request.upload_error}, status=400)
+    try:
+        results = bulk_ingest(request.FILES.getlist('data_files'), organization, merge=request.POST.get('merge') == 'on')
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    batch_ids = sorted({result['batch_id'] for result in results if result['success']})
+    for batch_id in sorted({result['batch_id'] for result in results if result['success'] and not result['duplicate']}):
+        publish_change(organization, 'batch_added', batch_id)
+    failed = sum(not result['success'] for result in results)
+    duplicates = sum(result['success'] and result['duplicate'] for result in results)
+    message = f'{len(results) - failed} of {len(results)} files uploaded into {len(batch_ids)} batch(es).'
+    if duplicates:
+        message += f' {duplicates} already uploaded before, not added again.'
+    if failed:
+        message += ' Failed: ' + '; '.join(f"{result['file']}: {result['error']}" for result in results if not result['success'])
+    return JsonResponse({'success': bool(batch_ids), 'message': message, 'batch_ids': batch_ids, 'files': results})
+
+
+@login_required
+@require_POST
+@admin_required(json_error='Only admins can restore batches')
+def restore_batch(request, batch_id):
+    """Move an archived batch back into the live tables"""
+    organization = request.bsc_org
+    try:
+        restored = archive.restore_batch(organization, batch_id)
+    except ArchiveError as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    if restored is None:
+        return JsonResponse({'error': f'Batch {batch_id} is not archived.'}, status=404)
+    publish_change(organization, 'batch_added', batch_id)
+    message = f'Batch {batch_id} restored from the archive. {restored} entries.'
+    if is_ajax(request):
+        return JsonResponse({'success': True, 'message': message, 'batch_id': batch_id})
+    messages.success(request, message)
+    return redirect('dashboard')
+
+
+@login_required
+@employee_required(message='Your role is not assigned. Please contact your administrator.')
+def batch_card(request, batch_id):
+    """One batch rendered the way the dashboard lists it, for live updates"""
+    batches = build_batches(request.bsc_org, batch_id)
+    if not batches:
+        raise Http404("Batch not found")
+    return render(request, 'batch_card.html', {
+        'batch': batches[0],
+        'is_admin': request.bsc_role == 'admin',
+    })
+
+
+@login_required
+@employee_required(json_error='No organization', status=400)
+def event_stream(request):
+    """Server-Sent Events stream of batch changes in the user's organization"""
+    if isinstance(request, ASGIRequest):
+        content = astream_events(request.bsc_org.pk)
+    else:
+        content = stream_events(request.bsc_org.pk)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # User Profile Management
 @login_required
 def profile_view(request):
     user = request.user
-    try:
-        profile = user.userprofile
-        organization = profile.organization
-        role = profile.role
-    except UserProfile.DoesNotExist:
-        organization = None
-        role = None
+    organization = request.bsc_org
+    role = request.bsc_role
 
     # Check if there's any BSC data to delete
     has_bsc_data = False
@@ -511,20 +513,10 @@ def profile_view(request):
     })
 
 @login_required
+@admin_required(message='You do not have permission to add viewers.')
 def add_viewer(request):
     user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-        organization = profile.organization
-    except UserProfile.DoesNotExist:
-        is_admin = False
-        organization = None
-
-    # Only admins can add viewers
-    if not is_admin:
-        messages.error(request, 'You do not have permission to add viewers.')
-        return redirect('dashboard')
+    organization = request.bsc_org
 
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -581,30 +573,20 @@ def add_viewer(request):
         'organization': organization,
         'viewer_count': viewer_count,
         'viewers': viewers,
-        'is_admin': profile.role == 'admin' if 'profile' in locals() and profile else False,
-        'is_employee': profile.role == 'employee' if 'profile' in locals() and profile else False,
+        'is_admin': request.bsc_role == 'admin',
+        'is_employee': request.bsc_role == 'employee',
     })
 
 @login_required
 @require_POST
+@admin_required(message='You do not have permission to delete viewers.', redirect_to='add_viewer')
 def delete_viewer(request, viewer_id):
     user = request.user
-    try:
-        profile = user.userprofile
-        is_admin = profile.role == 'admin'
-        organization = profile.organization
-    except UserProfile.DoesNotExist:
-        is_admin = False
-        organization = None
-
-    # Only admins can delete viewers
-    if not is_admin:
-        messages.error(request, 'You do not have permission to delete viewers.')
-        return redirect('add_viewer')
+    organization = request.bsc_org
 
     try:
         # Get the viewer profile to delete
-        viewer_profile = UserProfile.objects.get(
+        viewer_profile = UserProfile.objects.select_related('user').get(
             id=viewer_id,
             organization=organization,
             role='employee'
@@ -633,157 +615,354 @@ def delete_viewer(request, viewer_id):
 # API and Data Functions
 
 @login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
 def bsc_data_api(request):
-    user = request.user
-    try:
-        organization = user.userprofile.organization
-    except UserProfile.DoesNotExist:
-        return JsonResponse({'error': 'No organization'}, status=400)
-    
-    # Get data from all perspective tables, filtered by organization
-    financial_entries = FinancialBSC.objects.filter(organization=organization)
-    customer_entries = CustomerBSC.objects.filter(organization=organization)
-    internal_entries = InternalBSC.objects.filter(organization=organization)
-    learning_entries = LearningGrowthBSC.objects.filter(organization=organization)
-    
-    data = []
-    
-    # Add financial entries
-    for e in financial_entries:
-        data.append({
-            'perspective': 'Financial',
-            'objective': e.objective,
-            'measure': e.measure,
-            'target': e.target,
-            'actual': e.actual,
-            'owner': e.owner,
-            'date': e.date.strftime('%Y-%m-%d') if e.date else ''
-        })
-    
-    # Add customer entries
-    for e in customer_entries:
-        data.append({
-            'perspective': 'Customer',
-            'objective': e.objective,
-            'measure': e.measure,
-            'target': e.target,
-            'actual': e.actual,
-            'owner': e.owner,
-            'date': e.date.strftime('%Y-%m-%d') if e.date else ''
-        })
-    
-    # Add internal entries
-    for e in internal_entries:
-        data.append({
-            'perspective': 'Internal',
-            'objective': e.objective,
-            'measure': e.measure,
-            'target': e.target,
-            'actual': e.actual,
-            'owner': e.owner,
-            'date': e.date.strftime('%Y-%m-%d') if e.date else ''
-        })
-    
-    # Add learning & growth entries
-    for e in learning_entries:
-        data.append({
-            'perspective': 'Learning & Growth',
-            'objective': e.objective,
-            'measure': e.measure,
-            'target': e.target,
-            'actual': e.actual,
-            'owner': e.owner,
-            'date': e.date.strftime('%Y-%m-%d') if e.date else ''
-        })
-    
-    return JsonResponse({'entries': data})
+    # Archived batches are read from their files, only when asked for
+    rows = iter_rows(request.bsc_org, archived=request.GET.get('include_archived') == '1')
+    return JsonResponse({'entries': [row_dict(row) for _, _, _, row in rows]})
 
 @require_GET
 @login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
 def batch_details_api(request):
     batch_id = request.GET.get('batch_id')
     if not batch_id:
         return JsonResponse({'error': 'batch_id is required'}, status=400)
 
-    # Aggregate from all new models
-    model_map = {
-        'Financial': FinancialBSC,
-        'Customer': CustomerBSC,
-        'Internal': InternalBSC,
-        'Learning & Growth': LearningGrowthBSC,
-    }
-    perspectives = ['Financial', 'Customer', 'Internal', 'Learning & Growth']
-    perspective_data = {}
-
-    for perspective in perspectives:
-        model = model_map[perspective]
-        entries = model.objects.filter(batch_id=batch_id)
-        status_counts = {'blue': 0, 'good': 0, 'moderate': 0, 'bad': 0, 'unknown': 0}
-        for entry in entries:
+    return JsonResponse({
+        'perspective_data': status_counts(request.bsc_org, batch_id),
+    })
+
+@login_required(login_url='login')
+@user_passes_test(lambda u: u.is_staff, login_url='login')
+def perf_metrics(request):
+    """Per-view request histograms in the Prometheus text format - staff only"""
+    return HttpResponse(perf_registry.prometheus_text(), content_type='text/plain; version=0.0.4')
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+def trends_api(request):
+    """Per-measure deltas, attainment and rolling attainment across the organization's batches, archived ones excepted"""
+    try:
+        last = int(request.GET['last']) if request.GET.get('last') else None
+    except ValueError:
+        return JsonResponse({'error': 'last must be an integer'}, status=400)
+    filters = {column: request.GET.get(column) for column in TREND_KEY}
+    return JsonResponse({
+        'series': trend_series(request.bsc_org, filters, last),
+        'archived_batches': archived_trend_batches(request.bsc_org),
+    })
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+def scores_api(request):
+    """Weighted attainment scores of the organization, per perspective and per batch (optionally one batch_id)"""
+    return JsonResponse(rollup.scorecard(request.bsc_org, request.GET.get('batch_id') or None))
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+def pivot_api(request):
+    """
+    Cross-tab of the organization's entries: ?rows=perspective,owner&columns=month&aggregate=avg_attainment,
+    optionally filtered by perspective, batch_id, measure and owner. Cached until the organization's data changes.
+    """
+    dimensions = lambda name: [part.strip() for part in request.GET.get(name, '').split(',') if part.strip()]
+    try:
+        result = pivot(
+            request.bsc_org, dimensions('rows'), dimensions('columns'), request.GET.get('aggregate') or 'count',
+            {name: request.GET.get(name) for name in PIVOT_FILTERS},
+        )
+    except PivotError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
+
+@login_required
+@employee_required(json_error='No organization', status=400)
+def thresholds_api(request):
+    """
+    GET: the organization's status threshold policies; one with a blank measure covers all other measures.
+    POST (admins): create or replace the policy of ``measure``. DELETE (admins): ?measure= back to the defaults.
+    Either way the stored statuses are re-evaluated in bulk before responding.
+    """
+    organization = request.bsc_org
+    if request.method in ('POST', 'DELETE'):
+        if request.bsc_role != 'admin':
+            return JsonResponse({'error': 'Only admins can change thresholds'}, status=403)
+        policy = None
+        if request.method == 'POST':
+            measure = request.POST.get('measure', '').strip()
+            direction = request.POST.get('direction') or 'higher'
+            if direction not in dict(ThresholdPolicy.DIRECTION_CHOICES):
+                return JsonResponse({'error': 'direction must be higher or lower'}, status=400)
+            bands = thresholds.LOWER_BANDS if direction == 'lower' else thresholds.DEFAULT_BANDS
             try:
-                actual_val = float(entry.actual)
-                target_val = float(entry.target)
-                if actual_val >= 1.2 * target_val:
-                    status = 'blue'
-                elif actual_val >= target_val:
-                    status = 'good'
-                elif actual_val >= 0.8 * target_val:
-                    status = 'moderate'
-                else:
-                    status = 'bad'
-            except (ValueError, TypeError):
-                status = 'unknown'
-            status_counts[status] += 1
-        perspective_data[perspective] = status_counts
+                cut_offs = {name: float(request.POST.get(name) or getattr(bands, name)) for name in ('blue_at', 'good_at', 'moderate_at')}
+            except ValueError:
+                return JsonResponse({'error': 'blue_at, good_at and moderate_at must be numbers'}, status=400)
+            policy = (
+                ThresholdPolicy.objects.filter(organization=organization, measure=measure).first()
+                or ThresholdPolicy(organization=organization, measure=measure)
+            )
+            policy.direction = direction
+            for name, value in cut_offs.items():
+                setattr(policy, name, value)
+            try:
+                policy.full_clean()
+            except ValidationError as e:
+                return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+        else:
+            measure = request.GET.get('measure', '').strip()
+        with transaction.atomic():
+            if policy is not None:
+                policy.save()
+            elif not ThresholdPolicy.objects.filter(organization=organization, measure=measure).delete()[0]:
+                return JsonResponse({'error': 'No policy for that measure'}, status=404)
+            changed = thresholds.reevaluate(organization, measure or None)
+            publish_change(organization, 'thresholds_changed')
+        return JsonResponse({
+            'success': True,
+            'policy': thresholds.policy_dict(policy) if policy is not None else None,
+            'reevaluated': changed,
+        })
 
     return JsonResponse({
-        'perspective_data': perspective_data,
+        'default': thresholds.DEFAULT_BANDS._asdict(),
+        'policies': [thresholds.policy_dict(policy) for policy in ThresholdPolicy.objects.filter(organization=organization).order_by('measure')],
     })
 
-# PDF Report Generation
+@require_GET
 @login_required
-def generate_batch_pdf(request, batch_id):
-    user = request.user
+@employee_required(json_error='No organization', status=400)
+def strategy_map_api(request, map_id=None):
+    """
+    Evaluated cause-and-effect graph of a strategy map for one batch (?batch_id=, newest by default).
+
+    Without map_id the organization's default map is served, which links each perspective to the next.
+    """
+    strategy_map = get_object_or_404(StrategyMap, pk=map_id, organization=request.bsc_org) if map_id else None
     try:
-        profile = user.userprofile
-        organization = profile.organization
-    except Exception:
-        raise Http404("User profile not found")
+        graph = evaluated_map(request.bsc_org, strategy_map, request.GET.get('batch_id') or None)
+    except StrategyMapError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    data = serialize_strategy_map(graph, strategy_map)
+    data['maps'] = list(StrategyMap.objects.filter(organization=request.bsc_org).order_by('name').values('id', 'name'))
+    return JsonResponse(data)
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
+def entries_api(request):
+    """
+    One page of the organization's entries: ?perspective=&batch_id=&owner=&status= filters,
+    ?sort=[-]batch|objective|owner|actual|updated, and ?cursor= from the previous page's next_cursor.
+    """
+    try:
+        return JsonResponse(explorer.explore(request.bsc_org, **explorer_params(request)))
+    except ExplorerError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+def search_api(request):
+    """Ranked, paginated search: ?q= terms in objective/measure/owner/batch name, optional owner, perspective, batch_id"""
+    try:
+        page = int(request.GET.get('page', 1))
+        per_page = int(request.GET.get('per_page', 25))
+    except ValueError:
+        return JsonResponse({'error': 'page and per_page must be integers'}, status=400)
+    perspective = request.GET.get('perspective') or None
+    if perspective and perspective not in PERSPECTIVE_MODELS:
+        return JsonResponse({'error': f"perspective must be one of {', '.join(PERSPECTIVE_MODELS)}"}, status=400)
+    result = search_entries(
+        request.bsc_org, request.GET.get('q', ''), owner=request.GET.get('owner') or None,
+        perspective=perspective, batch_id=request.GET.get('batch_id') or None, page=page, per_page=per_page,
+    )
+    return JsonResponse({'query': request.GET.get('q', ''), **result})
 
-    # Gather all entries for this batch and organization
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+@replica_reads
+def export_xlsx(request):
+    """Excel workbook of the organization's entries: ?batch_id= for one batch, ?date_from=/?date_to= (YYYY-MM-DD) on entry dates"""
+    organization = request.bsc_org
+    batch_id = request.GET.get('batch_id') or None
+    dates = {}
+    for key in ('date_from', 'date_to'):
+        value = request.GET.get(key)
+        try:
+            dates[key] = parse_date(value) if value else None
+        except ValueError:  # well formed but invalid, e.g. 2024-02-30
+            dates[key] = None
+        if value and dates[key] is None:
+            return JsonResponse({'error': f'{key} must be a date as YYYY-MM-DD'}, status=400)
+    if batch_id and not dedup.batch_exists(organization, batch_id):
+        raise Http404("Batch not found")
+    out, _ = export.export_file(organization, batch_id, **dates)
+    return FileResponse(
+        out, as_attachment=True, filename=export.export_filename(organization, batch_id, **dates),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+@login_required
+@employee_required(message='Your role is not assigned. Please contact your administrator.')
+def batch_plans(request, batch_id):
+    """A batch's entries with their action plans, the batch's plan status counts and its reviews"""
+    perspectives = plans.batch_entries_with_plans(request.bsc_org, batch_id)
+    entries = [entry for perspective_entries in perspectives.values() for entry in perspective_entries]
+    if not entries:
+        raise Http404("Batch not found")
+    return render(request, 'batch_plans.html', {
+        'batch_id': batch_id,
+        'batch_name': next((entry.batch_name for entry in entries if entry.batch_name), f'Batch {batch_id}'),
+        'perspectives': perspectives,
+        'status_counts': plans.count_statuses(plan for entry in entries for plan in entry.plans),
+        'reviews': plans.organization_reviews(request.bsc_org, batch_id),
+        'is_admin': request.bsc_role == 'admin',
+        'is_employee': request.bsc_role == 'employee',
+    })
+
+@require_GET
+@login_required
+@employee_required(json_error='No organization', status=400)
+def batch_plans_api(request, batch_id):
+    """Same data as batch_plans; each plan is listed once and entries refer to plans by id"""
+    perspectives = plans.batch_entries_with_plans(request.bsc_org, batch_id)
+    batch_plans_by_id = {}
     entries = []
-    perspectives = ['Financial', 'Customer', 'Internal', 'Learning & Growth']
-    for model, perspective in [
-        (FinancialBSC, 'Financial'),
-        (CustomerBSC, 'Customer'),
-        (InternalBSC, 'Internal'),
-        (LearningGrowthBSC, 'Learning & Growth'),
-    ]:
-        for entry in model.objects.filter(batch_id=batch_id, organization=organization):
+    for perspective, perspective_entries in perspectives.items():
+        for entry in perspective_entries:
+            for plan in entry.plans:
+                batch_plans_by_id.setdefault(plan.pk, plan)
             entries.append({
+                'entry': f'{type(entry).__name__}_{entry.pk}',
                 'perspective': perspective,
                 'objective': entry.objective,
                 'measure': entry.measure,
                 'target': entry.target,
                 'actual': entry.actual,
                 'owner': entry.owner,
-                'date': entry.date,
                 'status': entry.get_status(),
+                'plans': [plan.pk for plan in entry.plans],
             })
     if not entries:
-        raise Http404("Batch not found or no entries for this batch.")
+        return JsonResponse({'error': f'Batch {batch_id} not found.'}, status=404)
+    return JsonResponse({
+        'batch_id': batch_id,
+        'status_counts': plans.count_statuses(batch_plans_by_id.values()),
+        'entries': entries,
+        'plans': [plans.plan_dict(plan) for plan in batch_plans_by_id.values()],
+        'reviews': [plans.review_dict(review) for review in plans.organization_reviews(request.bsc_org, batch_id)],
+    })
+
+@login_required
+@employee_required(json_error='No organization', status=400)
+def action_plans_api(request):
+    """
+    GET: the organization's plans (?status=) with their linked entries, and plan status counts per batch.
+    POST (admins): create a plan; ``entries`` may repeat '<Model>_<pk>' keys to link it to entries.
+    """
+    organization = request.bsc_org
+    if request.method == 'POST':
+        if request.bsc_role != 'admin':
+            return JsonResponse({'error': 'Only admins can create action plans'}, status=403)
+        title = request.POST.get('title', '').strip()
+        assignee = UserProfile.objects.filter(
+            organization=organization, user_id=request.POST.get('assigned_to') or request.user.pk,
+        ).select_related('user').first()
+        try:
+            due_date = datetime.date.fromisoformat(request.POST.get('due_date', ''))
+        except ValueError:
+            return JsonResponse({'error': 'due_date must be YYYY-MM-DD'}, status=400)
+        status = request.POST.get('status') or 'not_started'
+        if not title or assignee is None or status not in plans.PLAN_STATUSES:
+            return JsonResponse({'error': 'title, a valid status and an assignee from your organization are required'}, status=400)
+        with transaction.atomic():
+            plan = ActionPlan.objects.create(
+                organization=organization, title=title, description=request.POST.get('description', ''),
+                assigned_to=assignee.user, created_by=request.user, status=status, due_date=due_date,
+            )
+            plans.link_entries(plan, plans.resolve_entries(organization, request.POST.getlist('entries')))
+        return JsonResponse({'success': True, 'id': plan.pk}, status=201)
+
+    return JsonResponse({
+        'plans': [plans.plan_dict(plan, with_entries=True) for plan in plans.organization_plans(organization, request.GET.get('status'))],
+        'batch_status_counts': plans.plan_status_counts(organization),
+    })
+
+@login_required
+@require_POST
+@employee_required(json_error='No organization', status=400)
+def action_plan_status(request, plan_id):
+    """Move a plan to another status - admins and the plan's assignee"""
+    plan = get_object_or_404(ActionPlan, pk=plan_id, organization=request.bsc_org)
+    if request.bsc_role != 'admin' and plan.assigned_to_id != request.user.pk:
+        return JsonResponse({'error': 'Only admins and the assignee can update this plan'}, status=403)
+    status = request.POST.get('status')
+    if status not in plans.PLAN_STATUSES:
+        return JsonResponse({'error': f"status must be one of {', '.join(plans.PLAN_STATUSES)}"}, status=400)
+    plan.status = status
+    plan.save(update_fields=['status', 'updated_at'])
+    return JsonResponse({'success': True, 'status': status})
 
-    # Group entries by perspective for table and chart
-    grouped = {p: [] for p in perspectives}
-    for e in entries:
-        grouped[e['perspective']].append(e)
+@login_required
+@employee_required(json_error='No organization', status=400)
+def reviews_api(request):
+    """
+    GET: the organization's performance reviews (?batch_id=) and plan status counts of their batches.
+    POST (admins): schedule a review, optionally for a batch_id.
+    """
+    organization = request.bsc_org
+    if request.method == 'POST':
+        if request.bsc_role != 'admin':
+            return JsonResponse({'error': 'Only admins can schedule reviews'}, status=403)
+        title = request.POST.get('title', '').strip()
+        scheduled_date = parse_datetime(request.POST.get('scheduled_date', ''))
+        if not title or scheduled_date is None:
+            return JsonResponse({'error': 'title and scheduled_date (ISO date and time) are required'}, status=400)
+        if timezone.is_naive(scheduled_date):
+            scheduled_date = timezone.make_aware(scheduled_date)
+        review = PerformanceReview.objects.create(
+            organization=organization, title=title, reviewer=request.user, scheduled_date=scheduled_date,
+            description=request.POST.get('description', ''), notes=request.POST.get('notes', ''),
+            batch_id=request.POST.get('batch_id') or None,
+        )
+        return JsonResponse({'success': True, 'id': review.pk}, status=201)
+
+    reviews = plans.organization_reviews(organization, request.GET.get('batch_id'))
+    batch_ids = sorted({review.batch_id for review in reviews if review.batch_id})
+    return JsonResponse({
+        'reviews': [plans.review_dict(review) for review in reviews],
+        'batch_status_counts': plans.plan_status_counts(organization, batch_ids) if batch_ids else {},
+    })
+
+# PDF Report Generation
+@login_required
+@replica_reads
+def generate_batch_pdf(request, batch_id):
+    organization = request.bsc_org
+    if organization is None:
+        raise Http404("User profile not found")
+
+    # Gather all entries for this batch and organization, grouped by perspective for table and chart
+    batch_name, grouped = batch_rows(organization, batch_id)
+    if not any(grouped.values()):
+        raise Http404("Batch not found or no entries for this batch.")
+    perspectives = list(grouped)
 
     # Prepare pie chart data (status counts per perspective)
     pie_data = {}
     for p in perspectives:
         counts = {'blue': 0, 'good': 0, 'moderate': 0, 'bad': 0, 'unknown': 0}
         for e in grouped[p]:
-            counts[e['status']] = counts.get(e['status'], 0) + 1
+            counts[e.status] = counts.get(e.status, 0) + 1
         pie_data[p] = counts
 
     # Generate pie chart images as base64 for each perspective
@@ -830,13 +1009,6 @@ def generate_batch_pdf(request, batch_id):
         img_base64 = base64.b64encode(buf.read()).decode('utf-8')
         pie_chart_images[p] = img_base64
 
-    # Get batch_name from the first entry (if available)
-    batch_name = None
-    for model in [FinancialBSC, CustomerBSC, InternalBSC, LearningGrowthBSC]:
-        entry = model.objects.filter(batch_id=batch_id, organization=organization).first()
-        if entry and getattr(entry, 'batch_name', None):
-            batch_name = entry.batch_name
-            break
     if not batch_name:
         batch_name = f"Batch {batch_id}"
 